@@ -0,0 +1,124 @@
+"""
+Registro append-only de accesos (tabla access_events).
+
+Cada entrada por torniquete es una fila pequeña indexada por
+(card_id, timestamp) en lugar de un elemento más dentro del arreglo
+entry_history de la membresía.
+
+``timestamp`` es siempre hora local sin zona, como ``datetime.now()``: las
+horas con zona que mandan los controladores se convierten antes de llegar
+aquí, y quien lee la tabla descarta el ``+00:00`` que añade TIMESTAMPTZ.
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+ACCESS_EVENTS_TABLE = "access_events"
+
+
+async def record_entry(db, card_id: str, timestamp: Optional[str] = None, entry_type: str = "entry"):
+    """Insertar un evento de acceso sin leer ni reescribir la membresía"""
+    event = {
+        "card_id": card_id,
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "type": entry_type
+    }
+    await db.execute(db.table(ACCESS_EVENTS_TABLE).insert(event, returning=ReturnMethod.minimal))
+    return event
+
+
+async def record_entries(db, events: List[Dict[str, Any]], concurrency: int = 8) -> Set[str]:
+    """Insertar varios eventos con event_id en una sola escritura.
+
+    Los event_id que ya existían se ignoran (reintentos de un controlador), así
+    que devuelve solo los event_id insertados ahora.
+    """
+    if not events:
+        return set()
+
+    def insert(rows):
+        return db.execute(
+            db.table(ACCESS_EVENTS_TABLE).upsert(rows, on_conflict="event_id", ignore_duplicates=True)
+        )
+
+    try:
+        response = await insert(events)
+        return {row["event_id"] for row in response.data or []}
+    except APIError as e:
+        # 23505: a row clashed on (card_id, timestamp) under another event_id;
+        # insert one by one so only that swipe is dropped
+        if e.code != "23505":
+            raise
+    # Bounded so a large replayed batch doesn't take the whole connection
+    # pool away from live check_access calls
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def insert_one(event):
+        async with semaphore:
+            return await insert([event])
+
+    inserted = set()
+    results = await asyncio.gather(*(insert_one(event) for event in events), return_exceptions=True)
+    for result in results:
+        if isinstance(result, APIError) and result.code == "23505":
+            continue
+        if isinstance(result, Exception):
+            raise result
+        inserted.update(row["event_id"] for row in result.data or [])
+    return inserted
+
+
+def migrate_entry_history(client, batch_size: int = 500):
+    """Mover los arreglos entry_history existentes a access_events.
+
+    Usa el cliente síncrono de supabase, como el resto de setup_database.py.
+
+    Es idempotente: los eventos se insertan con on_conflict sobre
+    (card_id, timestamp) y el arreglo se vacía después de copiarlo, así que
+    una migración interrumpida puede volver a ejecutarse sin duplicados.
+    """
+    migrated_members = 0
+    migrated_events = 0
+    last_id = None
+
+    while True:
+        query = (
+            client.table("memberships")
+            .select("id,card_id,entry_history")
+            .order("id")
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        for row in rows:
+            history = row.get("entry_history") or []
+            if not history:
+                continue
+            events = [
+                {
+                    "card_id": row["card_id"],
+                    "timestamp": entry.get("timestamp"),
+                    "type": entry.get("type", "entry")
+                }
+                for entry in history if entry.get("timestamp")
+            ]
+            if events:
+                client.table(ACCESS_EVENTS_TABLE).upsert(
+                    events,
+                    on_conflict="card_id,timestamp",
+                    ignore_duplicates=True,
+                    returning=ReturnMethod.minimal
+                ).execute()
+            client.table("memberships").update({"entry_history": []}).eq("id", row["id"]).execute()
+            migrated_members += 1
+            migrated_events += len(events)
+
+    return {"members": migrated_members, "events": migrated_events}
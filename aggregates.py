@@ -0,0 +1,213 @@
+"""
+Agregados del dashboard mantenidos de forma incremental.
+
+Los endpoints de escritura actualizan contadores en memoria, de modo que
+/metrics lee un snapshot ya calculado en lugar de descargar memberships y
+classes en cada refresco. ``rebuild`` recalcula todo desde las tablas para
+recuperarse de cualquier desviación. La asistencia vive en attendance.py y
+los ingresos en revenue.py. Si una escritura llega mientras se reconstruye,
+la copia nueva se descarta (``writes`` cambió) y se reintenta en la
+siguiente lectura.
+
+Los totales también los mantiene la base de datos: unos triggers sobre
+memberships y classes actualizan ``dashboard_counters`` (ver README), así que
+``rebuild`` lee tres filas y los últimos socios en lugar de recorrer
+memberships. Sin esa tabla se recorre memberships entera.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from postgrest.exceptions import APIError
+
+from fanout import fanout
+from queries import projection
+
+WEEKDAY_LABELS = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+
+COUNTERS = ("total_users", "active_users", "total_classes")
+
+
+class DashboardAggregates:
+    """Contadores del dashboard protegidos por un lock"""
+
+    def __init__(self, recent_size: int = 5):
+        self.recent_size = recent_size
+        # Extra room so a few deletions don't empty the recent list
+        self.recent_capacity = recent_size * 4
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.rebuilt_at: Optional[str] = None
+        # monotonic time of the last rebuild
+        self.refreshed_at = 0.0
+        # Bumped by every write hook; rebuilds compare it before swapping
+        self.writes = 0
+        self.discarded_rebuilds = 0
+        self._reset()
+
+    def _reset(self):
+        self.total_users = 0
+        self.active_users = 0
+        self.total_classes = 0
+        # Sorted ascending by (created_at, id); newest at the end
+        self._recent: List[tuple] = []
+        self.recent_stale = False
+
+    # Bulk load
+    def replace(self, fresh: "DashboardAggregates", version: Optional[int] = None):
+        """Adoptar el estado de una instancia construida aparte (rebuild)"""
+        with self._lock:
+            if self.loaded and version is not None and version != self.writes:
+                # A write landed mid-build and may be missing from it: keep the
+                # current copy, which has it, and retry on the next read
+                self.discarded_rebuilds += 1
+                return
+            for name, value in vars(fresh).items():
+                if name not in ("_lock", "writes", "discarded_rebuilds"):
+                    setattr(self, name, value)
+            self.loaded = True
+            self.rebuilt_at = datetime.now().isoformat()
+            # On a first load that raced a write, load again on the next read
+            self.refreshed_at = time.monotonic() if version in (None, self.writes) else 0.0
+
+    def needs_refresh(self, interval: float) -> bool:
+        return interval > 0 and time.monotonic() - self.refreshed_at >= interval
+
+    def set_recent(self, users: Iterable[Dict[str, Any]]):
+        with self._lock:
+            self._recent = []
+            for user in users:
+                self._push_recent(user)
+            self.recent_stale = False
+
+    # Incremental updates
+    def _add_user(self, user: Dict[str, Any]):
+        self.total_users += 1
+        if user.get("active"):
+            self.active_users += 1
+        self._push_recent(user)
+
+    def _push_recent(self, user: Dict[str, Any]):
+        key = (user.get("created_at") or "", str(user.get("id")), user.get("name"))
+        bisect.insort(self._recent, key)
+        if len(self._recent) > self.recent_capacity:
+            del self._recent[0]
+
+    def user_created(self, user: Dict[str, Any]):
+        with self._lock:
+            self.writes += 1
+            if self.loaded:
+                self._add_user(user)
+
+    def user_updated(self, was_active: bool, user: Dict[str, Any]):
+        with self._lock:
+            self.writes += 1
+            if self.loaded and "active" in user and bool(user["active"]) != bool(was_active):
+                self.active_users += 1 if user["active"] else -1
+
+    def user_deleted(self, user: Dict[str, Any]):
+        with self._lock:
+            self.writes += 1
+            if not self.loaded:
+                return
+            self.total_users -= 1
+            if user.get("active"):
+                self.active_users -= 1
+            before = len(self._recent)
+            self._recent = [r for r in self._recent if r[1] != str(user.get("id"))]
+            if len(self._recent) < before and len(self._recent) < min(self.recent_size, self.total_users):
+                self.recent_stale = True
+
+    def class_created(self):
+        with self._lock:
+            self.writes += 1
+            if self.loaded:
+                self.total_classes += 1
+
+    # Reads
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = self._recent[-self.recent_size:][::-1]
+            return {
+                "total_users": self.total_users,
+                "active_users": self.active_users,
+                "inactive_users": self.total_users - self.active_users,
+                "total_classes": self.total_classes,
+                "recent_users": [
+                    {"id": user_id, "name": name, "created_at": created_at}
+                    for created_at, user_id, name in recent
+                ],
+                "rebuilt_at": self.rebuilt_at
+            }
+
+
+async def scan(db, table: str, select: str, page_size: int = 1000, key: str = "id",
+               after: Any = None, where: Optional[Callable] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Recorrer una tabla por páginas ordenadas por ``key``, desde ``after`` si se indica"""
+    last = after
+    while True:
+        query = db.table(table).select(select).order(key).limit(page_size)
+        if where is not None:
+            query = where(query)
+        if last is not None:
+            query = query.gt(key, last)
+        rows = (await db.execute(query)).data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            break
+        last = rows[-1][key]
+
+
+async def load_counters(db, fresh: DashboardAggregates) -> bool:
+    """Totales de dashboard_counters y últimos socios; False si no hay contadores"""
+    try:
+        response = await db.execute(db.table("dashboard_counters").select("name,value").in_("name", COUNTERS))
+    except APIError as e:
+        # 42P01/PGRST205: the table isn't installed (see README)
+        if e.code not in ("42P01", "PGRST205"):
+            raise
+        return False
+    counters = {row["name"]: row["value"] for row in response.data or []}
+    if set(counters) != set(COUNTERS):
+        return False
+    recent = await db.execute(
+        db.table("memberships")
+        .select(projection("recent.memberships"))
+        .order("created_at", desc=True)
+        .limit(fresh.recent_capacity)
+    )
+    for name in COUNTERS:
+        setattr(fresh, name, counters[name])
+    for user in recent.data or []:
+        fresh._push_recent(user)
+    return True
+
+
+async def rebuild(db, aggregates: DashboardAggregates):
+    """Recalcular los agregados a partir de las tablas de origen"""
+    # Build into a fresh instance so writers are only blocked for the swap
+    fresh = DashboardAggregates(aggregates.recent_size)
+    version = aggregates.writes
+    if await load_counters(db, fresh):
+        aggregates.replace(fresh, version)
+        return aggregates.snapshot()
+
+    async def load_memberships():
+        async for page in scan(db, "memberships", projection("aggregates.memberships")):
+            for user in page:
+                fresh._add_user(user)
+
+    async def load_classes():
+        classes = await db.execute(db.table("classes").select("id", count="exact", head=True))
+        fresh.total_classes = classes.count or 0
+
+    # The tables are independent; a partial rebuild is never swapped in
+    (await fanout({
+        "memberships": load_memberships(),
+        "classes": load_classes()
+    })).check()
+    aggregates.replace(fresh, version)
+    return aggregates.snapshot()
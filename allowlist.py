@@ -0,0 +1,151 @@
+"""
+Lista de tarjetas válidas para decidir el acceso sin base de datos.
+
+Los controladores descargan un snapshot completo y después solo los cambios
+desde la versión que tienen, así deciden localmente y se sincronizan en
+segundo plano. El backend también la usa como respaldo de ``check_access``
+cuando Supabase no responde.
+
+Las versiones son un contador del proceso con un identificador de
+generación: si el cliente pide cambios de otra generación (reinicio, otro
+worker) o de una versión que ya salió del diario, recibe un snapshot completo.
+"""
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from aggregates import scan
+from queries import projection
+
+FIELDS = ("card_id", "active", "expiration_date")
+
+
+def _entry(member: Dict[str, Any]) -> Optional[tuple]:
+    # Inactive members are simply absent from the list
+    if not member.get("active"):
+        return None
+    return member["card_id"], True, member.get("expiration_date")
+
+
+class AllowList:
+    """Tarjetas activas más un diario acotado de cambios por versión"""
+
+    def __init__(self, is_valid: Callable[[Dict[str, Any], datetime], bool], journal_size: int = 10000):
+        self.is_valid = is_valid
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.loaded_at: Optional[datetime] = None
+        self.generation = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._cards: Dict[str, tuple] = {}
+        # (version, card_id, entry or None when the card was removed)
+        self._journal: deque = deque(maxlen=journal_size)
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def _set(self, card_id: str, entry: Optional[tuple]):
+        if self._cards.get(card_id) == entry:
+            return
+        if entry is None:
+            del self._cards[card_id]
+        else:
+            self._cards[card_id] = entry
+        self.version += 1
+        self._journal.append((self.version, card_id, entry))
+
+    def replace(self, members: List[Dict[str, Any]]):
+        """Cargar desde la tabla; en recargas solo los cambios generan versiones"""
+        fresh = {}
+        for member in members:
+            entry = _entry(member)
+            if entry is not None:
+                fresh[entry[0]] = entry
+        with self._lock:
+            if not self.loaded:
+                self._cards = fresh
+                self.version += 1
+                self.loaded = True
+            else:
+                for card_id in [c for c in self._cards if c not in fresh]:
+                    self._set(card_id, None)
+                for card_id, entry in fresh.items():
+                    self._set(card_id, entry)
+            self.loaded_at = datetime.now()
+
+    # Write-path hooks
+    def upsert(self, member: Dict[str, Any]):
+        with self._lock:
+            if self.loaded:
+                self._set(member["card_id"], _entry(member))
+
+    def remove(self, card_id: str):
+        with self._lock:
+            if self.loaded:
+                self._set(card_id, None)
+
+    # Reads
+    def get(self, card_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._cards.get(card_id)
+        return dict(zip(FIELDS, entry)) if entry else None
+
+    def snapshot(self, at: datetime) -> Dict[str, Any]:
+        with self._lock:
+            cards = list(self._cards.values())
+            version = self.version
+        return {
+            "generation": self.generation,
+            "version": version,
+            "full": True,
+            "fields": list(FIELDS),
+            # Already expired cards can't become valid without a write
+            "cards": [list(entry) for entry in cards if self.is_valid(dict(zip(FIELDS, entry)), at)],
+            "removed": []
+        }
+
+    def changes(self, since: int, generation: Optional[str], at: datetime) -> Dict[str, Any]:
+        """Cambios posteriores a ``since``, o un snapshot si el diario no los cubre"""
+        with self._lock:
+            version = self.version
+            covered = (
+                generation == self.generation and since <= version
+                and (since == version or (self._journal and self._journal[0][0] <= since + 1))
+            )
+            if covered:
+                latest: Dict[str, Optional[tuple]] = {}
+                for entry_version, card_id, entry in reversed(self._journal):
+                    if entry_version <= since:
+                        break
+                    latest.setdefault(card_id, entry)
+        if not covered:
+            return self.snapshot(at)
+        return {
+            "generation": self.generation,
+            "version": version,
+            "since": since,
+            "full": False,
+            "fields": list(FIELDS),
+            "cards": [list(entry) for entry in latest.values() if entry is not None],
+            "removed": sorted(card_id for card_id, entry in latest.items() if entry is None)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "generation": self.generation,
+            "version": self.version,
+            "cards": len(self._cards),
+            "journal": len(self._journal)
+        }
+
+
+async def rebuild(db, allow_list: AllowList):
+    """Recargar las tarjetas activas desde memberships"""
+    members = []
+    async for page in scan(db, "memberships", projection("allowlist.memberships")):
+        members.extend(page)
+    allow_list.replace(members)
+    return allow_list
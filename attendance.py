@@ -0,0 +1,250 @@
+"""
+Serie temporal de asistencia alimentada por check_access.
+
+Cada entrada incrementa un bucket horario, uno diario y uno mensual. Los
+buckets horarios se descartan pasada su retención (quedan resumidos en los
+diarios) y los diarios pasan a vivir solo en los mensuales, así que las
+consultas por rango recorren buckets y nunca las entradas crudas.
+
+Los buckets viven en la base de datos: un trigger sobre ``access_events``
+incrementa ``attendance_hourly``, ``attendance_daily`` y
+``attendance_monthly`` en cada inserción (ver README). ``rebuild`` lee esas
+tablas, unos cientos de filas, y solo las entradas de la última visita para
+la ocupación. Sin esas tablas recorre ``access_events`` entero.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from postgrest.exceptions import APIError
+
+from aggregates import scan
+from queries import projection
+
+ROLLUP_TABLES = {"hour": "attendance_hourly", "day": "attendance_daily", "month": "attendance_monthly"}
+
+Timestamp = Union[str, datetime]
+
+
+def _as_datetime(timestamp: Timestamp) -> Optional[datetime]:
+    """Hora local sin zona, la misma que escriben record_entry y record_entries"""
+    if not isinstance(timestamp, datetime):
+        try:
+            timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return None
+    # access_events holds naive local times; TIMESTAMPTZ stores them as if
+    # they were UTC and returns them with +00:00, so the offset is dropped,
+    # not converted. Zoned controller times are converted before insert.
+    return timestamp.replace(tzinfo=None)
+
+
+def _hour_key(moment: datetime) -> int:
+    return moment.toordinal() * 24 + moment.hour
+
+
+class AttendanceSeries:
+    """Buckets de asistencia por hora, día y mes"""
+
+    def __init__(self, hourly_retention_days: int = 35, daily_retention_days: int = 400,
+                 visit_minutes: int = 90):
+        self.hourly_retention_days = hourly_retention_days
+        self.daily_retention_days = daily_retention_days
+        self.visit = timedelta(minutes=visit_minutes)
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.refreshed_at = 0.0
+        # Bumped by record(); rebuild compares it before swapping
+        self.writes = 0
+        self.discarded_rebuilds = 0
+        self._reset()
+
+    def _reset(self):
+        self._hourly: Dict[int, int] = defaultdict(int)
+        self._daily: Dict[int, int] = defaultdict(int)
+        self._monthly: Dict[str, int] = defaultdict(int)
+        # Sorted: replayed batches arrive after newer live swipes
+        self._recent_entries: List[datetime] = []
+        self._compacted_hour = 0
+
+    def _add(self, moment: datetime):
+        self._hourly[_hour_key(moment)] += 1
+        self._daily[moment.toordinal()] += 1
+        self._monthly[moment.strftime("%Y-%m")] += 1
+        if moment > datetime.now() - self.visit:
+            bisect.insort(self._recent_entries, moment)
+
+    def _compact(self, now: datetime):
+        hour = _hour_key(now)
+        if hour == self._compacted_hour:
+            return
+        self._compacted_hour = hour
+        hourly_cutoff = _hour_key(now - timedelta(days=self.hourly_retention_days))
+        for key in [k for k in self._hourly if k < hourly_cutoff]:
+            del self._hourly[key]
+        daily_cutoff = (now - timedelta(days=self.daily_retention_days)).toordinal()
+        for key in [k for k in self._daily if k < daily_cutoff]:
+            del self._daily[key]
+
+    def empty_copy(self) -> "AttendanceSeries":
+        return AttendanceSeries(
+            self.hourly_retention_days,
+            self.daily_retention_days,
+            int(self.visit.total_seconds() // 60)
+        )
+
+    def load(self, timestamps: Iterable[Timestamp]):
+        for timestamp in timestamps:
+            moment = _as_datetime(timestamp)
+            if moment:
+                self._add(moment)
+
+    def load_buckets(self, granularity: str, rows: Iterable[Dict[str, Any]]):
+        """Sumar filas de attendance_hourly, _daily o _monthly"""
+        for row in rows:
+            if granularity == "month":
+                self._monthly[row["month"]] += row["entries"]
+                continue
+            moment = _as_datetime(row[granularity])
+            if moment is None:
+                continue
+            if granularity == "hour":
+                self._hourly[_hour_key(moment)] += row["entries"]
+            else:
+                self._daily[moment.toordinal()] += row["entries"]
+
+    def load_recent(self, timestamps: Iterable[Timestamp]):
+        """Entradas de la última visita, solo para la ocupación"""
+        for timestamp in timestamps:
+            moment = _as_datetime(timestamp)
+            if moment and moment > datetime.now() - self.visit:
+                bisect.insort(self._recent_entries, moment)
+
+    def replace(self, fresh: "AttendanceSeries", version: Optional[int] = None):
+        """Adoptar los buckets de una serie construida aparte (rebuild)"""
+        fresh._compact(datetime.now())
+        with self._lock:
+            if self.loaded and version is not None and version != self.writes:
+                # A write landed mid-build and may be missing from it: keep the
+                # current copy, which has it, and retry on the next read
+                self.discarded_rebuilds += 1
+                return
+            self._hourly = fresh._hourly
+            self._daily = fresh._daily
+            self._monthly = fresh._monthly
+            self._recent_entries = fresh._recent_entries
+            self._compacted_hour = fresh._compacted_hour
+            self.loaded = True
+            # On a first load that raced a write, load again on the next read
+            self.refreshed_at = time.monotonic() if version in (None, self.writes) else 0.0
+
+    def needs_refresh(self, interval: float) -> bool:
+        return interval > 0 and time.monotonic() - self.refreshed_at >= interval
+
+    def record(self, timestamp: Timestamp):
+        moment = _as_datetime(timestamp)
+        if moment is None:
+            return
+        with self._lock:
+            self.writes += 1
+            if not self.loaded:
+                return
+            self._add(moment)
+            self._compact(datetime.now())
+
+    # Range queries
+    def hourly(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        first, last = _hour_key(start), _hour_key(end)
+        with self._lock:
+            counts = [self._hourly.get(key, 0) for key in range(first, last + 1)]
+        base = start.replace(minute=0, second=0, microsecond=0)
+        return [
+            {"start": (base + timedelta(hours=i)).isoformat(), "count": count}
+            for i, count in enumerate(counts)
+        ]
+
+    def daily(self, start: date, end: date) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"date": date.fromordinal(day).isoformat(), "count": self._daily.get(day, 0)}
+                for day in range(start.toordinal(), end.toordinal() + 1)
+            ]
+
+    def monthly(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"month": month, "count": self._monthly[month]} for month in sorted(self._monthly)]
+
+    def total(self, start: date, end: date) -> int:
+        with self._lock:
+            return sum(self._daily.get(day, 0) for day in range(start.toordinal(), end.toordinal() + 1))
+
+    def weekday_totals(self, days: int = 28) -> List[int]:
+        today = date.today()
+        totals = [0] * 7
+        with self._lock:
+            for offset in range(days):
+                day = today - timedelta(days=offset)
+                totals[day.weekday()] += self._daily.get(day.toordinal(), 0)
+        return totals
+
+    def growth_rate(self, days: int = 30) -> float:
+        """Variación porcentual de entradas: últimos ``days`` días frente a los anteriores"""
+        today = date.today()
+        current = self.total(today - timedelta(days=days - 1), today)
+        previous = self.total(today - timedelta(days=2 * days - 1), today - timedelta(days=days))
+        if not previous:
+            return 0.0
+        return round((current - previous) * 100 / previous, 1)
+
+    def occupancy(self) -> Dict[str, Any]:
+        """Estimación de personas dentro: entradas dentro de la duración media de una visita"""
+        now = datetime.now()
+        with self._lock:
+            cutoff = now - self.visit
+            del self._recent_entries[:bisect.bisect_right(self._recent_entries, cutoff)]
+            inside = len(self._recent_entries)
+        return {
+            "inside": inside,
+            "visit_minutes": int(self.visit.total_seconds() // 60),
+            "as_of": now.isoformat()
+        }
+
+
+async def load_rollups(db, series: AttendanceSeries, now: datetime):
+    """Buckets dentro de la retención y entradas de la última visita"""
+    # One step before each cutoff since scan's ``after`` is exclusive
+    first_hour = (now - timedelta(days=series.hourly_retention_days, hours=1)).replace(minute=0, second=0, microsecond=0)
+    starts = {
+        "hour": first_hour.isoformat(),
+        "day": (now - timedelta(days=series.daily_retention_days + 1)).date().isoformat(),
+        "month": None
+    }
+    for granularity, table in ROLLUP_TABLES.items():
+        async for page in scan(db, table, f"{granularity},entries", key=granularity, after=starts[granularity]):
+            series.load_buckets(granularity, page)
+    since = (now - series.visit).isoformat()
+    async for page in scan(
+        db, "access_events", projection("attendance.access_events"),
+        where=lambda query: query.eq("type", "entry").gte("timestamp", since)
+    ):
+        series.load_recent(row["timestamp"] for row in page)
+
+
+async def rebuild(db, series: AttendanceSeries):
+    """Recalcular la serie a partir de los buckets guardados"""
+    fresh = series.empty_copy()
+    version = series.writes
+    try:
+        await load_rollups(db, fresh, datetime.now())
+    except APIError as e:
+        # 42P01/PGRST205: the rollup tables aren't installed (see README)
+        if e.code not in ("42P01", "PGRST205"):
+            raise
+        fresh = series.empty_copy()
+        async for page in scan(db, "access_events", projection("attendance.access_events")):
+            fresh.load(row["timestamp"] for row in page)
+    series.replace(fresh, version)
+    return series
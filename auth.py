@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
-from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 from jose import jwt
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
 from supabase_client import get_supabase
+from hashing import PasswordHasher, PasswordHasherBusy, make_context
 
 # Cargar variables del .env
 load_dotenv()
@@ -14,7 +15,8 @@ ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
 
 # Configuración de seguridad
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = make_context()
+password_hasher = PasswordHasher(pwd_context)
 
 # Inicializar router
 router = APIRouter()
@@ -38,8 +40,10 @@ async def login(request: LoginRequest):
     email = request.email
     password = request.password
 
-    # Buscar el usuario en Supabase
-    result = supabase.table("administradores").select("*").eq("email", email).execute()
+    # Buscar el usuario en Supabase (el cliente es bloqueante)
+    result = await run_in_threadpool(
+        supabase.table("administradores").select("*").eq("email", email).execute
+    )
 
     if not result.data or len(result.data) == 0:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas")
@@ -47,9 +51,24 @@ async def login(request: LoginRequest):
     user = result.data[0]
     hashed_password = user["password_hash"]
 
-    if not pwd_context.verify(password, hashed_password):
+    # Verificar bcrypt en el pool dedicado, no en el event loop
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(password, hashed_password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados inicios de sesión simultáneos",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas")
 
+    # Rehash transparente si cambió BCRYPT_ROUNDS
+    if new_hash:
+        await run_in_threadpool(
+            supabase.table("administradores").update({"password_hash": new_hash}).eq("id", user["id"]).execute
+        )
+
     token_data = {
         "sub": user["id"],
         "email": user["email"],
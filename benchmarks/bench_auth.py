@@ -0,0 +1,60 @@
+"""
+Sobrecoste de autenticación por petición con y sin la caché de tokens.
+
+Mide la dependencia get_current_user aislada y una petición completa a
+GET /verify-token.
+
+Uso: python benchmarks/bench_auth.py [--iterations 20000]
+"""
+import argparse
+import asyncio
+import time
+
+from common import auth_headers, load_app, start_stub
+from fastapi.testclient import TestClient
+from token_cache import TokenCache
+
+
+def time_dependency(main, token, iterations):
+    async def run():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await main.get_current_user(token)
+        return time.perf_counter() - started
+    return asyncio.run(run()) / iterations
+
+
+def time_requests(client, headers, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        client.get("/verify-token", headers=headers)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    stub = start_stub()
+    app_module = load_app()
+    headers = auth_headers(app_module)
+    token = headers["Authorization"].split(" ", 1)[1]
+    client = TestClient(app_module.app)
+
+    results = {}
+    for label, size in (("sin caché", 0), ("con caché", 10000)):
+        app_module.token_cache = TokenCache(maxsize=size)
+        dependency = time_dependency(app_module, token, args.iterations)
+        request = time_requests(client, headers, args.requests)
+        results[label] = (dependency, request)
+        print(f"{label:10} get_current_user: {dependency * 1e6:8.2f} µs   GET /verify-token: {request * 1e6:8.1f} µs")
+
+    before, after = results["sin caché"][0], results["con caché"][0]
+    print(f"ahorro por petición: {(before - after) * 1e6:.2f} µs ({before / after:.1f}x en la dependencia)")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Alta de miembros uno a uno con POST /users frente a POST /users/import.
+
+El stub añade ``--latency`` segundos a cada petición para simular el viaje
+de ida y vuelta a Supabase. La carga fila a fila se mide sobre una muestra
+y se extrapola al total; la importación masiva envía el CSV completo.
+
+Uso: python benchmarks/bench_import.py [--rows 10000] [--latency 0.02]
+"""
+import argparse
+import csv
+import io
+import time
+
+from common import FIRST_NAMES, LAST_NAMES, MEMBERSHIPS, auth_headers, load_app, start_stub
+from fastapi.testclient import TestClient
+
+
+def make_rows(count: int, prefix: str):
+    return [
+        {
+            "name": f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[i % len(LAST_NAMES)]}",
+            "email": f"{prefix}{i}@gym.example.com",
+            "phone": f"+1555{i:07d}",
+            "membership": MEMBERSHIPS[i % len(MEMBERSHIPS)],
+            "active": "true"
+        }
+        for i in range(count)
+    ]
+
+
+def to_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--sample", type=int, default=200, help="filas medidas con POST /users")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    stub = start_stub(latency=args.latency)
+    app_module = load_app()
+    headers = auth_headers(app_module)
+
+    with TestClient(app_module.app) as client:
+        started = time.perf_counter()
+        for row in make_rows(args.sample, "single"):
+            row["active"] = True
+            response = client.post("/users", json=row, headers=headers)
+            assert response.status_code == 200, response.text
+        per_row = (time.perf_counter() - started) / args.sample
+
+        body = to_csv(make_rows(args.rows, "bulk"))
+        started = time.perf_counter()
+        response = client.post(f"/users/import?chunk_size={args.chunk_size}", content=body, headers=headers)
+        bulk = time.perf_counter() - started
+        report = response.json()
+
+    print(f"{args.rows} filas, latencia simulada {args.latency * 1000:.0f} ms por petición")
+    print(f"POST /users uno a uno:  {per_row * 1000:8.1f} ms/fila -> {per_row * args.rows:8.1f} s (extrapolado de {args.sample})")
+    print(f"POST /users/import:     {bulk * 1000 / args.rows:8.3f} ms/fila -> {bulk:8.2f} s "
+          f"({report['imported']} importadas, {report['failed']} errores)")
+    print(f"aceleración: {per_row * args.rows / bulk:.0f}x")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
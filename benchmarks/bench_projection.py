@@ -0,0 +1,56 @@
+"""
+Bytes transferidos desde PostgREST por endpoint: select("*") frente a la
+proyección declarada en queries.PROJECTIONS.
+
+Uso: python benchmarks/bench_projection.py [--members 2000] [--entries 200]
+"""
+import argparse
+import os
+
+from common import make_classes, make_members, make_payments, start_stub
+from queries import projection
+from supabase import create_client
+
+# (endpoint, table, projection, query modifiers)
+SCENARIOS = [
+    ("GET /users (page)", "memberships", "users.list", lambda q: q.range(0, 9)),
+    ("GET /check_access/{card_id}", "memberships", "access.card", lambda q: q.eq("card_id", "C0000001")),
+    ("POST /metrics/rebuild (memberships)", "memberships", "aggregates.memberships", lambda q: q),
+    ("POST /metrics/rebuild (payments)", "payments", "revenue.payments", lambda q: q),
+    ("GET /classes", "classes", "classes.list", lambda q: q),
+    ("GET /payments", "payments", "payments.list", lambda q: q),
+    ("GET /reports/users/export", "memberships", "reports.users", lambda q: q),
+]
+
+
+def measure(stub, client, table, select, modify):
+    stub.reset_counters()
+    modify(client.table(table).select(select)).execute()
+    return sum(stub.bytes_sent.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=200, help="entradas de entry_history por miembro")
+    parser.add_argument("--payments", type=int, default=5000)
+    args = parser.parse_args()
+
+    stub = start_stub()
+    stub.seed("memberships", make_members(args.members, args.entries))
+    stub.seed("payments", make_payments(args.payments, args.members))
+    stub.seed("classes", make_classes(20))
+
+    client = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+
+    print(f"{'endpoint':38} {'select(*)':>14} {'projected':>14} {'ratio':>8}")
+    for endpoint, table, name, modify in SCENARIOS:
+        before = measure(stub, client, table, "*", modify)
+        after = measure(stub, client, table, projection(name), modify)
+        ratio = before / after if after else float("inf")
+        print(f"{endpoint:38} {before:>14,} {after:>14,} {ratio:>7.1f}x")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
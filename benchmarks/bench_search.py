@@ -0,0 +1,60 @@
+"""
+Latencia de búsqueda de miembros: recorrido completo con ILIKE '%term%'
+(lo que hacía GET /users?search=, emulado en Python) frente al índice local.
+
+El recorrido crece con el número de miembros; el índice solo visita los
+miembros que coinciden con la búsqueda (los datos sintéticos combinan 30
+nombres y 30 apellidos, así que un nombre coincide con muchos miembros).
+
+Uso: python benchmarks/bench_search.py [--sizes 1000,10000,50000]
+"""
+import argparse
+import time
+
+from common import make_members
+from search_index import SearchIndex, normalize
+
+TYPEAHEAD = ("lucia gomez", "ana m", "C0000821", "0821")
+TYPO = ("ricardo vegga", "gabriela castilo")
+
+
+def ilike_scan(members, term):
+    needle = term.lower()
+    return [m for m in members if needle in m["name"].lower() or needle in m["email"].lower()]
+
+
+def per_query(func, terms, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for term in terms:
+            func(term)
+    return (time.perf_counter() - started) / (repeat * len(terms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'miembros':>10} {'ILIKE scan':>14} {'índice':>14} {'con errata':>14}")
+    for size in (int(n) for n in args.sizes.split(",")):
+        members = make_members(size, 0)
+        index = SearchIndex()
+        fresh = SearchIndex()
+        for member in members:
+            fresh._add(member)
+        index.replace(fresh)
+        scan_time = per_query(lambda term: ilike_scan(members, term), TYPEAHEAD, args.repeat)
+        index_time = per_query(lambda term: index.search(term, limit=20), TYPEAHEAD, args.repeat)
+        typo_time = per_query(lambda term: index.search(term, limit=20), TYPO, args.repeat)
+        print(f"{size:>10,} {scan_time * 1000:>11.2f} ms {index_time * 1000:>11.2f} ms {typo_time * 1000:>11.2f} ms")
+
+    sample = members[len(members) // 2]
+    typo = normalize(sample["name"]).replace("a", "", 1)
+    ranked = index.search(typo, limit=5)
+    print(f"con errata {typo!r}: {sample['card_id']} en posición {ranked.index(sample['card_id']) + 1 if sample['card_id'] in ranked else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Bytes en la red de una sesión típica del dashboard, sin y con validadores
+HTTP y compresión.
+
+La sesión abre el dashboard, las páginas de usuarios, clases y pagos y
+después refresca /metrics y la página de usuarios cada pocos segundos.
+"Antes" es un cliente que no envía If-None-Match ni acepta compresión (lo
+que recibía el navegador sin ETag ni gzip); "después" se comporta como un
+navegador: guarda el ETag de cada URL y acepta gzip.
+
+Uso: python benchmarks/bench_wire.py [--members 2000] [--polls 60]
+"""
+import argparse
+
+from common import auth_headers, load_app, make_classes, make_members, make_payments, start_stub
+from fastapi.testclient import TestClient
+
+PAGES = ["/metrics", "/users?page=1&limit=20", "/classes", "/payments"]
+POLLED = ["/metrics", "/users?page=1&limit=20"]
+
+
+def header_bytes(response) -> int:
+    # Status line plus "name: value\r\n" per header and the blank line
+    return 17 + sum(len(k) + len(v) + 4 for k, v in response.headers.raw) + 2
+
+
+def run_session(client, headers, polls, browser):
+    etags, total, statuses = {}, 0, {}
+    for path in PAGES + POLLED * polls:
+        request_headers = dict(headers)
+        request_headers["Accept-Encoding"] = "gzip" if browser else "identity"
+        if browser and path in etags:
+            request_headers["If-None-Match"] = etags[path]
+        response = client.get(path, headers=request_headers)
+        if response.status_code == 200 and "etag" in response.headers:
+            etags[path] = response.headers["etag"]
+        total += header_bytes(response) + response.num_bytes_downloaded
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return total, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--payments", type=int, default=2000)
+    parser.add_argument("--polls", type=int, default=60, help="refrescos del dashboard en la sesión")
+    args = parser.parse_args()
+
+    stub = start_stub()
+    stub.seed("memberships", make_members(args.members, 0))
+    stub.seed("payments", make_payments(args.payments, args.members))
+    stub.seed("classes", make_classes(20))
+    app_module = load_app()
+    headers = auth_headers(app_module)
+
+    with TestClient(app_module.app) as client:
+        # Let the dashboard load so both sessions see the same bodies
+        client.post("/metrics/rebuild", headers=headers)
+        before, before_statuses = run_session(client, headers, args.polls, browser=False)
+        after, after_statuses = run_session(client, headers, args.polls, browser=True)
+
+    requests = len(PAGES) + len(POLLED) * args.polls
+    print(f"sesión: {requests} peticiones ({args.polls} refrescos de {', '.join(POLLED)})")
+    print(f"sin validadores ni compresión: {before:>12,} bytes  {before_statuses}")
+    print(f"con ETag y gzip:               {after:>12,} bytes  {after_statuses}")
+    print(f"reducción: {before / after:.1f}x")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
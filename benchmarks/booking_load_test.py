@@ -0,0 +1,198 @@
+"""
+Prueba de humo de reservas del lado del cliente: cientos de miembros reservan
+a la vez la misma clase, repartidos entre varios workers del backend.
+
+``book_class`` y ``cancel_booking`` son aquí copias en Python registradas en
+el stub de PostgREST, que las ejecuta de una en una. No se ejecutan las
+funciones plpgsql del README ni sus bloqueos de fila, así que esta prueba no
+demuestra que no haya sobreventa con concurrencia real: eso solo puede
+comprobarse contra un Postgres con el DDL del README. Lo que sí cubre es el
+lado del backend: cómo reparte las llamadas, cómo traduce las respuestas y
+los errores de las funciones, y que los listados y contadores que devuelve
+cuadran con lo que aplicó el stub (plazas = aforo, lista de espera sin
+huecos y ascenso del primero tras cancelar).
+
+Uso: python benchmarks/booking_load_test.py [--members 500] [--capacity 20] [--workers 2]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+from common import ROOT, make_members
+from load_test import free_port, make_token, start_backend
+from postgrest_stub import FunctionError, PostgrestStub
+
+CLASS_ID = "spinning-07"
+
+
+def _active(stub, class_id, card_id):
+    return next((b for b in stub.tables["class_bookings"]
+                 if b["class_id"] == class_id and b["card_id"] == card_id and b["status"] != "cancelled"), None)
+
+
+def book_class(stub, params):
+    klass = next((c for c in stub.tables["classes"] if c["id"] == params["p_class_id"]), None)
+    if klass is None:
+        raise FunctionError("P0002", "class not found")
+    if _active(stub, klass["id"], params["p_card_id"]):
+        raise FunctionError("23505", "duplicate key value violates unique constraint", status=409)
+    if klass["booked_count"] < klass["capacity"]:
+        klass["booked_count"] += 1
+        status = "booked"
+    else:
+        klass["waitlist_count"] += 1
+        status = "waitlisted"
+    now = datetime.now().isoformat()
+    row = {"class_id": klass["id"], "card_id": params["p_card_id"], "status": status,
+           "created_at": now, "updated_at": now}
+    stub._prepare("class_bookings", row)
+    stub.tables["class_bookings"].append(row)
+    return [dict(row)]
+
+
+def cancel_booking(stub, params):
+    klass = next((c for c in stub.tables["classes"] if c["id"] == params["p_class_id"]), None)
+    booking = _active(stub, params["p_class_id"], params["p_card_id"])
+    if klass is None or booking is None:
+        return []
+    previous, booking["status"] = booking["status"], "cancelled"
+    rows = [dict(booking)]
+    if previous == "waitlisted":
+        klass["waitlist_count"] -= 1
+        return rows
+    waiting = [b for b in stub.tables["class_bookings"] if b["class_id"] == klass["id"] and b["status"] == "waitlisted"]
+    if waiting:
+        first = min(waiting, key=lambda b: b["id"])
+        first["status"] = "booked"
+        klass["waitlist_count"] -= 1
+        rows.append(dict(first))
+    else:
+        klass["booked_count"] -= 1
+    return rows
+
+
+def serve_stub(members, capacity, ready, done):
+    stub = PostgrestStub()
+    stub.seed("memberships", members)
+    stub.seed("classes", [{
+        "id": CLASS_ID, "name": "Spinning 07:00", "instructor": "Laura", "schedule": "Lunes 07:00",
+        "capacity": capacity, "booked_count": 0, "waitlist_count": 0, "created_at": datetime.now().isoformat()
+    }])
+    stub.rpc["book_class"] = book_class
+    stub.rpc["cancel_booking"] = cancel_booking
+    ready.put(stub.start())
+    done.wait()
+    stub.stop()
+
+
+async def burst(urls, headers, card_ids):
+    """Todas las reservas a la vez, repartidas entre los workers"""
+    limits = httpx.Limits(max_connections=len(card_ids))
+    clients = [httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) for url in urls]
+    start = asyncio.Event()
+    results = []
+
+    async def reserve(i, card_id):
+        await start.wait()
+        started = time.perf_counter()
+        response = await clients[i % len(clients)].post(f"/classes/{CLASS_ID}/bookings", json={"card_id": card_id})
+        status = response.json()["booking"]["status"] if response.status_code == 200 else f"HTTP {response.status_code}"
+        results.append((status, time.perf_counter() - started))
+
+    tasks = [asyncio.ensure_future(reserve(i, card_id)) for i, card_id in enumerate(card_ids)]
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    start.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        await client.aclose()
+    return results, elapsed
+
+
+async def cancel_some(url, headers, card_ids):
+    async with httpx.AsyncClient(base_url=url, headers=headers, timeout=60) as client:
+        responses = await asyncio.gather(*(client.delete(f"/classes/{CLASS_ID}/bookings/{c}") for c in card_ids))
+    return [r.json() for r in responses]
+
+
+def check(condition, message, failures):
+    print(f"  {'ok ' if condition else 'FALLO'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=500, help="reservas simultáneas")
+    parser.add_argument("--capacity", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2, help="procesos del backend")
+    parser.add_argument("--cancellations", type=int, default=5)
+    args = parser.parse_args()
+
+    members = make_members(args.members, 0)
+    for member in members:
+        member["active"] = True
+        member["expiration_date"] = (datetime.now() + timedelta(days=30)).isoformat()
+    ready, done = multiprocessing.Queue(), multiprocessing.Event()
+    stub = multiprocessing.Process(target=serve_stub, args=(members, args.capacity, ready, done))
+    stub.start()
+    stub_url = ready.get()
+    backends, urls = [], []
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    failures = []
+    try:
+        for _ in range(args.workers):
+            port = free_port()
+            backends.append(start_backend(ROOT, stub_url, port))
+            urls.append(f"http://127.0.0.1:{port}")
+
+        card_ids = [member["card_id"] for member in members]
+        results, elapsed = asyncio.run(burst(urls, headers, card_ids))
+        statuses = Counter(status for status, _ in results)
+        latencies = [latency for _, latency in results]
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{args.members} reservas simultáneas, aforo {args.capacity}, {args.workers} workers: {elapsed:.2f} s")
+        print(f"  p50 {quantiles[49] * 1000:.1f} ms   p95 {quantiles[94] * 1000:.1f} ms   p99 {quantiles[98] * 1000:.1f} ms")
+        print(f"  {dict(statuses)}")
+
+        api = httpx.Client(base_url=urls[0], headers=headers, timeout=60)
+        occupancy = api.get(f"/classes/{CLASS_ID}/occupancy").json()
+        waitlist = api.get(f"/classes/{CLASS_ID}/bookings", params={"status": "waitlisted", "limit": 500}).json()["bookings"]
+        booked = api.get(f"/classes/{CLASS_ID}/bookings", params={"status": "booked", "limit": 500}).json()["bookings"]
+        check(statuses["booked"] == args.capacity, f"plazas confirmadas = aforo ({statuses['booked']})", failures)
+        check(statuses["waitlisted"] == args.members - args.capacity, "el resto queda en espera", failures)
+        check(occupancy["booked"] == len(booked) == args.capacity, f"contador de plazas = reservas ({occupancy})", failures)
+        check(occupancy["waitlisted"] == len(waitlist), "contador de espera = lista de espera", failures)
+        last = waitlist[-1]["card_id"] if waitlist else None
+        if last:
+            position = api.get(f"/classes/{CLASS_ID}/bookings/{last}").json().get("position")
+            check(position == len(waitlist), f"el último de la lista está en el puesto {len(waitlist)}", failures)
+
+        cancelled = [row["card_id"] for row in booked[:args.cancellations]]
+        outcome = asyncio.run(cancel_some(urls[-1], headers, cancelled))
+        promoted = {result["promoted"]["card_id"] for result in outcome if result.get("promoted")}
+        expected = {row["card_id"] for row in waitlist[:len(cancelled)]}
+        check(promoted == expected, f"ascienden los {len(cancelled)} primeros de la lista de espera", failures)
+        after = api.get(f"/classes/{CLASS_ID}/occupancy").json()
+        check(after["booked"] == args.capacity and after["waitlisted"] == occupancy["waitlisted"] - len(cancelled),
+              f"tras cancelar: {after}", failures)
+        api.close()
+    finally:
+        for backend in backends:
+            backend.terminate()
+            backend.wait()
+        done.set()
+        stub.join()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Utilidades compartidas por los benchmarks: arranque del stub de PostgREST,
+datos sintéticos y carga de la aplicación contra el stub.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from postgrest_stub import PostgrestStub  # noqa: E402
+
+MEMBERSHIPS = ("basic", "premium", "vip")
+PAYMENT_METHODS = ("card", "cash", "transfer")
+FIRST_NAMES = (
+    "Ana", "Carlos", "Lucía", "Miguel", "Sofía", "Javier", "Valentina", "Diego", "Camila", "Andrés",
+    "Isabel", "Mateo", "Paula", "Sebastián", "Daniela", "Tomás", "Gabriela", "Martín", "Elena", "Nicolás",
+    "Mariana", "Alejandro", "Natalia", "Fernando", "Laura", "Ricardo", "Carmen", "Pablo", "Julia", "Hugo"
+)
+LAST_NAMES = (
+    "García", "Rodríguez", "Martínez", "López", "González", "Pérez", "Sánchez", "Ramírez", "Torres", "Flores",
+    "Rivera", "Gómez", "Díaz", "Reyes", "Morales", "Cruz", "Ortiz", "Gutiérrez", "Chávez", "Ramos",
+    "Vargas", "Castillo", "Jiménez", "Moreno", "Romero", "Herrera", "Medina", "Aguilar", "Vega", "Castro"
+)
+
+
+def start_stub(latency: float = 0.0) -> PostgrestStub:
+    """Arrancar el stub y apuntar las variables de entorno de Supabase a él"""
+    stub = PostgrestStub(latency=latency)
+    url = stub.start()
+    os.environ["SUPABASE_URL"] = url
+    os.environ["SUPABASE_KEY"] = "e30.e30.benchmark"
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    return stub
+
+
+def load_app():
+    """Importar main después de configurar el entorno"""
+    import main
+    return main
+
+
+def auth_headers(main) -> dict:
+    token = main.create_access_token({
+        "sub": "admin@gym.com", "role": "admin", "name": "Benchmark", "user_id": "bench"
+    })
+    return {"Authorization": f"Bearer {token}"}
+
+
+def make_members(count: int, entries_per_member: int, seed: int = 7):
+    rng = random.Random(seed)
+    now = datetime.now()
+    members = []
+    for i in range(count):
+        created = now - timedelta(days=rng.randint(0, 1500), seconds=rng.randint(0, 86400))
+        history = [
+            {"timestamp": (created + timedelta(days=d, hours=rng.randint(6, 21))).isoformat(), "type": "entry"}
+            for d in range(entries_per_member)
+        ]
+        first, last, second = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(LAST_NAMES)
+        members.append({
+            "id": f"{i:08d}-0000-0000-0000-000000000000",
+            "card_id": f"C{i:07d}",
+            "name": f"{first} {last} {second}",
+            "email": f"{first[:1]}{last}{i}@gym.test".lower(),
+            "phone": f"+1555{i:07d}",
+            "membership": rng.choice(MEMBERSHIPS),
+            "active": rng.random() < 0.8,
+            "expiration_date": (now + timedelta(days=rng.randint(-30, 330))).isoformat(),
+            "entry_history": history,
+            "last_access": history[-1]["timestamp"] if history else None,
+            "created_at": created.isoformat(),
+            "updated_at": created.isoformat()
+        })
+    return members
+
+
+def make_payments(count: int, members: int, seed: int = 11):
+    rng = random.Random(seed)
+    now = datetime.now()
+    return [
+        {
+            "id": f"PAY{i:08d}",
+            "user_id": f"C{rng.randrange(members):07d}",
+            "amount": rng.choice((30.0, 50.0, 80.0)),
+            "payment_method": rng.choice(PAYMENT_METHODS),
+            "status": "completed" if rng.random() < 0.95 else "pending",
+            "description": "Membresía mensual",
+            "created_at": (now - timedelta(days=rng.randint(0, 1500), seconds=rng.randint(0, 86400))).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+def make_classes(count: int):
+    return [
+        {
+            "id": f"CLS{i:04d}",
+            "name": f"Clase {i}",
+            "instructor": f"Instructor {i % 7}",
+            "schedule": "Lunes a Viernes 7:00 AM",
+            "capacity": 20,
+            "description": "Clase grupal",
+            "created_at": datetime.now().isoformat()
+        }
+        for i in range(count)
+    ]
@@ -0,0 +1,425 @@
+"""
+Suite de carga reproducible para comparar versiones del backend con un
+volumen de datos de producción.
+
+El stub de PostgREST, en su propio proceso, se llena con datos generados
+con una semilla fija: 50.000 miembros con un historial de entradas largo,
+500.000 pagos, clases y administradores con contraseña bcrypt. Indexa las
+mismas columnas que tienen índice en Supabase y responde con
+``--latency`` segundos de latencia. El backend corre con uvicorn como en
+producción, sin el barrido de vencimientos para que los datos no cambien
+entre escenarios. Después de cargar el dashboard y el índice de búsqueda
+se ejecutan, uno detrás de otro:
+
+- ``turnstile``: hora punta de torniquetes en GET /check_access/{card_id}
+- ``dashboard``: paneles abiertos consultando GET /metrics (con ETag)
+- ``users``: páginas, recorridos por cursor y búsquedas en GET /users
+- ``login``: ráfaga de inicios de sesión simultáneos en POST /login
+
+p50/p95/p99, throughput y códigos de estado de cada escenario (y de cada
+operación dentro de él) se guardan en un JSON junto con el commit y la
+configuración. Con ``--baseline`` se compara con el JSON de otra versión y
+el proceso termina con código 1 si algún escenario empeora más que
+``--tolerance``.
+
+Uso: python benchmarks/load_suite.py [--output nueva.json] [--baseline anterior.json] [--root /tmp/antes]
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from common import ROOT, make_classes, make_members, make_payments
+from load_test import free_port, make_token, start_backend
+from postgrest_stub import PostgrestStub
+
+SCENARIOS = ("turnstile", "dashboard", "users", "login")
+FORMAT_VERSION = 1
+ADMIN_PASSWORD = "benchmark-password"
+ADMINS = 10
+# Columns with an index in the Supabase schema (primary keys, unique
+# constraints and the created_at ordering of the listings)
+INDEXES = {
+    "memberships": ("id", "card_id", "email", "created_at"),
+    "payments": ("id", "user_id", "created_at"),
+    "access_events": ("id", "card_id"),
+    "administradores": ("id", "email"),
+    "classes": ("id",),
+}
+SEARCH_TERMS = ("garcía", "ana", "lopez", "mart", "valentina tor", "gomez r", "sofía díaz", "castro")
+UNKNOWN_CARD_RATE = 0.03
+USERS_PER_PAGE = 10
+CURSOR_PAGES = 5
+
+
+def touch_last_access(stub, params):
+    """Misma semántica que la función SQL del README"""
+    changed = 0
+    for update in params["updates"]:
+        for row in stub.find("memberships", "card_id", update["card_id"]):
+            if row.get("last_access") is None or row["last_access"] < update["last_access"]:
+                row["last_access"] = update["last_access"]
+                changed += 1
+    return changed
+
+
+def serve_stub(args, password_hash, ready, done):
+    """Generar los datos aquí para no copiarlos entre procesos"""
+    started = time.perf_counter()
+    stub = PostgrestStub(latency=args.latency)
+    stub.seed("memberships", make_members(args.members, args.entries, seed=args.seed))
+    stub.seed("payments", make_payments(args.payments, args.members, seed=args.seed + 1))
+    stub.seed("classes", make_classes(40))
+    stub.seed("administradores", [
+        {
+            "id": f"ADM{i:03d}",
+            "email": f"admin{i}@gym.example.com",
+            "nombre": f"Administrador {i}",
+            "rol": "admin",
+            "password_hash": password_hash
+        }
+        for i in range(ADMINS)
+    ])
+    for table, columns in INDEXES.items():
+        stub.create_index(table, *columns)
+    stub.rpc["touch_last_access"] = touch_last_access
+    url = stub.start()
+    ready.put((url, time.perf_counter() - started))
+    done.wait()
+    stub.stop()
+
+
+class Recorder:
+    """Latencia y código de estado de cada petición, por operación"""
+
+    def __init__(self):
+        self.calls: Dict[str, List[tuple]] = defaultdict(list)
+        self.elapsed = 0.0
+
+    async def request(self, client: httpx.AsyncClient, operation: str, method: str, url: str,
+                      **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.calls[operation].append((time.perf_counter() - started, type(e).__name__))
+            return None
+        self.calls[operation].append((time.perf_counter() - started, str(response.status_code)))
+        return response
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    # Nearest rank: stable for small samples such as the login burst
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(calls: List[tuple], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latency for latency, _ in calls)
+    statuses: Dict[str, int] = defaultdict(int)
+    for _, status in calls:
+        statuses[status] += 1
+    # 304 is the expected answer to a poll with an unchanged ETag
+    errors = sum(count for status, count in statuses.items() if status not in ("200", "304"))
+    summary = {
+        "requests": len(calls),
+        "errors": errors,
+        "error_rate": round(errors / len(calls), 4) if calls else 0.0,
+        "status": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(calls) / elapsed, 2) if elapsed else 0.0,
+    }
+    if latencies:
+        summary["latency_ms"] = {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+        }
+    return summary
+
+
+def scenario_result(recorder: Recorder, concurrency: int) -> Dict[str, Any]:
+    every = [call for calls in recorder.calls.values() for call in calls]
+    return {
+        "concurrency": concurrency,
+        "seconds": round(recorder.elapsed, 2),
+        **summarize(every, recorder.elapsed),
+        "operations": {
+            operation: summarize(calls, recorder.elapsed) for operation, calls in sorted(recorder.calls.items())
+        }
+    }
+
+
+def client_for(base_url: str, headers: Dict[str, str], concurrency: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60)
+
+
+Session = Callable[[Recorder, httpx.AsyncClient, random.Random, Dict[str, Any]], Awaitable[None]]
+
+
+async def closed_loop(base_url: str, headers: Dict[str, str], concurrency: int, duration: float,
+                      session: Session, seed: int) -> Recorder:
+    """``concurrency`` clientes repitiendo ``session`` sin pausa durante ``duration`` segundos"""
+    recorder = Recorder()
+    async with client_for(base_url, headers, concurrency) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(n):
+            # One seeded generator per client: the same run replays the same requests
+            rng, state = random.Random(seed * 1000 + n), {}
+            while time.perf_counter() < deadline:
+                await session(recorder, client, rng, state)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        recorder.elapsed = time.perf_counter() - started
+    return recorder
+
+
+def turnstile_session(members: int) -> Session:
+    async def swipe(recorder, client, rng, state):
+        if rng.random() < UNKNOWN_CARD_RATE:
+            card_id = f"X{rng.randrange(10 ** 7):07d}"
+        else:
+            card_id = f"C{rng.randrange(members):07d}"
+        await recorder.request(client, "check_access", "GET", f"/check_access/{card_id}")
+    return swipe
+
+
+async def dashboard_session(recorder, client, rng, state):
+    # Like the browser: revalidate with the last ETag
+    headers = {"If-None-Match": state["etag"]} if state.get("etag") else {}
+    response = await recorder.request(client, "metrics", "GET", "/metrics", headers=headers)
+    if response is not None and response.headers.get("etag"):
+        state["etag"] = response.headers["etag"]
+
+
+async def users_session(recorder, client, rng, state):
+    """Lo que hace la página de usuarios: paginar, filtrar, seguir el cursor o buscar"""
+    roll = rng.random()
+    if roll < 0.5:
+        params = {"page": rng.randint(1, 5), "limit": USERS_PER_PAGE}
+        if rng.random() < 0.3:
+            params["status"] = rng.choice(("active", "inactive"))
+        await recorder.request(client, "page", "GET", "/users", params=params)
+    elif roll < 0.75:
+        params = {"limit": 50, "count": "none"}
+        for _ in range(CURSOR_PAGES):
+            response = await recorder.request(client, "cursor", "GET", "/users", params=params)
+            cursor = response.json().get("next_cursor") if response is not None and response.status_code == 200 else None
+            if not cursor:
+                break
+            params = {"limit": 50, "count": "none", "cursor": cursor}
+    else:
+        params = {"search": rng.choice(SEARCH_TERMS), "page": 1, "limit": USERS_PER_PAGE}
+        await recorder.request(client, "search", "GET", "/users", params=params)
+
+
+async def login_burst(base_url: str, logins: int) -> Recorder:
+    """Todos los inicios de sesión a la vez, como en un cambio de turno"""
+    recorder = Recorder()
+    async with client_for(base_url, {}, logins) as client:
+        start = asyncio.Event()
+
+        async def login(i):
+            await start.wait()
+            credentials = {"email": f"admin{i % ADMINS}@gym.example.com", "password": ADMIN_PASSWORD}
+            await recorder.request(client, "login", "POST", "/login", json=credentials)
+
+        tasks = [asyncio.ensure_future(login(i)) for i in range(logins)]
+        await asyncio.sleep(0.2)
+        started = time.perf_counter()
+        start.set()
+        await asyncio.gather(*tasks)
+        recorder.elapsed = time.perf_counter() - started
+    return recorder
+
+
+async def timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> float:
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    response.raise_for_status()
+    return round(time.perf_counter() - started, 2)
+
+
+async def run_suite(base_url: str, args) -> Dict[str, Any]:
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    setup = {}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=600) as client:
+        # Cold loads are measured once here, not mixed into the scenarios
+        setup["metrics_rebuild_seconds"] = await timed(client, "POST", "/metrics/rebuild")
+        setup["search_index_seconds"] = await timed(client, "GET", "/users", params={"search": SEARCH_TERMS[0]})
+
+    scenarios = {}
+    for name in args.scenarios:
+        if name == "login":
+            scenarios[name] = scenario_result(await login_burst(base_url, args.logins), args.logins)
+        else:
+            concurrency, session = {
+                "turnstile": (args.concurrency, turnstile_session(args.members)),
+                "dashboard": (args.dashboards, dashboard_session),
+                "users": (args.browsers, users_session),
+            }[name]
+            recorder = await closed_loop(base_url, headers, concurrency, args.duration, session, args.seed)
+            scenarios[name] = scenario_result(recorder, concurrency)
+        print_scenario(name, scenarios[name])
+    return {"setup": setup, "scenarios": scenarios}
+
+
+def print_scenario(name: str, result: Dict[str, Any]):
+    rows = [(name, result)] + [(f"  {op}", summary) for op, summary in result["operations"].items()]
+    if len(result["operations"]) == 1:
+        rows = rows[:1]
+    for label, summary in rows:
+        latency = summary.get("latency_ms")
+        if latency is None:
+            print(f"{label:14} sin respuestas")
+            continue
+        print(
+            f"{label:14} {summary['throughput_rps']:8.1f} req/s   p50 {latency['p50']:8.1f} ms   "
+            f"p95 {latency['p95']:8.1f} ms   p99 {latency['p99']:8.1f} ms   "
+            f"errores {summary['errors']}/{summary['requests']}"
+        )
+
+
+def git_revision(root: Path) -> Dict[str, Any]:
+    def git(*command):
+        result = subprocess.run(["git", *command], cwd=root, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Comparar con otra ejecución; devuelve los empeoramientos por encima de ``tolerance``"""
+    if current["config"]["volumes"] != baseline.get("config", {}).get("volumes"):
+        print("aviso: la referencia se midió con otros volúmenes de datos")
+    print(f"\nfrente a {baseline.get('revision', {}).get('commit') or 'la referencia'} "
+          f"(tolerancia {tolerance:.0%}):")
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or "latency_ms" not in before or "latency_ms" not in result:
+            continue
+        checks = [
+            ("p95", before["latency_ms"]["p95"], result["latency_ms"]["p95"], True),
+            ("p99", before["latency_ms"]["p99"], result["latency_ms"]["p99"], True),
+            ("req/s", before["throughput_rps"], result["throughput_rps"], False),
+        ]
+        for metric, old, new, lower_is_better in checks:
+            change = (new - old) / old if old else 0.0
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            print(f"  {name:10} {metric:6} {old:10.1f} -> {new:10.1f}  {change:+7.1%}{'  EMPEORA' if worse else ''}")
+            if worse:
+                regressions.append(f"{name} {metric} {change:+.1%}")
+        if result["error_rate"] > before.get("error_rate", 0.0) + 0.01:
+            print(f"  {name:10} errores {before.get('error_rate', 0.0):.2%} -> {result['error_rate']:.2%}  EMPEORA")
+            regressions.append(f"{name} errores {result['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument("--entries", type=int, default=60, help="entradas en el historial de cada miembro")
+    parser.add_argument("--payments", type=int, default=500000)
+    parser.add_argument("--latency", type=float, default=0.005, help="latencia del stub en segundos")
+    parser.add_argument("--duration", type=float, default=20, help="segundos por escenario")
+    parser.add_argument("--concurrency", type=int, default=100, help="torniquetes simultáneos")
+    parser.add_argument("--dashboards", type=int, default=20, help="paneles consultando /metrics")
+    parser.add_argument("--browsers", type=int, default=20, help="sesiones en la página de usuarios")
+    parser.add_argument("--logins", type=int, default=32, help="inicios de sesión en la ráfaga")
+    parser.add_argument("--card-cache", type=int, default=10000, help="CARD_CACHE_SIZE del backend")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--root", type=Path, default=ROOT, help="copia del repositorio a medir")
+    parser.add_argument("--output", type=Path, help="JSON de resultados (por defecto load-suite-<commit>.json)")
+    parser.add_argument("--baseline", type=Path, help="JSON de otra versión con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="empeoramiento relativo permitido")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(unknown))}")
+    root = args.root.resolve()
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+
+    from hashing import make_context
+    password_hash = make_context().hash(ADMIN_PASSWORD)
+
+    print(f"generando {args.members} miembros ({args.entries} entradas cada uno) y {args.payments} pagos...")
+    ready, done = multiprocessing.Queue(), multiprocessing.Event()
+    stub = multiprocessing.Process(target=serve_stub, args=(args, password_hash, ready, done))
+    stub.start()
+    backend = None
+    try:
+        stub_url, seed_seconds = ready.get()
+        port = free_port()
+        started = time.perf_counter()
+        backend = start_backend(root, stub_url, port, {
+            "CARD_CACHE_SIZE": str(args.card_cache),
+            # Keep the data fixed for the whole run
+            "EXPIRY_SWEEP_SECONDS": "0"
+        })
+        startup_seconds = time.perf_counter() - started
+        print(f"stub {args.latency * 1000:.0f} ms, {args.duration:.0f} s por escenario")
+        results = asyncio.run(run_suite(f"http://127.0.0.1:{port}", args))
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait()
+        done.set()
+        stub.join()
+
+    revision = git_revision(root)
+    report = {
+        "format": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": revision,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "config": {
+            "volumes": {"members": args.members, "entries_per_member": args.entries, "payments": args.payments},
+            "stub_latency_seconds": args.latency,
+            "duration_seconds": args.duration,
+            "card_cache_size": args.card_cache,
+            "seed": args.seed
+        },
+        "setup": {
+            "seed_seconds": round(seed_seconds, 2),
+            "backend_start_seconds": round(startup_seconds, 2),
+            **results["setup"]
+        },
+        "scenarios": results["scenarios"]
+    }
+    output = args.output or Path(f"load-suite-{(revision['commit'] or 'local')[:12]}.json")
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+    print(f"resultados en {output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"empeoran: {'; '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
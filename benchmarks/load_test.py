@@ -0,0 +1,155 @@
+"""
+Prueba de carga: throughput y latencia del backend con el stub de PostgREST
+respondiendo con latencia artificial.
+
+Arranca el stub y el backend (uvicorn, un worker) en procesos separados y
+lanza peticiones concurrentes contra GET /users y
+GET /check_access/{card_id}. Con ``--root`` se puede medir otra copia del
+repositorio (por ejemplo un ``git worktree`` de un commit anterior) para
+comparar antes/después.
+
+Uso: python benchmarks/load_test.py [--latency 0.1] [--concurrency 100] [--duration 10]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+from jose import jwt
+
+from common import ROOT, make_members
+from postgrest_stub import PostgrestStub
+
+SECRET = "load-test-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_token() -> str:
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": "admin@gym.com", "role": "admin", "name": "Load test", "user_id": "load",
+        "iat": int(now.timestamp()), "exp": now + timedelta(hours=1)
+    }
+    return jwt.encode(claims, SECRET, algorithm="HS256")
+
+
+def serve_stub(latency, members, ready, done):
+    stub = PostgrestStub(latency=latency)
+    stub.seed("memberships", members)
+    ready.put(stub.start())
+    done.wait()
+    stub.stop()
+
+
+def start_backend(root: Path, stub_url: str, port: int, overrides: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_KEY": "e30.e30.benchmark",
+        "JWT_SECRET_KEY": SECRET,
+        # Measure the data layer, not the card cache
+        "CARD_CACHE_SIZE": "0",
+        **(overrides or {})
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=root, env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("el backend no arrancó")
+
+
+async def drive(base_url, paths, headers, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        async def worker(offset):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(paths[i % len(paths)])
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+                i += concurrency
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def report(label, latencies, errors, elapsed):
+    if not latencies:
+        print(f"{label:14} sin respuestas")
+        return
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{label:14} {len(latencies) / elapsed:8.1f} req/s   "
+        f"p50 {quantiles[49] * 1000:7.1f} ms   p95 {quantiles[94] * 1000:7.1f} ms   "
+        f"p99 {quantiles[98] * 1000:7.1f} ms   errores {errors}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.1, help="latencia del stub en segundos")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--root", type=Path, default=ROOT, help="copia del repositorio a medir")
+    args = parser.parse_args()
+
+    members = make_members(args.members, 0)
+    ready, done = multiprocessing.Queue(), multiprocessing.Event()
+    stub = multiprocessing.Process(target=serve_stub, args=(args.latency, members, ready, done))
+    stub.start()
+    port = free_port()
+    backend = start_backend(args.root.resolve(), ready.get(), port)
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    base_url = f"http://127.0.0.1:{port}"
+
+    scenarios = {
+        "GET /users": [f"/users?page={n % 10 + 1}&limit=20" for n in range(10)],
+        "check_access": [f"/check_access/{member['card_id']}" for member in members[:500]]
+    }
+    print(f"stub {args.latency * 1000:.0f} ms, concurrencia {args.concurrency}, {args.duration:.0f} s por escenario")
+    try:
+        for label, paths in scenarios.items():
+            report(label, *asyncio.run(drive(base_url, paths, headers, args.concurrency, args.duration)))
+    finally:
+        backend.terminate()
+        backend.wait()
+        done.set()
+        stub.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,605 @@
+"""
+Servidor PostgREST mínimo en memoria para benchmarks y pruebas de carga.
+
+Implementa el subconjunto de la API REST de Supabase que usa el backend
+(select con proyección, filtros, or/and, order, rangos, Prefer count,
+insert/upsert, update, delete y rpc) para poder ejecutar ``main.app`` sin
+una instancia real de Supabase.
+
+Sin índices cada consulta recorre la tabla entera. ``create_index`` declara
+columnas indexadas, como haría un ``CREATE INDEX``: los filtros ``eq`` e
+``in`` sobre ellas se resuelven por hash, y los ``order`` que solo usan
+columnas indexadas leen un orden cacheado que se corta en cuanto la página
+está completa (y salta con búsqueda binaria a la cota de un filtro keyset
+``gt``/``lt`` sobre la primera columna). Así los benchmarks con decenas de
+miles de filas miden el backend y no el stub.
+
+``triggers`` emula los triggers del README: funciones que se ejecutan tras
+cada alta, cambio o baja de una tabla (por HTTP o con ``seed``) y que
+mantienen las tablas de resumen con ``bump``. ``seed`` carga filas que ya
+existían, así que además aplica los backfill de ``on_seed``; ``rpc`` trae
+registrada ``add_revenue``.
+"""
+import asyncio
+import json
+import operator
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Primary keys used for upserts when no on_conflict is given
+PRIMARY_KEYS = {
+    "config": "key",
+    "attendance_hourly": "hour",
+    "attendance_daily": "day",
+    "attendance_monthly": "month"
+}
+SERIAL_TABLES = {"access_events", "renewal_reminders", "class_bookings"}
+
+_FILTER_OPS = {"eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "in", "is"}
+_RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_COMPARISONS = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt, "gte": operator.ge,
+                "lt": operator.lt, "lte": operator.le}
+
+
+class FunctionError(Exception):
+    """Error que una función registrada en ``rpc`` devuelve como PostgREST"""
+
+    def __init__(self, code: str, message: str, status: int = 400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, escaped, current = [], 0, False, False, ""
+    for char in text:
+        if escaped:
+            escaped = False
+        elif quoted and char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _unquote(value: str) -> str:
+    # Inside double quotes PostgREST reads \x as x
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _coerce(raw: str, sample: Any) -> Any:
+    if isinstance(sample, bool):
+        return raw.lower() == "true"
+    if isinstance(sample, int):
+        try:
+            return int(raw)
+        except ValueError:
+            return float(raw)
+    if isinstance(sample, float):
+        return float(raw)
+    return raw
+
+
+def _like(value: Any, pattern: str, insensitive: bool) -> bool:
+    if value is None:
+        return False
+    regex = "^" + ".*".join(re.escape(p) for p in re.split(r"[*%]", pattern)) + "$"
+    return re.match(regex, str(value), re.IGNORECASE if insensitive else 0) is not None
+
+
+def _compare(row: Dict[str, Any], column: str, op: str, raw: str) -> bool:
+    negate = False
+    if op.startswith("not."):
+        negate, op = True, op[4:]
+    value = row.get(column)
+    if op == "is":
+        result = value is None if raw == "null" else value is (raw == "true")
+    elif op == "in":
+        options = [_unquote(v) for v in _split_top_level(raw.strip("()"))]
+        result = value is not None and any(value == _coerce(o, value) for o in options)
+    elif op in ("like", "ilike"):
+        result = _like(value, _unquote(raw), op == "ilike")
+    elif value is None:
+        result = False
+    else:
+        target = _coerce(_unquote(raw), value)
+        result = {
+            "eq": value == target,
+            "neq": value != target,
+            "gt": value > target,
+            "gte": value >= target,
+            "lt": value < target,
+            "lte": value <= target,
+        }[op]
+    return not result if negate else result
+
+
+def _every_row(row: Dict[str, Any]) -> bool:
+    return True
+
+
+def _check(column: str, op: str, raw: str) -> Callable[[Dict[str, Any]], bool]:
+    """Un filtro como función de la fila; las comparaciones simples convierten el valor una sola vez"""
+    if op not in _COMPARISONS:
+        return lambda row: _compare(row, column, op, raw)
+    compare, text, targets = _COMPARISONS[op], _unquote(raw), {}
+
+    def check(row):
+        value = row.get(column)
+        if value is None:
+            return False
+        kind = type(value)
+        if kind not in targets:
+            targets[kind] = _coerce(text, value)
+        return compare(value, targets[kind])
+    return check
+
+
+def _index_key(value: Any) -> str:
+    # Filter values arrive as text; booleans are spelled like PostgREST does
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _seek(keys: List[Any], bound: Any, descending: bool, inclusive: bool) -> int:
+    """Primera posición de ``keys`` (ordenadas) que cumple la cota del filtro"""
+    low, high = 0, len(keys)
+    while low < high:
+        middle = (low + high) // 2
+        key = keys[middle]
+        passed = key < bound if descending else key > bound
+        if passed or (inclusive and key == bound):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def _logic(row: Dict[str, Any], operator: str, body: str) -> bool:
+    results = []
+    for term in _split_top_level(body.strip()[1:-1]):
+        if term.startswith(("and(", "or(")):
+            name, _, rest = term.partition("(")
+            results.append(_logic(row, name, "(" + rest))
+            continue
+        column, op_value = term.split(".", 1)
+        op, _, raw = op_value.partition(".")
+        if op == "not":
+            inner, _, raw = raw.partition(".")
+            op = "not." + inner
+        results.append(_compare(row, column, op, raw))
+    return any(results) if operator == "or" else all(results)
+
+
+def _local(timestamp: str) -> datetime:
+    # TIMESTAMPTZ AT TIME ZONE 'UTC': the naive local time the backend wrote
+    return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def count_attendance(stub: "PostgrestStub", op: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+    """Trigger count_attendance() de access_events"""
+    if op != "INSERT" or new.get("type", "entry") != "entry":
+        return
+    local = _local(new["timestamp"])
+    stub.bump("attendance_hourly", {"hour": local.replace(minute=0, second=0, microsecond=0).isoformat()}, entries=1)
+    stub.bump("attendance_daily", {"day": local.date().isoformat()}, entries=1)
+    stub.bump("attendance_monthly", {"month": local.strftime("%Y-%m")}, entries=1)
+
+
+def count_dashboard(stub: "PostgrestStub", op: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+    """Trigger count_dashboard() de memberships"""
+    if op == "UPDATE":
+        if bool(new.get("active")) != bool(old.get("active")):
+            stub.bump("dashboard_counters", {"name": "active_users"}, value=1 if new.get("active") else -1)
+        return
+    sign, row = (1, new) if op == "INSERT" else (-1, old)
+    stub.bump("dashboard_counters", {"name": "total_users"}, value=sign)
+    if row.get("active"):
+        stub.bump("dashboard_counters", {"name": "active_users"}, value=sign)
+
+
+def count_classes(stub: "PostgrestStub", op: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+    """Trigger count_dashboard() de classes"""
+    if op != "UPDATE":
+        stub.bump("dashboard_counters", {"name": "total_classes"}, value=1 if op == "INSERT" else -1)
+
+
+def add_revenue(stub: "PostgrestStub", params: Dict[str, Any]):
+    """Función add_revenue del README"""
+    series = {"payment_method": params["p_payment_method"], "status": params["p_status"]}
+    stub.bump("revenue_daily", {"day": params["p_day"], **series}, cents=params["p_cents"], payments=1)
+    stub.bump("revenue_monthly", {"month": params["p_day"][:7], **series}, cents=params["p_cents"], payments=1)
+
+
+def backfill_revenue(stub: "PostgrestStub", payment: Dict[str, Any]):
+    """Backfill de revenue_daily y revenue_monthly del README, un pago"""
+    cents = int((Decimal(str(payment["amount"])) * 100).to_integral_value(ROUND_HALF_UP))
+    add_revenue(stub, {
+        "p_day": _local(payment["created_at"]).date().isoformat(),
+        "p_payment_method": payment["payment_method"],
+        "p_status": payment["status"],
+        "p_cents": cents
+    })
+
+
+class PostgrestStub:
+    """Base de datos en memoria con la superficie HTTP de PostgREST."""
+
+    def __init__(self, latency: float = 0.0):
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.rpc: Dict[str, Callable[["PostgrestStub", Dict[str, Any]], Any]] = {"add_revenue": add_revenue}
+        self.latency = latency
+        self.bytes_sent: Dict[str, int] = defaultdict(int)
+        self.requests: Dict[str, int] = defaultdict(int)
+        self._serial: Dict[str, int] = defaultdict(int)
+        self.indexes: Dict[str, set] = defaultdict(set)
+        # (table, column) -> rows by value; (table, order) -> sorted rows
+        self._lookups: Dict[tuple, Dict[str, List[Dict[str, Any]]]] = {}
+        self._orders: Dict[tuple, tuple] = {}
+        # table -> functions(stub, op, old, new) run after each row write
+        self.triggers: Dict[str, List[Callable]] = {
+            "access_events": [count_attendance],
+            "memberships": [count_dashboard],
+            "classes": [count_classes]
+        }
+        # table -> functions(stub, row) run only for seeded rows
+        self.on_seed: Dict[str, List[Callable]] = {"payments": [backfill_revenue]}
+        self._summaries: Dict[str, Dict[tuple, Dict[str, Any]]] = defaultdict(dict)
+        self._touched: set = set()
+        # dashboard_counters starts with its three rows, as after the README setup
+        for name in ("total_users", "active_users", "total_classes"):
+            self.bump("dashboard_counters", {"name": name}, value=0)
+        self._touched.clear()
+        self.lock = threading.Lock()
+        self.app = Starlette(routes=[
+            Route("/rest/v1/rpc/{name}", self._handle_rpc, methods=["GET", "POST"]),
+            Route("/rest/v1/{table}", self._handle_table,
+                  methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+        ])
+        self.server: Optional[uvicorn.Server] = None
+        self.url = ""
+
+    # Seeding helpers
+    def seed(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        with self.lock:
+            for row in rows:
+                self._prepare(table, row)
+            self.tables[table].extend(rows)
+            self.invalidate(table)
+            for row in rows:
+                self._fire(table, "INSERT", None, row)
+                for backfill in self.on_seed.get(table, ()):
+                    backfill(self, row)
+            self._flush_touched()
+
+    # Trigger helpers
+    def bump(self, table: str, key: Dict[str, Any], **amounts: float) -> None:
+        """Sumar ``amounts`` a las columnas de la fila de ``table`` con esa clave, creándola a 0"""
+        summary = self._summaries[table]
+        index = tuple(key.items())
+        row = summary.get(index)
+        if row is None:
+            row = summary[index] = {**key, **{column: 0 for column in amounts}}
+            self.tables[table].append(row)
+        for column, amount in amounts.items():
+            row[column] += amount
+        self._touched.add(table)
+
+    def _fire(self, table: str, op: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        for trigger in self.triggers.get(table, ()):
+            trigger(self, op, old, new)
+
+    def _flush_touched(self) -> None:
+        for table in self._touched:
+            self.invalidate(table)
+        self._touched.clear()
+
+    def create_index(self, table: str, *columns: str) -> None:
+        """Indexar columnas de una tabla.
+
+        Los índices se mantienen en las escrituras HTTP; una función de
+        ``rpc`` que modifique in situ una columna indexada debe llamar a
+        ``invalidate``.
+        """
+        with self.lock:
+            self.indexes[table].update(columns)
+            self.invalidate(table)
+
+    def invalidate(self, table: str, columns: Optional[List[str]] = None) -> None:
+        """Descartar los índices de ``table`` que dependen de ``columns`` (todos si None)"""
+        def stale(key_columns):
+            return columns is None or any(column in columns for column in key_columns)
+
+        self._lookups = {
+            key: index for key, index in self._lookups.items() if key[0] != table or not stale([key[1]])
+        }
+        self._orders = {
+            key: order for key, order in self._orders.items() if key[0] != table or not stale(order[3])
+        }
+
+    def reset_counters(self) -> None:
+        self.bytes_sent.clear()
+        self.requests.clear()
+
+    def _prepare(self, table: str, row: Dict[str, Any]) -> None:
+        if table in SERIAL_TABLES and "id" not in row:
+            self._serial[table] += 1
+            row["id"] = self._serial[table]
+        elif PRIMARY_KEYS.get(table, "id") == "id" and "id" not in row:
+            row["id"] = str(uuid.uuid4())
+
+    # Query evaluation
+    @staticmethod
+    def _filter(params) -> Callable[[Dict[str, Any]], bool]:
+        """Filtros de la consulta, analizados una vez para todas las filas"""
+        checks = []
+        for key, raw in params.multi_items():
+            if key in _RESERVED_PARAMS:
+                continue
+            if key in ("or", "and"):
+                checks.append(lambda row, key=key, raw=raw: _logic(row, key, raw))
+                continue
+            op, _, value = raw.partition(".")
+            if op == "not":
+                inner, _, value = value.partition(".")
+                op = "not." + inner
+            if op.split(".")[-1] not in _FILTER_OPS:
+                continue
+            checks.append(_check(key, op, value))
+        if not checks:
+            return _every_row
+        if len(checks) == 1:
+            return checks[0]
+        return lambda row: all(check(row) for check in checks)
+
+    def _candidates(self, table: str, params) -> List[Dict[str, Any]]:
+        """Filas que pueden cumplir los filtros: las del índice si hay un eq/in indexado"""
+        for column in self.indexes.get(table, ()):
+            for raw in params.getlist(column):
+                op, _, value = raw.partition(".")
+                if op == "eq":
+                    keys = [_unquote(value)]
+                elif op == "in":
+                    keys = [_unquote(v) for v in _split_top_level(value.strip("()"))]
+                else:
+                    continue
+                index = self._index(table, column)
+                return [row for key in dict.fromkeys(keys) for row in index.get(key, ())]
+        return self.tables[table]
+
+    def _index(self, table: str, column: str) -> Dict[str, List[Dict[str, Any]]]:
+        index = self._lookups.get((table, column))
+        if index is None:
+            index = {}
+            for row in self.tables[table]:
+                if row.get(column) is not None:
+                    index.setdefault(_index_key(row[column]), []).append(row)
+            self._lookups[(table, column)] = index
+        return index
+
+    def find(self, table: str, column: str, value: Any) -> List[Dict[str, Any]]:
+        """Filas con ``column = value``, por el índice si la columna lo tiene"""
+        if column in self.indexes.get(table, ()):
+            return list(self._index(table, column).get(_index_key(value), ()))
+        return [row for row in self.tables[table] if row.get(column) == value]
+
+    def _sorted(self, table: str, order: str):
+        """Filas de ``table`` en el orden pedido, si todas sus columnas están indexadas"""
+        columns = [term.split(".")[0] for term in order.split(",")]
+        if not all(column in self.indexes.get(table, ()) for column in columns):
+            return None
+        cached = self._orders.get((table, order))
+        if cached is None:
+            rows = self._order(self.tables[table], order)
+            first = columns[0]
+            # Rows without a value sort last; only the prefix with one is seekable
+            keys = [row[first] for row in rows if row.get(first) is not None]
+            descending = "desc" in order.split(",")[0].split(".")[1:]
+            cached = self._orders[(table, order)] = (rows, keys, descending, columns)
+        return cached
+
+    def _start(self, ordered, params) -> int:
+        """Saltar las filas que un filtro gt/lt sobre la primera columna descarta"""
+        rows, keys, descending, columns = ordered
+        if not keys:
+            return 0
+        for raw in params.getlist(columns[0]):
+            op, _, value = raw.partition(".")
+            if op in (("lt", "lte") if descending else ("gt", "gte")):
+                return _seek(keys, _coerce(_unquote(value), keys[0]), descending, op.endswith("e"))
+        return 0
+
+    @staticmethod
+    def _order(rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+        if not order:
+            return rows
+        for term in reversed(order.split(",")):
+            column, *modifiers = term.split(".")
+            descending = "desc" in modifiers
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: r[column], reverse=descending)
+            rows = present + missing
+        return rows
+
+    @staticmethod
+    def _project(rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+        if not select or select == "*":
+            return rows
+        columns = [c.split(":")[-1] for c in select.split(",") if c]
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    def _respond(self, request: Request, payload: Any, status: int = 200,
+                 headers: Optional[Dict[str, str]] = None) -> Response:
+        minimal = "return=minimal" in request.headers.get("prefer", "")
+        if request.method == "HEAD" or minimal:
+            body = b""
+        else:
+            body = json.dumps(payload, default=str).encode()
+        key = f"{request.method} {request.url.path}"
+        self.bytes_sent[key] += len(body)
+        self.requests[key] += 1
+        return Response(body, status_code=status, headers=headers or {},
+                        media_type="application/json")
+
+    def _read(self, request: Request, rows: List[Dict[str, Any]], table: Optional[str] = None) -> Response:
+        params = request.query_params
+        matches, order = self._filter(params), params.get("order")
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        if "range" in request.headers:
+            start, _, end = request.headers["range"].partition("-")
+            offset, limit = int(start), int(end) - int(start) + 1
+        counted = "count=" in request.headers.get("prefer", "")
+        ordered = self._sorted(table, order) if table and order and rows is self.tables[table] else None
+        if ordered is not None and matches is _every_row:
+            matched = ordered[0][self._start(ordered, params):]
+        elif ordered is not None:
+            # Already in order: stop at the end of the page unless a count was asked for
+            wanted = None if counted or limit is None else offset + int(limit)
+            matched = []
+            for position in range(self._start(ordered, params), len(ordered[0])):
+                row = ordered[0][position]
+                if matches(row):
+                    matched.append(row)
+                    if wanted is not None and len(matched) >= wanted:
+                        break
+        else:
+            matched = self._order([r for r in rows if matches(r)], order)
+        total = len(matched)
+        page = matched[offset:offset + int(limit)] if limit is not None else matched[offset:]
+        headers = {}
+        if counted:
+            last = offset + len(page) - 1
+            headers["content-range"] = f"{offset}-{last}/{total}" if page else f"*/{total}"
+        payload = self._project(page, params.get("select"))
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            payload = payload[0] if payload else None
+        return self._respond(request, payload, headers=headers)
+
+    async def _handle_table(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        table = request.path_params["table"]
+        params = request.query_params
+        prefer = request.headers.get("prefer", "")
+        method = request.method
+        if method in ("POST", "PATCH"):
+            body = await request.json()
+        with self.lock:
+            rows = self.tables[table]
+            if method in ("GET", "HEAD"):
+                return self._read(request, self._candidates(table, params), table)
+            if method == "POST":
+                incoming = body if isinstance(body, list) else [body]
+                conflict = params.get("on_conflict") or PRIMARY_KEYS.get(table, "id")
+                keys = conflict.split(",")
+                created = []
+                # Index the conflict columns once so bulk upserts stay linear
+                index = {tuple(r.get(k) for k in keys): r for r in rows} if "resolution=" in prefer else {}
+                for row in incoming:
+                    row = dict(row)
+                    existing = None
+                    if "resolution=" in prefer and all(k in row for k in keys):
+                        existing = index.get(tuple(row[k] for k in keys))
+                    if existing is not None:
+                        if "ignore-duplicates" in prefer:
+                            continue
+                        before = dict(existing)
+                        existing.update(row)
+                        created.append(existing)
+                        self._fire(table, "UPDATE", before, existing)
+                        continue
+                    self._prepare(table, row)
+                    rows.append(row)
+                    if "resolution=" in prefer:
+                        index[tuple(row.get(k) for k in keys)] = row
+                    created.append(row)
+                    self._fire(table, "INSERT", None, row)
+                self.invalidate(table)
+                self._flush_touched()
+                return self._respond(request, created, status=201)
+            matches = self._filter(params)
+            if method == "PATCH":
+                updated = [row for row in self._candidates(table, params) if matches(row)]
+                for row in updated:
+                    before = dict(row)
+                    row.update(body)
+                    self._fire(table, "UPDATE", before, row)
+                self.invalidate(table, list(body))
+                self._flush_touched()
+                return self._respond(request, self._project(updated, params.get("select")))
+            deleted = [r for r in self._candidates(table, params) if matches(r)]
+            removed = {id(r) for r in deleted}
+            self.tables[table] = [r for r in rows if id(r) not in removed]
+            self.invalidate(table)
+            for row in deleted:
+                self._fire(table, "DELETE", row, None)
+            self._flush_touched()
+            return self._respond(request, self._project(deleted, params.get("select")))
+
+    async def _handle_rpc(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        name = request.path_params["name"]
+        if name not in self.rpc:
+            error = {"code": "PGRST202", "message": f"Could not find the function public.{name}",
+                     "details": None, "hint": None}
+            return self._respond(request, error, status=404)
+        params = await request.json() if request.method == "POST" else dict(request.query_params)
+        with self.lock:
+            try:
+                result = self.rpc[name](self, params)
+            except FunctionError as e:
+                error = {"code": e.code, "message": e.message, "details": None, "hint": None}
+                return self._respond(request, error, status=e.status)
+            finally:
+                self._flush_touched()
+            # Set-returning functions accept the same filters as a table read
+            if isinstance(result, list):
+                return self._read(request, result)
+        return self._respond(request, result)
+
+    # Server lifecycle
+    def start(self) -> str:
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        threading.Thread(target=self.server.run, daemon=True).start()
+        while not self.server.started:
+            time.sleep(0.01)
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.should_exit = True
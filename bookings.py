@@ -0,0 +1,143 @@
+"""
+Reservas de clases con aforo y lista de espera.
+
+Las plazas se cuentan en la propia fila de ``classes`` (``booked_count`` y
+``waitlist_count``) y las funciones ``book_class`` y ``cancel_booking`` de la
+base de datos las modifican bajo el bloqueo de esa fila: dos reservas
+simultáneas de la misma clase se aplican una detrás de otra, sin leer y
+después escribir desde el backend, así que nunca se supera ``capacity``
+aunque haya varios workers. Quien llega con la clase llena entra en la lista
+de espera (orden FIFO por id) y, al cancelarse una plaza, la función asciende
+al primero de la lista en la misma transacción.
+
+La ocupación se lee de esos contadores, sin recorrer las reservas.
+"""
+from typing import Any, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from queries import projection
+
+BOOKINGS_TABLE = "class_bookings"
+STATUSES = ("booked", "waitlisted", "cancelled")
+
+
+class BookingError(Exception):
+    """Error de reserva con el código HTTP que le corresponde"""
+
+    status_code = 400
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class ClassNotFound(BookingError):
+    status_code = 404
+
+
+class AlreadyBooked(BookingError):
+    status_code = 409
+
+
+class BookingUnavailable(BookingError):
+    status_code = 503
+
+
+def _translate(error: APIError) -> BookingError:
+    # P0002: raised by the functions when the class doesn't exist;
+    # 23505: the card already holds a booking or waitlist spot in it;
+    # PGRST202: the functions aren't installed (see README)
+    if error.code == "P0002":
+        return ClassNotFound("Clase no encontrada")
+    if error.code == "23505":
+        return AlreadyBooked("El miembro ya tiene una reserva en esta clase")
+    if error.code == "PGRST202":
+        return BookingUnavailable("Reservas no disponibles: faltan las funciones book_class y cancel_booking")
+    return BookingError(error.message or str(error))
+
+
+async def book(db, class_id: str, card_id: str) -> Dict[str, Any]:
+    """Reservar plaza o, si la clase está llena, entrar en la lista de espera"""
+    try:
+        response = await db.execute(db.rpc("book_class", {"p_class_id": class_id, "p_card_id": card_id}))
+    except APIError as e:
+        raise _translate(e)
+    return response.data[0]
+
+
+async def cancel(db, class_id: str, card_id: str) -> Optional[Dict[str, Any]]:
+    """Cancelar la reserva o el puesto en espera; None si no había ninguno.
+
+    Devuelve ``{"cancelled": reserva, "promoted": reserva ascendida o None}``.
+    """
+    try:
+        response = await db.execute(db.rpc("cancel_booking", {"p_class_id": class_id, "p_card_id": card_id}))
+    except APIError as e:
+        raise _translate(e)
+    # The function returns the cancelled row plus the promoted one, if any
+    rows = response.data or []
+    cancelled = next((row for row in rows if row["status"] == "cancelled"), None)
+    if cancelled is None:
+        return None
+    return {"cancelled": cancelled, "promoted": next((row for row in rows if row["status"] == "booked"), None)}
+
+
+def occupancy(row: Dict[str, Any]) -> Dict[str, Any]:
+    capacity = row.get("capacity") or 0
+    booked = row.get("booked_count") or 0
+    return {
+        "class_id": row["id"],
+        "capacity": capacity,
+        "booked": booked,
+        "available": max(capacity - booked, 0),
+        "waitlisted": row.get("waitlist_count") or 0
+    }
+
+
+async def get_occupancy(db, class_id: str) -> Dict[str, Any]:
+    response = await db.execute(db.table("classes").select(projection("bookings.occupancy")).eq("id", class_id))
+    if not response.data:
+        raise ClassNotFound("Clase no encontrada")
+    return occupancy(response.data[0])
+
+
+async def get_booking(db, class_id: str, card_id: str) -> Optional[Dict[str, Any]]:
+    """Reserva vigente de un miembro, con su puesto si está en espera"""
+    response = await db.execute(
+        db.table(BOOKINGS_TABLE)
+        .select(projection("bookings.list"))
+        .eq("class_id", class_id)
+        .eq("card_id", card_id)
+        .neq("status", "cancelled")
+    )
+    if not response.data:
+        return None
+    booking = response.data[0]
+    if booking["status"] == "waitlisted":
+        # Counts only the waiting rows ahead, through the waitlist index
+        ahead = await db.execute(
+            db.table(BOOKINGS_TABLE)
+            .select("id", count="exact")
+            .eq("class_id", class_id)
+            .eq("status", "waitlisted")
+            .lt("id", booking["id"])
+            .limit(1)
+        )
+        booking["position"] = (ahead.count or 0) + 1
+    return booking
+
+
+async def list_bookings(db, class_id: str, status: str, after: Optional[int] = None,
+                        limit: int = 100) -> List[Dict[str, Any]]:
+    """Reservas de una clase por orden de llegada (la lista de espera, en su orden)"""
+    query = (
+        db.table(BOOKINGS_TABLE)
+        .select(projection("bookings.list"))
+        .eq("class_id", class_id)
+        .eq("status", status)
+    )
+    if after is not None:
+        query = query.gt("id", after)
+    response = await db.execute(query.order("id").limit(limit))
+    return response.data or []
@@ -0,0 +1,83 @@
+"""
+Caché en memoria de la tabla config.
+
+La configuración (nombre del gimnasio, colores, logo) se pide en casi todas
+las páginas y cambia muy de vez en cuando. Se carga al arrancar, se recarga
+en ``POST /config`` y se sirve con un ETag para que el navegador reciba 304
+sin cuerpo. Los demás workers detectan el cambio comparando cada pocos
+segundos el ``updated_at`` más reciente de la tabla, una consulta de una fila.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from queries import projection
+
+
+class ConfigCache:
+    """Diccionario key -> value, su ETag y la versión (máximo updated_at)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.config: Dict[str, Any] = {}
+        self.etag: Optional[str] = None
+        self.version: Optional[str] = None
+        self.checked_at = 0.0
+        self.loads = 0
+        self.checks = 0
+
+    def replace(self, rows):
+        config = {row["key"]: row["value"] for row in rows}
+        version = max((row.get("updated_at") or "" for row in rows), default="")
+        body = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+        etag = '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+        with self._lock:
+            self.config = config
+            self.etag = etag
+            self.version = version
+            self.checked_at = time.monotonic()
+            self.loaded = True
+            self.loads += 1
+
+    def needs_check(self, interval: float) -> bool:
+        return time.monotonic() - self.checked_at >= interval
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Si el ETag que envía el cliente sigue siendo el actual"""
+        if not if_none_match or self.etag is None:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        # Weak comparison: W/"x" matches "x"
+        return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "keys": len(self.config),
+            "etag": self.etag,
+            "version": self.version,
+            "loads": self.loads,
+            "version_checks": self.checks
+        }
+
+
+async def load(db, cache: ConfigCache) -> ConfigCache:
+    response = await db.execute(db.table("config").select(projection("config.list")))
+    cache.replace(response.data or [])
+    return cache
+
+
+async def refresh_if_changed(db, cache: ConfigCache) -> ConfigCache:
+    """Recargar solo si otro worker cambió la tabla desde la última carga"""
+    response = await db.execute(
+        db.table("config").select("updated_at").order("updated_at", desc=True).limit(1)
+    )
+    cache.checks += 1
+    latest = (response.data[0].get("updated_at") or "") if response.data else ""
+    if latest != cache.version:
+        return await load(db, cache)
+    cache.checked_at = time.monotonic()
+    return cache
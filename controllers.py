@@ -0,0 +1,133 @@
+"""
+Canal WebSocket persistente para los controladores de torniquete.
+
+Cada controlador se autentica una vez y luego envía tarjetas y recibe
+decisiones por la misma conexión. ``ControllerHub`` lleva las conexiones
+abiertas, limita la tasa por dispositivo y empuja a todas las conexiones
+las tarjetas revocadas para que las quiten de su lista local.
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set
+
+
+class TokenBucket:
+    """Límite de tasa: ``rate`` peticiones por segundo con ráfagas de ``burst``"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consumir un token; devuelve 0 si se permitió o los segundos a esperar"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refilled(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class ControllerConnection:
+    """Cola de mensajes salientes de una conexión"""
+
+    def __init__(self, device_id: str, max_queue: int = 256):
+        self.device_id = device_id
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def push(self, message: Dict[str, Any]) -> bool:
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+
+class ControllerHub:
+    """Conexiones abiertas por dispositivo, límites de tasa y difusión de revocaciones"""
+
+    def __init__(self, rate: float = 5.0, burst: int = 20):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._connections: Dict[str, Set[ControllerConnection]] = defaultdict(set)
+        # Per device, so reconnecting doesn't reset the budget; dropped once
+        # the device is gone and its bucket has refilled
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.rate_limited = 0
+        self.revocations_pushed = 0
+        self.dropped = 0
+
+    def connect(self, device_id: str) -> ControllerConnection:
+        connection = ControllerConnection(device_id)
+        with self._lock:
+            self._connections[device_id].add(connection)
+            self._buckets.setdefault(device_id, TokenBucket(self.rate, self.burst))
+        return connection
+
+    def disconnect(self, connection: ControllerConnection):
+        connection.closed = True
+        with self._lock:
+            connections = self._connections.get(connection.device_id)
+            if connections is not None:
+                connections.discard(connection)
+                if not connections:
+                    del self._connections[connection.device_id]
+            now = time.monotonic()
+            for device_id in [d for d, b in self._buckets.items() if d not in self._connections and b.refilled(now)]:
+                del self._buckets[device_id]
+
+    def throttle(self, device_id: str) -> float:
+        with self._lock:
+            wait = self._buckets.setdefault(device_id, TokenBucket(self.rate, self.burst)).take()
+            if wait:
+                self.rate_limited += 1
+        return wait
+
+    def _all(self) -> List[ControllerConnection]:
+        with self._lock:
+            return [c for connections in self._connections.values() for c in connections]
+
+    def revoke(self, card_ids: Iterable[str]):
+        """Avisar a todos los controladores de que quiten estas tarjetas"""
+        card_ids = sorted(set(card_ids))
+        if not card_ids:
+            return
+        message = {"type": "revoke", "card_ids": card_ids}
+        for connection in self._all():
+            if connection.push(message):
+                self.revocations_pushed += 1
+            else:
+                self.dropped += 1
+
+    def kick(self, device_id: str, reason: str = "revoked"):
+        """Cerrar todas las conexiones de un dispositivo"""
+        with self._lock:
+            connections = list(self._connections.get(device_id, ()))
+        for connection in connections:
+            connection.push({"type": "close", "reason": reason})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            devices = len(self._connections)
+            connections = sum(len(c) for c in self._connections.values())
+            buckets = len(self._buckets)
+        return {
+            "devices": devices,
+            "rate_buckets": buckets,
+            "connections": connections,
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "rate_limited": self.rate_limited,
+            "revocations_pushed": self.revocations_pushed,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,84 @@
+"""
+Capa de acceso a datos asíncrona sobre la API REST de Supabase (PostgREST).
+
+Usa un único ``httpx.AsyncClient`` con pool de conexiones keep-alive
+(HTTP/2 cuando el servidor lo negocia) compartido por todas las peticiones,
+así los endpoints ``async def`` no ocupan un hilo mientras esperan a la red.
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+
+
+class Database:
+    """Cliente PostgREST asíncrono con límites de pool y timeouts configurables"""
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        *,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        observer=None
+    ):
+        self.rest_url = f"{url}/rest/v1"
+        self.headers = {
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        }
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2
+        self.timeout = timeout
+        self.http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        # Optional telemetry.DatabaseMetrics: httpx hooks plus failures without a response
+        self.observer = observer
+        self._http: Optional[httpx.AsyncClient] = None
+        self._client: Optional[AsyncPostgrestClient] = None
+
+    def connect(self) -> AsyncPostgrestClient:
+        if self._client is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.rest_url,
+                headers=self.headers,
+                limits=self.limits,
+                timeout=self.http_timeout,
+                http2=self.http2,
+                follow_redirects=True,
+                event_hooks=self.observer.event_hooks() if self.observer is not None else None
+            )
+            self._client = AsyncPostgrestClient(self.rest_url, headers=self.headers, http_client=self._http)
+        return self._client
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._client = None
+
+    def table(self, name: str):
+        return self.connect().from_(name)
+
+    def rpc(self, function: str, params: Dict[str, Any], **options):
+        return self.connect().rpc(function, params, **options)
+
+    async def execute(self, query, timeout: Optional[float] = None):
+        """Ejecutar una consulta con un timeout total por llamada"""
+        try:
+            return await asyncio.wait_for(query.execute(), timeout or self.timeout)
+        except (asyncio.TimeoutError, httpx.HTTPError) as e:
+            if self.observer is not None:
+                self.observer.on_error(getattr(query, "path", ""), e)
+            raise
@@ -0,0 +1,183 @@
+"""
+Barrido periódico de membresías vencidas y cola de avisos de renovación.
+
+Cada ``interval`` segundos se desactivan por lotes los miembros con
+``active`` y ``expiration_date`` ya pasada (el índice parcial sobre
+expiration_date hace que cada lote lea solo filas vencidas), así ``active``
+refleja el vencimiento y los contadores del dashboard no necesitan
+recalcularse. En la misma pasada se encola un aviso en
+``renewal_reminders`` para quien vence en los próximos ``reminder_days``
+días; la restricción única (card_id, expiration_date) evita duplicados
+entre pasadas y entre workers.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from postgrest.types import ReturnMethod
+
+from pagination import apply_keyset, order_keyset
+from queries import projection, returning
+
+REMINDERS_TABLE = "renewal_reminders"
+REMINDER_KEYSET = ("expiration_date", "card_id")
+
+
+def parse_expiration(value: Optional[str]) -> Optional[datetime]:
+    """expiration_date como datetime sin zona; None si falta o no se entiende"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+async def deactivate_expired(db, now: datetime, batch_size: int = 500,
+                             on_expired: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Desactivar las membresías vencidas; devuelve las filas actualizadas"""
+    deactivated = []
+    cutoff = now.isoformat()
+    while True:
+        response = await db.execute(
+            db.table("memberships")
+            .select(projection("expiry.lapsed"))
+            .eq("active", True)
+            .lt("expiration_date", cutoff)
+            .order("expiration_date")
+            .limit(batch_size)
+        )
+        card_ids = [row["card_id"] for row in response.data or []]
+        if not card_ids:
+            break
+        # The filters are repeated so a renewal made in between is kept
+        result = await db.execute(returning(
+            db.table("memberships")
+            .update({"active": False, "updated_at": now.isoformat()})
+            .in_("card_id", card_ids)
+            .eq("active", True)
+            .lt("expiration_date", cutoff),
+            "expiry.deactivated"
+        ))
+        for row in result.data or []:
+            if on_expired is not None:
+                on_expired(row)
+            deactivated.append(row)
+        if len(card_ids) < batch_size or not result.data:
+            break
+    return deactivated
+
+
+async def queue_reminders(db, now: datetime, days: int, batch_size: int = 500) -> int:
+    """Encolar avisos para quien vence en los próximos ``days`` días"""
+    queued = 0
+    after = None
+    while True:
+        query = (
+            db.table("memberships")
+            .select(projection("expiry.reminders"))
+            .eq("active", True)
+            .gte("expiration_date", now.isoformat())
+            .lt("expiration_date", (now + timedelta(days=days)).isoformat())
+        )
+        if after is not None:
+            query = apply_keyset(query, after, REMINDER_KEYSET, descending=False)
+        rows = (await db.execute(order_keyset(query, REMINDER_KEYSET, descending=False).limit(batch_size))).data or []
+        if not rows:
+            break
+        response = await db.execute(db.table(REMINDERS_TABLE).upsert(
+            [
+                {
+                    "card_id": row["card_id"],
+                    "name": row.get("name"),
+                    "email": row.get("email"),
+                    "expiration_date": row["expiration_date"]
+                }
+                for row in rows
+            ],
+            on_conflict="card_id,expiration_date",
+            ignore_duplicates=True,
+            returning=ReturnMethod.representation
+        ))
+        queued += len(response.data or [])
+        if len(rows) < batch_size:
+            break
+        after = [rows[-1][column] for column in REMINDER_KEYSET]
+    return queued
+
+
+class ExpirySweeper:
+    """Pasadas periódicas de vencimiento y sus contadores"""
+
+    def __init__(self, interval: float = 300, batch_size: int = 500, reminder_days: int = 7):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reminder_days = reminder_days
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_seconds = 0.0
+        self.last_deactivated = 0
+        self.last_reminders = 0
+        self.deactivated = 0
+        self.reminders = 0
+
+    async def run_once(self, db, on_expired: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """Una pasada completa; ``on_expired`` recibe cada fila desactivada"""
+        started, now = time.monotonic(), datetime.now()
+        try:
+            expired = await deactivate_expired(db, now, self.batch_size, on_expired)
+            reminders = await queue_reminders(db, now, self.reminder_days, self.batch_size) if self.reminder_days > 0 else 0
+        except Exception as e:
+            self.failures += 1
+            self.last_error = getattr(e, "message", None) or str(e)
+            raise
+        self.runs += 1
+        self.last_run_at = now
+        self.last_run_seconds = time.monotonic() - started
+        self.last_deactivated = len(expired)
+        self.last_reminders = reminders
+        self.deactivated += len(expired)
+        self.reminders += reminders
+        return {"deactivated": [row["card_id"] for row in expired], "reminders_queued": reminders}
+
+    async def run(self, job: Callable[[], Awaitable]):
+        while True:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Counted in stats(); the next pass retries
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self, job: Callable[[], Awaitable]):
+        if self.interval > 0:
+            self._task = asyncio.ensure_future(self.run(job))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+            "last_deactivated": self.last_deactivated,
+            "last_reminders": self.last_reminders,
+            "deactivated": self.deactivated,
+            "reminders": self.reminders
+        }
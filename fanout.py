@@ -0,0 +1,92 @@
+"""
+Lecturas independientes en paralelo con un plazo común.
+
+``fanout`` lanza varias corrutinas a la vez y espera como mucho ``deadline``
+segundos: la latencia del endpoint pasa a ser la de la consulta más lenta y
+no la suma de todas. Lo que falla o no llega a tiempo se devuelve aparte
+para que el endpoint responda con datos parciales en lugar de un 500.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class FanoutError(Exception):
+    """Alguna de las lecturas de un fan-out obligatorio falló"""
+
+    def __init__(self, failed: Dict[str, str]):
+        super().__init__(", ".join(f"{name}: {reason}" for name, reason in failed.items()))
+        self.failed = failed
+
+
+class FanoutResult:
+    """Resultados por nombre y motivo de fallo de las lecturas que faltan"""
+
+    def __init__(self, results: Dict[str, Any], failed: Dict[str, str]):
+        self.results = results
+        self.failed = failed
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.failed)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+    def check(self) -> "FanoutResult":
+        if self.failed:
+            raise FanoutError(self.failed)
+        return self
+
+
+def _consume(task: asyncio.Future):
+    # Stragglers left running must not log "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def fanout(calls: Dict[str, Awaitable], deadline: Optional[float] = None,
+                 cancel: bool = True) -> FanoutResult:
+    """Ejecutar ``calls`` en paralelo.
+
+    Con ``cancel=False`` las lecturas que no terminan a tiempo siguen
+    corriendo en segundo plano (útil para cargas que rellenan una caché).
+    """
+    tasks = {name: asyncio.ensure_future(call) for name, call in calls.items()}
+    if not tasks:
+        return FanoutResult({}, {})
+    _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results, failed = {}, {}
+    for name, task in tasks.items():
+        if task in pending:
+            failed[name] = "timeout"
+            if cancel:
+                task.cancel()
+            task.add_done_callback(_consume)
+        elif task.cancelled():
+            failed[name] = "cancelled"
+        elif task.exception() is not None:
+            error = task.exception()
+            failed[name] = str(error) or type(error).__name__
+        else:
+            results[name] = task.result()
+    return FanoutResult(results, failed)
+
+
+class SingleFlight:
+    """Comparte una misma tarea entre peticiones concurrentes con la misma clave"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def run(self, key: str, factory: Callable[[], Awaitable]) -> asyncio.Task:
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+
+            def forget(done: asyncio.Task):
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+            task.add_done_callback(forget)
+        return task
@@ -15,7 +15,7 @@ const ClassesPage = () => {
     const token = localStorage.getItem('token');
     
     try {
-      const response = await fetch('http://127.0.0.1:8000/classes', {
+      const response = await fetch('http://127.0.0.1:8000/classes?limit=200', {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -23,7 +23,7 @@ const ClassesPage = () => {
 
       if (response.ok) {
         const data = await response.json();
-        setClasses(data);
+        setClasses(data.classes);
       } else {
         toast.error('Error al cargar clases');
       }
@@ -155,7 +155,8 @@ const ClassesPage = () => {
                     <div className="flex items-center">
                       <FiUsers className={`mr-2 h-4 w-4 ${theme === 'dark' ? 'text-gray-400' : 'text-gray-500'}`} />
                       <span className={`text-sm ${theme === 'dark' ? 'text-gray-300' : 'text-gray-600'}`}>
-                        Capacidad: {classItem.capacity} personas
+                        Reservas: {classItem.booked_count ?? 0}/{classItem.capacity} personas
+                        {classItem.waitlist_count > 0 && ` · ${classItem.waitlist_count} en espera`}
                       </span>
                     </div>
                     
@@ -10,13 +10,19 @@ const PaymentsPage = () => {
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [statusFilter, setStatusFilter] = useState('all');
+  const [totalPayments, setTotalPayments] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
 
-  const fetchPayments = async () => {
+  // Newest first, one page at a time; "Cargar más" continues from the cursor
+  const fetchPayments = async (cursor = null) => {
     setLoading(true);
     const token = localStorage.getItem('token');
+    const params = new URLSearchParams({ limit: '100' });
+    if (statusFilter !== 'all') params.set('status', statusFilter);
+    if (cursor) params.set('cursor', cursor);
     
     try {
-      const response = await fetch('http://127.0.0.1:8000/payments', {
+      const response = await fetch(`http://127.0.0.1:8000/payments?${params}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -24,7 +30,10 @@ const PaymentsPage = () => {
 
       if (response.ok) {
         const data = await response.json();
-        setPayments(data);
+        setPayments(cursor ? (prev) => [...prev, ...data.payments] : data.payments);
+        // Cursor pages don't count rows; the total comes from the first page
+        if (!cursor) setTotalPayments(data.total ?? 0);
+        setNextCursor(data.next_cursor);
       } else {
         toast.error('Error al cargar pagos');
       }
@@ -37,7 +46,7 @@ const PaymentsPage = () => {
 
   useEffect(() => {
     fetchPayments();
-  }, []);
+  }, [statusFilter]);
 
   const handleSubmit = async (formData) => {
     const token = localStorage.getItem('token');
@@ -65,10 +74,8 @@ const PaymentsPage = () => {
   };
 
   const filteredPayments = payments.filter(payment => {
-    const matchesSearch = payment.user_id?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         payment.description?.toLowerCase().includes(searchTerm.toLowerCase());
-    const matchesStatus = statusFilter === 'all' || payment.status === statusFilter;
-    return matchesSearch && matchesStatus;
+    return payment.user_id?.toLowerCase().includes(searchTerm.toLowerCase()) ||
+           payment.description?.toLowerCase().includes(searchTerm.toLowerCase());
   });
 
   const totalAmount = filteredPayments.reduce((sum, payment) => sum + (payment.amount || 0), 0);
@@ -134,7 +141,7 @@ const PaymentsPage = () => {
               Total de Pagos
             </h3>
             <p className={`text-2xl font-semibold ${theme === 'dark' ? 'text-white' : 'text-gray-900'}`}>
-              {filteredPayments.length}
+              {searchTerm ? filteredPayments.length : totalPayments}
             </p>
           </div>
           <div className={`p-6 rounded-lg shadow-sm ${theme === 'dark' ? 'bg-gray-800' : 'bg-white'} border ${theme === 'dark' ? 'border-gray-700' : 'border-gray-200'}`}>
@@ -265,6 +272,18 @@ const PaymentsPage = () => {
                   ))}
                 </tbody>
               </table>
+              {nextCursor && (
+                <div className="p-4 text-center">
+                  <button
+                    onClick={() => fetchPayments(nextCursor)}
+                    className={`px-4 py-2 rounded-md text-sm font-medium ${
+                      theme === 'dark' ? 'bg-gray-700 text-gray-300 hover:bg-gray-600' : 'bg-gray-200 text-gray-700 hover:bg-gray-300'
+                    }`}
+                  >
+                    Cargar más
+                  </button>
+                </div>
+              )}
             </div>
           )}
         </div>
@@ -37,28 +37,49 @@ const ReportsPage = () => {
     fetchReports();
   }, []);
 
+  const downloadBlob = (blob, filename) => {
+    const url = window.URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = filename;
+    a.click();
+    window.URL.revokeObjectURL(url);
+  };
+
+  const exportUsers = async () => {
+    const token = localStorage.getItem('token');
+    const fields = 'name,email,phone,membership,active,created_at';
+
+    try {
+      // The backend streams the CSV page by page from the database
+      const response = await fetch(`http://127.0.0.1:8000/reports/users/export?format=csv&fields=${fields}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      });
+
+      if (response.ok) {
+        downloadBlob(await response.blob(), 'reporte_usuarios.csv');
+        toast.success('Reporte generado correctamente');
+      } else {
+        toast.error('Error al exportar usuarios');
+      }
+    } catch (error) {
+      toast.error('Error de conexión');
+    }
+  };
+
   const generateReport = (type) => {
+    if (type === 'users') {
+      exportUsers();
+      return;
+    }
     if (!reports) return;
 
     let csvContent = '';
     let filename = '';
 
     switch (type) {
-      case 'users':
-        csvContent = [
-          ['Nombre', 'Email', 'Teléfono', 'Membresía', 'Estado', 'Fecha de Registro'],
-          ...reports.users.map(user => [
-            user.name,
-            user.email,
-            user.phone,
-            user.membership,
-            user.active ? 'Activo' : 'Inactivo',
-            new Date(user.created_at).toLocaleDateString()
-          ])
-        ].map(row => row.join(',')).join('\n');
-        filename = 'reporte_usuarios.csv';
-        break;
-      
       case 'membership':
         csvContent = [
           ['Tipo de Membresía', 'Cantidad', 'Porcentaje'],
@@ -73,13 +94,7 @@ const ReportsPage = () => {
         return;
     }
 
-    const blob = new Blob([csvContent], { type: 'text/csv' });
-    const url = window.URL.createObjectURL(blob);
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = filename;
-    a.click();
-    window.URL.revokeObjectURL(url);
+    downloadBlob(new Blob([csvContent], { type: 'text/csv' }), filename);
     toast.success('Reporte generado correctamente');
   };
 
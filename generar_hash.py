@@ -1,6 +1,8 @@
-from passlib.context import CryptContext
+from dotenv import load_dotenv
+from hashing import make_context
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+load_dotenv()
+pwd_context = make_context()
 
 # Aquí pon la contraseña que tú vas a usar para entrar
 plain_password = "admin123"
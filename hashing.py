@@ -0,0 +1,107 @@
+"""
+Hash y verificación de contraseñas fuera del event loop.
+
+bcrypt es deliberadamente lento, así que corre en un pool de hilos propio y
+acotado. Si la cola se llena se rechaza la petición (HTTP 503 con
+Retry-After) en lugar de acumular logins esperando.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+def make_context(rounds: Optional[int] = None) -> CryptContext:
+    """CryptContext de bcrypt con coste fijo.
+
+    min/max iguales al coste por defecto hacen que cualquier hash con otro
+    coste se marque para actualizar, así el coste puede ajustarse en ambos
+    sentidos y los usuarios se migran al iniciar sesión.
+    """
+    rounds = rounds or int(os.getenv("BCRYPT_ROUNDS", 12))
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+
+class PasswordHasherBusy(Exception):
+    """La cola del pool de hash está llena"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"password hashing queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Pool de hilos acotado para operaciones bcrypt"""
+
+    def __init__(self, context: CryptContext, max_workers: int = 2, max_queue: int = 32):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        # Exponentially weighted average of one bcrypt call, for Retry-After
+        self._avg_seconds = 0.25
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                waves = math.ceil(self._pending / self.max_workers)
+                raise PasswordHasherBusy(max(1, math.ceil(waves * self._avg_seconds)))
+            self._pending += 1
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    async def _submit(self, func, *args):
+        self._acquire()
+        try:
+            future = self._executor.submit(self._timed, func, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Verificar una contraseña; devuelve un hash nuevo si el coste cambió"""
+        return await self._submit(self.context.verify_and_update, password, hashed)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self.rejected,
+            "avg_seconds": round(self._avg_seconds, 4)
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,151 @@
+"""
+Validadores HTTP y compresión para los endpoints de listado.
+
+``HTTPCacheMiddleware`` envuelve solo las rutas GET configuradas: calcula un
+ETag sobre el cuerpo JSON, responde 304 sin cuerpo si coincide con
+``If-None-Match``, añade el ``Cache-Control`` de la ruta y comprime con
+brotli (si el paquete está instalado) o gzip a partir de ``minimum_size``
+bytes. El refresco periódico del dashboard pasa a costar casi siempre un 304.
+"""
+import gzip
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when brotli isn't installed
+    brotli = None
+
+
+def make_etag(body: bytes) -> str:
+    # Weak: the same representation is served gzip, brotli or identity
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class ResponseStats:
+    """Contadores compartidos con /cache/stats"""
+
+    def __init__(self, policies: Dict[str, str]):
+        self.policies = policies
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.not_modified = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, body_size: int, sent_size: int, not_modified: bool = False):
+        with self._lock:
+            self.responses += 1
+            self.not_modified += not_modified
+            self.bytes_in += body_size
+            self.bytes_out += sent_size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "routes": sorted(self.policies),
+            "encodings": ["br", "gzip"] if brotli is not None else ["gzip"],
+            "responses": self.responses,
+            "not_modified": self.not_modified,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out
+        }
+
+
+class HTTPCacheMiddleware:
+    """Middleware ASGI para las rutas de ``stats.policies`` (ruta -> Cache-Control)"""
+
+    def __init__(self, app, stats: ResponseStats, minimum_size: int = 1024, compresslevel: int = 6):
+        self.app = app
+        self.stats = stats
+        self.policies = stats.policies
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or scope["path"] not in self.policies
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start: Dict[str, Any] = {}
+        chunks = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+        status = start.get("status", 500)
+        # Errors and already encoded bodies pass through untouched
+        if status != 200 or "content-encoding" in headers:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        request_headers = Headers(scope=scope)
+        etag = headers.get("etag") or make_etag(body)
+        headers["ETag"] = etag
+        headers.setdefault("Cache-Control", self.policies[scope["path"]])
+        headers.add_vary_header("Accept-Encoding")
+
+        if etag_matches(etag, request_headers.get("if-none-match")):
+            for name in ("content-length", "content-type"):
+                if name in headers:
+                    del headers[name]
+            self.stats.record(len(body), 0, not_modified=True)
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        encoded = body
+        encoding = choose_encoding(request_headers.get("accept-encoding")) if len(body) >= self.minimum_size else None
+        if encoding == "br":
+            encoded = brotli.compress(body, quality=5)
+        elif encoding == "gzip":
+            encoded = gzip.compress(body, compresslevel=self.compresslevel)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(encoded))
+        self.stats.record(len(body), len(encoded))
+        await send({"type": "http.response.start", "status": status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else encoded})
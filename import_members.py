@@ -0,0 +1,76 @@
+"""
+Importar miembros desde un archivo CSV o NDJSON a través de POST /users/import.
+
+El archivo se envía en streaming al backend, que valida, escribe por bloques
+y mantiene al día cachés y métricas. Al final muestra el informe con las
+filas rechazadas.
+
+Uso:
+    python import_members.py miembros.csv --email admin@gym.com --password admin123
+    python import_members.py miembros.ndjson --token <JWT> --on-conflict skip
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import httpx
+
+
+def read_chunks(path: Path, size: int = 64 * 1024):
+    with path.open("rb") as handle:
+        while True:
+            chunk = handle.read(size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file", type=Path)
+    parser.add_argument("--url", default=os.getenv("GYM_API_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="por defecto, según la extensión")
+    parser.add_argument("--on-conflict", choices=("update", "skip"), default="update",
+                        help="qué hacer con los card_id que ya existen")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--token", default=os.getenv("GYM_API_TOKEN"))
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    export_format = args.format or ("ndjson" if args.file.suffix in (".ndjson", ".jsonl") else "csv")
+    with httpx.Client(base_url=args.url, timeout=None) as client:
+        token = args.token
+        if not token:
+            if not (args.email and args.password):
+                parser.error("indica --token o --email y --password")
+            response = client.post("/login", json={"email": args.email, "password": args.password})
+            if response.status_code != 200:
+                sys.exit(f"❌ Error al iniciar sesión: {response.text}")
+            token = response.json()["access_token"]
+
+        response = client.post(
+            "/users/import",
+            params={"format": export_format, "on_conflict": args.on_conflict, "chunk_size": args.chunk_size},
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv" if export_format == "csv" else "application/x-ndjson"},
+            content=read_chunks(args.file)
+        )
+    if response.status_code != 200:
+        sys.exit(f"❌ Error al importar: {response.text}")
+
+    report = response.json()
+    print(f"✅ {report['imported']} de {report['received']} filas importadas")
+    if report["skipped"]:
+        print(f"ℹ️  {report['skipped']} filas omitidas: el card_id ya existía")
+    if report["failed"]:
+        print(f"❌ {report['failed']} filas rechazadas:")
+        for error in report["errors"]:
+            print(f"  línea {error['line']}: {error['error']}")
+        if report["errors_truncated"]:
+            print("  ...")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Escritura diferida de ``last_access`` en memberships.
+
+``check_access`` responde al torniquete sin esperar a la base de datos: solo
+anota el acceso en memoria. Las anotaciones se agrupan por tarjeta (gana la
+más reciente) y se vuelcan juntas cada ``flush_interval`` segundos o en
+cuanto hay ``max_pending`` tarjetas pendientes, con una sola llamada a la
+función ``touch_last_access`` de la base de datos. Si la función no existe
+se usa un update condicional por tarjeta. Lo que falla vuelve a la cola y se
+reintenta en el siguiente volcado; al apagar se vuelca lo pendiente.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+
+async def write_one_by_one(db, updates: Dict[str, str], concurrency: int = 8):
+    """Respaldo sin touch_last_access: un update por tarjeta, nunca hacia atrás"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def touch(card_id, timestamp):
+        async with semaphore:
+            await db.execute(
+                db.table("memberships")
+                .update({"last_access": timestamp}, returning=ReturnMethod.minimal)
+                .eq("card_id", card_id)
+                .or_(f'last_access.is.null,last_access.lt."{timestamp}"')
+            )
+
+    await asyncio.gather(*(touch(card_id, timestamp) for card_id, timestamp in updates.items()))
+
+
+class LastAccessBuffer:
+    """Accesos pendientes de escribir, agrupados por tarjeta"""
+
+    def __init__(self, flush_interval: float = 1.0, max_pending: int = 500):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[str, str] = {}
+        # monotonic time of the oldest update not yet written
+        self._oldest: Optional[float] = None
+        # Created in start() so they belong to the server's event loop
+        self._wake: Optional[asyncio.Event] = None
+        self._flushing: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.rpc_available = True
+        self.marked = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_seconds = 0.0
+        self.last_flush_lag = 0.0
+
+    def mark(self, card_id: str, timestamp: str):
+        """Anotar un acceso; no espera a nada"""
+        self.marked += 1
+        previous = self._pending.get(card_id)
+        if previous is not None:
+            self.coalesced += 1
+            if previous >= timestamp:
+                return
+        self._pending[card_id] = timestamp
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._pending) >= self.max_pending and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self, db) -> int:
+        """Escribir lo pendiente; devuelve cuántas tarjetas se volcaron"""
+        if self._flushing is None:
+            self._flushing = asyncio.Lock()
+        async with self._flushing:
+            if not self._pending:
+                return 0
+            updates, oldest = self._pending, self._oldest
+            self._pending, self._oldest = {}, None
+            started = time.monotonic()
+            try:
+                await self._write(db, updates)
+            except BaseException as e:
+                # Back in the queue without overwriting newer swipes; also on
+                # cancellation, so stop() still writes them
+                for card_id, timestamp in updates.items():
+                    if self._pending.get(card_id, "") < timestamp:
+                        self._pending[card_id] = timestamp
+                if self._oldest is None or oldest < self._oldest:
+                    self._oldest = oldest
+                if isinstance(e, Exception):
+                    self.failures += 1
+                    self.last_error = getattr(e, "message", None) or str(e)
+                raise
+            finished = time.monotonic()
+            self.flushes += 1
+            self.written += len(updates)
+            self.last_flush_seconds = finished - started
+            self.last_flush_lag = finished - oldest
+            return len(updates)
+
+    async def _write(self, db, updates: Dict[str, str]):
+        if self.rpc_available:
+            try:
+                await db.execute(db.rpc("touch_last_access", {
+                    "updates": [{"card_id": c, "last_access": t} for c, t in updates.items()]
+                }))
+                return
+            except APIError as e:
+                # PGRST202: the function isn't installed
+                if e.code != "PGRST202":
+                    raise
+                self.rpc_available = False
+        await write_one_by_one(db, updates)
+
+    async def run(self, db):
+        """Bucle de volcado; se detiene con stop()"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Counted in stats(); retried on the next tick
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self, db):
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self.run(db))
+
+    async def stop(self, db):
+        """Parar el bucle y volcar lo que quede"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(db)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "oldest_pending_seconds": round(time.monotonic() - self._oldest, 3) if self._oldest is not None else 0.0,
+            "marked": self.marked,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+            "last_flush_lag_seconds": round(self.last_flush_lag, 3),
+            "mode": "rpc" if self.rpc_available else "per_card"
+        }
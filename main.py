@@ -1,17 +1,46 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr
-from supabase import create_client, Client
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.exception_handlers import http_exception_handler
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from postgrest.exceptions import APIError
+from datetime import date, datetime, timedelta
 import os
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import logging
 import uuid
 import json
 
+import aggregates
+import allowlist
+import attendance
+import bookings
+import config_cache
+import expiry
+import exports
+import http_cache
+import member_import
+import revenue
+import search_index
+import telemetry
+from access_log import record_entries, record_entry
+from db import Database
+from fanout import SingleFlight, fanout
+from cache import LRUCache
+from controllers import ControllerHub
+from hashing import PasswordHasher, PasswordHasherBusy, make_context
+from last_access import LastAccessBuffer
+from member_changes import MemberChanges
+from pagination import apply_keyset, decode_cursor, encode_cursor, order_keyset, parse_sort
+from queries import columns, projection
+from token_cache import RevocationSync, TokenCache
+
 # Load environment variables
 load_dotenv()
 
@@ -21,12 +50,149 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "default-secret-key")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", 10000))
+CARD_CACHE_TTL_SECONDS = float(os.getenv("CARD_CACHE_TTL_SECONDS", 60))
+ATTENDANCE_VISIT_MINUTES = int(os.getenv("ATTENDANCE_VISIT_MINUTES", 90))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 32))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 100))
+DB_MAX_KEEPALIVE = int(os.getenv("DB_MAX_KEEPALIVE", 20))
+DB_KEEPALIVE_EXPIRY = float(os.getenv("DB_KEEPALIVE_EXPIRY", 30))
+DB_HTTP2 = os.getenv("DB_HTTP2", "true").lower() == "true"
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", 10))
+METRICS_DEADLINE_SECONDS = float(os.getenv("METRICS_DEADLINE_SECONDS", 3))
+REPORTS_DEADLINE_SECONDS = float(os.getenv("REPORTS_DEADLINE_SECONDS", 5))
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 200))
+ACCESS_BATCH_MAX_EVENTS = int(os.getenv("ACCESS_BATCH_MAX_EVENTS", 500))
+ACCESS_EVENT_DEDUP_SIZE = int(os.getenv("ACCESS_EVENT_DEDUP_SIZE", 50000))
+ACCESS_EVENT_DEDUP_TTL_SECONDS = float(os.getenv("ACCESS_EVENT_DEDUP_TTL_SECONDS", 86400))
+ACCESS_BATCH_MAX_AGE_SECONDS = float(os.getenv("ACCESS_BATCH_MAX_AGE_SECONDS", 86400))
+ACCESS_BATCH_MAX_SKEW_SECONDS = float(os.getenv("ACCESS_BATCH_MAX_SKEW_SECONDS", 60))
+CONTROLLER_TOKEN_EXPIRE_DAYS = int(os.getenv("CONTROLLER_TOKEN_EXPIRE_DAYS", 365))
+CONTROLLER_HEARTBEAT_SECONDS = float(os.getenv("CONTROLLER_HEARTBEAT_SECONDS", 20))
+CONTROLLER_RATE_PER_SECOND = float(os.getenv("CONTROLLER_RATE_PER_SECOND", 5))
+CONTROLLER_RATE_BURST = int(os.getenv("CONTROLLER_RATE_BURST", 20))
+ALLOWLIST_JOURNAL_SIZE = int(os.getenv("ALLOWLIST_JOURNAL_SIZE", 10000))
+ALLOWLIST_REFRESH_SECONDS = float(os.getenv("ALLOWLIST_REFRESH_SECONDS", 300))
+CONFIG_VERSION_CHECK_SECONDS = float(os.getenv("CONFIG_VERSION_CHECK_SECONDS", 5))
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", 2))
+MEMBER_CHANGES_POLL_SECONDS = float(os.getenv("MEMBER_CHANGES_POLL_SECONDS", 2))
+DERIVED_REFRESH_SECONDS = float(os.getenv("DERIVED_REFRESH_SECONDS", 60))
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", 1024))
+METRICS_MAX_AGE_SECONDS = int(os.getenv("METRICS_MAX_AGE_SECONDS", 10))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 500))
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", 4))
+LAST_ACCESS_FLUSH_SECONDS = float(os.getenv("LAST_ACCESS_FLUSH_SECONDS", 1))
+LAST_ACCESS_MAX_PENDING = int(os.getenv("LAST_ACCESS_MAX_PENDING", 500))
+EXPIRY_SWEEP_SECONDS = float(os.getenv("EXPIRY_SWEEP_SECONDS", 300))
+EXPIRY_SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", 500))
+RENEWAL_REMINDER_DAYS = int(os.getenv("RENEWAL_REMINDER_DAYS", 7))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", 1))
+INTERNAL_METRICS_TOKEN = os.getenv("INTERNAL_METRICS_TOKEN", "")
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("gym")
+# httpx logs every Supabase round trip at INFO; those are in the metrics
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Prometheus series for HTTP requests and Supabase calls, served on /internal/metrics
+metrics_registry = telemetry.Registry()
+http_metrics = telemetry.HTTPMetrics(metrics_registry)
+
+# Async Supabase (PostgREST) data-access layer with a pooled HTTP client
+db = Database(
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    max_connections=DB_MAX_CONNECTIONS,
+    max_keepalive_connections=DB_MAX_KEEPALIVE,
+    keepalive_expiry=DB_KEEPALIVE_EXPIRY,
+    http2=DB_HTTP2,
+    timeout=DB_TIMEOUT_SECONDS,
+    observer=telemetry.DatabaseMetrics(metrics_registry)
+)
+
+# Card validity cache for the turnstile path
+card_cache = LRUCache(maxsize=CARD_CACHE_SIZE, ttl=CARD_CACHE_TTL_SECONDS)
+
+# card_ids written by any worker, read back from membership_changes
+member_changes = MemberChanges(interval=MEMBER_CHANGES_POLL_SECONDS)
+
+# Decisions already returned for replayed controller events, by event_id
+processed_events = LRUCache(maxsize=ACCESS_EVENT_DEDUP_SIZE, ttl=ACCESS_EVENT_DEDUP_TTL_SECONDS)
+
+# Open turnstile WebSocket connections; revoked cards are pushed to all of them
+controller_hub = ControllerHub(rate=CONTROLLER_RATE_PER_SECOND, burst=CONTROLLER_RATE_BURST)
+
+# Incrementally maintained dashboard counters
+dashboard = aggregates.DashboardAggregates()
+
+# Hourly/daily attendance buckets fed by check_access
+attendance_series = attendance.AttendanceSeries(visit_minutes=ATTENDANCE_VISIT_MINUTES)
+
+# Revenue per day/month in integer cents, fed by create_payment
+ledger = revenue.RevenueLedger()
+
+# Concurrent requests share one in-flight load per key instead of stampeding
+loaders = SingleFlight()
+
+# Trigram index used when the database has no search_members function
+member_index = search_index.SearchIndex()
+search_rpc_available = SEARCH_BACKEND != "local"
+
+# The config table, served with an ETag; other workers notice changes by polling
+site_config = config_cache.ConfigCache()
+
+# last_access writes leave the swipe path and are flushed in batches
+last_access_buffer = LastAccessBuffer(flush_interval=LAST_ACCESS_FLUSH_SECONDS, max_pending=LAST_ACCESS_MAX_PENDING)
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Deactivates lapsed memberships and queues renewal reminders
+expiry_sweeper = expiry.ExpirySweeper(
+    interval=EXPIRY_SWEEP_SECONDS,
+    batch_size=EXPIRY_SWEEP_BATCH,
+    reminder_days=RENEWAL_REMINDER_DAYS
+)
+
+def _discard_result(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Tarea en segundo plano fallida: %r", task.exception())
+
+def refresh_if_stale(state, load):
+    # The in-memory copies only see this worker's writes; other workers'
+    # show up after a periodic rebuild, served from memory meanwhile
+    if state.loaded and state.needs_refresh(DERIVED_REFRESH_SECONDS):
+        load().add_done_callback(_discard_result)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.connect()
+    # Warm the allow-list so check_access has a fallback before the first outage
+    load_allowlist().add_done_callback(_discard_result)
+    loaders.run("config", lambda: config_cache.load(db, site_config)).add_done_callback(_discard_result)
+    # Revocations made before a restart must hold before the first request
+    try:
+        await sync_revocations()
+    except Exception as e:
+        logger.warning("No se pudieron cargar las revocaciones de tokens: %r", e)
+    revocation_sync.start(sync_revocations)
+    member_changes.start(apply_member_changes)
+    last_access_buffer.start(db)
+    expiry_sweeper.start(sweep_memberships)
+    yield
+    try:
+        await revocation_sync.stop()
+        await member_changes.stop()
+        await expiry_sweeper.stop()
+        await last_access_buffer.stop(db)
+    finally:
+        await db.close()
+    password_hasher.shutdown()
 
 # FastAPI app
-app = FastAPI(title="Gym Management System", version="1.0.0")
+app = FastAPI(title="Gym Management System", version="1.0.0", lifespan=lifespan)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -38,52 +204,249 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+# ETag/304, Cache-Control and compression for the polled list endpoints;
+# responses carry the caller's data, so only the browser may keep them
+response_stats = http_cache.ResponseStats({
+    "/users": "private, no-cache",
+    "/classes": "private, no-cache",
+    "/payments": "private, no-cache",
+    "/metrics": f"private, max-age={METRICS_MAX_AGE_SECONDS}",
+})
+app.add_middleware(http_cache.HTTPCacheMiddleware, stats=response_stats, minimum_size=HTTP_COMPRESS_MIN_BYTES)
+
+# Outermost, so latency includes compression and the other middleware
+app.add_middleware(
+    telemetry.RequestMetricsMiddleware,
+    metrics=http_metrics,
+    slow_seconds=SLOW_REQUEST_SECONDS,
+    slow_sample_rate=SLOW_REQUEST_SAMPLE_RATE
 )
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@app.exception_handler(HTTPException)
+async def log_server_errors(request: Request, exc: HTTPException):
+    # Endpoints turn failures into HTTPException(500); keep them in the log
+    if exc.status_code >= 500:
+        logger.error("%s %s -> %s: %s", request.method, request.url.path, exc.status_code, exc.detail)
+    return await http_exception_handler(request, exc)
+
+def cache_card(user: dict):
+    card = {
+        "name": user.get("name"),
+        "active": user.get("active", False),
+        "expiration_date": user.get("expiration_date"),
+        # Parsed once here instead of on every swipe
+        "expires_at": expiry.parse_expiration(user.get("expiration_date"))
+    }
+    card_cache.set(user["card_id"], card)
+    return card
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def get_card(card_id: str):
+    card = card_cache.get(card_id)
+    if card is None:
+        response = await db.execute(
+            db.table("memberships")
+            .select(projection("access.card"))
+            .eq("card_id", card_id)
+        )
+        if not response.data:
+            return None
+        card = cache_card(response.data[0])
+    return card
+
+async def get_cards(card_ids) -> Dict[str, dict]:
+    """Resolver varias tarjetas con una sola consulta para las que no están en caché"""
+    cards, missing = {}, []
+    for card_id in card_ids:
+        card = card_cache.get(card_id)
+        if card is None:
+            missing.append(card_id)
+        else:
+            cards[card_id] = card
+    if missing:
+        response = await db.execute(
+            db.table("memberships")
+            .select(projection("access.card"))
+            .in_("card_id", missing)
+        )
+        for row in response.data or []:
+            cards[row["card_id"]] = cache_card(row)
+    return cards
+
+def local_time(moment: datetime) -> datetime:
+    # Swipes and expiration dates are naive local time, like datetime.now()
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+def evaluate_access(card: dict, at: datetime) -> bool:
+    if not card.get("active", False):
+        return False
+    # The sweeper clears active on lapsed members; this only covers the
+    # minutes between a membership lapsing and the next sweep
+    expires_at = card["expires_at"] if "expires_at" in card else expiry.parse_expiration(card.get("expiration_date"))
+    return expires_at is None or local_time(at) < expires_at
+
+# Signed offline allow-list for controllers and the check_access fallback
+allow_list = allowlist.AllowList(evaluate_access, journal_size=ALLOWLIST_JOURNAL_SIZE)
+
+def load_allowlist():
+    return loaders.run("allowlist", lambda: allowlist.rebuild(db, allow_list))
+
+# Write-path hooks that keep in-process derived state in sync
+def on_member_created(user: dict):
+    cache_card(user)
+    dashboard.user_created(user)
+    member_index.upsert(user)
+    allow_list.upsert(user)
+
+def on_member_updated(before: dict, user: dict):
+    card = cache_card(user)
+    dashboard.user_updated(before.get("active"), user)
+    member_index.upsert(user)
+    allow_list.upsert(user)
+    if not evaluate_access(card, datetime.now()):
+        controller_hub.revoke([user["card_id"]])
+
+def on_member_deleted(card_id: str, user: Optional[dict]):
+    card_cache.invalidate(card_id)
+    member_index.remove(card_id)
+    allow_list.remove(card_id)
+    controller_hub.revoke([card_id])
+    if user:
+        dashboard.user_deleted(user)
+
+def on_member_expired(user: dict):
+    on_member_updated({"active": True}, user)
+
+async def apply_member_changes():
+    # Writes seen through the trigger, including this worker's own: every
+    # step below is idempotent
+    changed = await member_changes.poll(db)
+    if not changed:
+        return
+    for card_id in changed:
+        card_cache.invalidate(card_id)
+    rows = {}
+    # An import can change thousands of cards; keep each URL short
+    for start in range(0, len(changed), 200):
+        response = await db.execute(
+            db.table("memberships").select(projection("changes.memberships")).in_("card_id", changed[start:start + 200])
+        )
+        rows.update((row["card_id"], row) for row in response.data or [])
+    now, revoked = datetime.now(), []
+    for card_id in changed:
+        user = rows.get(card_id)
+        if user is None:
+            member_index.remove(card_id)
+            allow_list.remove(card_id)
+            revoked.append(card_id)
+            continue
+        member_index.upsert(user)
+        allow_list.upsert(user)
+        if not evaluate_access(cache_card(user), now):
+            revoked.append(card_id)
+    controller_hub.revoke(revoked)
+
+def sweep_memberships():
+    return loaders.run("expiry", lambda: expiry_sweeper.run_once(db, on_member_expired))
+
+# Verified JWT claims, keyed by token digest, plus the revocation lists;
+# subject revocations must outlive the longest token (controller tokens)
+token_cache = TokenCache(
+    maxsize=TOKEN_CACHE_SIZE,
+    token_lifetime=max(ACCESS_TOKEN_EXPIRE_MINUTES * 60, CONTROLLER_TOKEN_EXPIRE_DAYS * 86400)
+)
+
+# Revocations are written to token_revocations and re-read by every worker
+revocation_sync = RevocationSync(interval=TOKEN_REVOCATION_SYNC_SECONDS)
+
+async def revoke(row: dict):
+    # Stored first: if the write fails the caller gets a 500 and can retry
+    await revocation_sync.publish(db, row)
+    return token_cache.apply([row])
+
+async def sync_revocations():
+    # A controller revoked on another worker is disconnected from this one too
+    for subject in await revocation_sync.sync(db, token_cache):
+        controller_hub.kick(subject)
+
+# Password hashing runs on its own bounded pool, off the event loop
+pwd_context = make_context()
+password_hasher = PasswordHasher(pwd_context, max_workers=PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_QUEUE)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    issued_at = datetime.utcnow()
+    expire = issued_at + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": issued_at})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def authenticate_user(email: str, password: str):
+async def authenticate_user(email: str, password: str):
     try:
-        response = supabase.table("administradores").select("*").eq("email", email).execute()
+        response = await db.execute(
+            db.table("administradores").select(projection("auth.admin")).eq("email", email)
+        )
         if not response.data:
             return False
         admin = response.data[0]
-        if not verify_password(password, admin["password_hash"]):
+        valid, new_hash = await password_hasher.verify_and_update(password, admin["password_hash"])
+        if not valid:
             return False
+        if new_hash:
+            # Transparent rehash when BCRYPT_ROUNDS changed since the hash was made
+            try:
+                await db.execute(
+                    db.table("administradores").update({"password_hash": new_hash}).eq("id", admin["id"])
+                )
+            except Exception:
+                logger.exception("Error al re-hashear la contraseña de %s", admin["email"])
         return {
             "id": admin["id"],
             "email": admin["email"],
             "name": admin.get("nombre", admin["email"]),
             "role": admin.get("rol", "admin")
         }
-    except Exception as e:
-        print(f"Authentication error: {e}")
+    except PasswordHasherBusy:
+        raise
+    except Exception:
+        logger.exception("Error de autenticación")
         return False
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def decode_token(token: str) -> dict:
+    digest = token_cache.digest(token)
+    payload = token_cache.get(digest)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise credentials_exception
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        return payload
-    except JWTError:
+        token_cache.put(digest, payload)
+    if token_cache.is_revoked(digest, payload):
+        raise credentials_exception
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    payload = decode_token(token)
+    # Controller tokens only open the turnstile endpoints
+    if payload.get("role") == "controller":
         raise credentials_exception
+    return payload
+
+async def get_controller(token: str = Depends(oauth2_scheme)):
+    payload = decode_token(token)
+    if payload.get("role") not in ("controller", "admin"):
+        raise credentials_exception
+    return payload
 
 # Pydantic models
 class LoginRequest(BaseModel):
@@ -111,6 +474,9 @@ class ClassCreate(BaseModel):
     capacity: int
     description: Optional[str] = None
 
+class BookingCreate(BaseModel):
+    card_id: str
+
 class PaymentCreate(BaseModel):
     user_id: str
     amount: float
@@ -121,10 +487,31 @@ class ConfigUpdate(BaseModel):
     key: str
     value: str
 
+class RevokeRequest(BaseModel):
+    email: EmailStr
+
+class ControllerTokenRequest(BaseModel):
+    device_id: str
+
+class AccessEvent(BaseModel):
+    event_id: str
+    card_id: str
+    timestamp: Optional[datetime] = None
+
+class AccessBatch(BaseModel):
+    events: List[AccessEvent]
+
 # Authentication endpoints
 @app.post("/login")
-def login(request: LoginRequest):
-    user = authenticate_user(request.email, request.password)
+async def login(request: LoginRequest):
+    try:
+        user = await authenticate_user(request.email, request.password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados inicios de sesión simultáneos, intenta de nuevo",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -146,7 +533,7 @@ def login(request: LoginRequest):
     }
 
 @app.get("/verify-token")
-def verify_token(current_user: dict = Depends(get_current_user)):
+async def verify_token(current_user: dict = Depends(get_current_user)):
     return {
         "valid": True,
         "user": {
@@ -156,64 +543,157 @@ def verify_token(current_user: dict = Depends(get_current_user)):
         }
     }
 
+@app.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), current_user: dict = Depends(get_current_user)):
+    try:
+        await revoke(token_cache.token_revocation(token_cache.digest(token), current_user.get("exp", 0)))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al cerrar sesión: {str(e)}")
+    return {"message": "Sesión cerrada exitosamente"}
+
+@app.post("/auth/revoke")
+async def revoke_sessions(request: RevokeRequest, current_user: dict = Depends(get_current_user)):
+    # Call after changing an administrator's role or password
+    try:
+        await revoke(token_cache.subject_revocation(request.email))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al revocar sesiones: {str(e)}")
+    return {"message": "Sesiones revocadas exitosamente"}
+
 # User management endpoints
+# Response keys of /users that are renamed from their source column
+USER_FIELD_SOURCES = {"status": "active", "lastAccess": "last_access"}
+
 @app.get("/users")
-def get_users(
+async def get_users(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
     search: Optional[str] = None,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    count: str = Query("exact", pattern="^(exact|planned|estimated|none)$"),
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        query = supabase.table("memberships").select("*")
-        
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    try:
+        selected = columns("users.list", fields, required=("id", "created_at"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        active = {"active": True, "inactive": False}.get(status)
         if search:
-            query = query.or_(f"name.ilike.%{search}%,email.ilike.%{search}%")
-        
-        if status and status != "all":
-            if status == "active":
-                query = query.eq("active", True)
-            elif status == "inactive":
-                query = query.eq("active", False)
-        
-        # Get total count
-        count_response = query.execute()
-        total = len(count_response.data) if count_response.data else 0
-        
-        # Apply pagination
-        offset = (page - 1) * limit
-        response = query.range(offset, offset + limit - 1).execute()
-        
-        # Format users data
-        users = []
-        for user in response.data:
-            users.append({
-                "id": user.get("id"),
-                "card_id": user.get("card_id"),
-                "name": user.get("name"),
-                "email": user.get("email"),
-                "phone": user.get("phone"),
-                "membership": user.get("membership", "basic").title(),
-                "status": "active" if user.get("active") else "inactive",
-                "active": user.get("active", False),
-                "lastAccess": user.get("last_access", "Nunca"),
-                "created_at": user.get("created_at"),
-                "expiration_date": user.get("expiration_date")
-            })
+            rows, total = await search_users(search, active, page, limit, selected, count)
+            next_cursor = None
+        else:
+            rows, total = await list_users(active, after, page, limit, selected, count)
+            next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
         
-        return {
-            "users": users,
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "pages": (total + limit - 1) // limit
-        }
+        return page_envelope(
+            "users", [format_user(user, selected) for user in rows], total, None if after else page, limit, next_cursor
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener usuarios: {str(e)}")
 
+def format_user(user: dict, selected) -> dict:
+    formatted = {
+        "id": user.get("id"),
+        "card_id": user.get("card_id"),
+        "name": user.get("name"),
+        "email": user.get("email"),
+        "phone": user.get("phone"),
+        "membership": (user.get("membership") or "basic").title(),
+        "status": "active" if user.get("active") else "inactive",
+        "active": user.get("active", False),
+        "lastAccess": user.get("last_access", "Nunca"),
+        "created_at": user.get("created_at"),
+        "expiration_date": user.get("expiration_date")
+    }
+    return {
+        key: value for key, value in formatted.items()
+        if USER_FIELD_SOURCES.get(key, key) in selected
+    }
+
+async def fetch_page(query, after, page, limit, keyset=("created_at", "id"), descending=True):
+    # Keyset mode continues after the cursor row; page mode keeps offsets
+    if after:
+        query = apply_keyset(query, after, keyset, descending)
+    query = order_keyset(query, keyset, descending)
+    if after:
+        response = await db.execute(query.limit(limit))
+    else:
+        offset = (page - 1) * limit
+        response = await db.execute(query.range(offset, offset + limit - 1))
+    return response.data or [], response.count
+
+def listing_count(count: str, after) -> Optional[str]:
+    # Cursor pages skip the count: next to the keyset filter it would only
+    # count the rows left, and it would cost a full count(*) on every page
+    return None if after or count == "none" else count
+
+def page_envelope(key: str, rows: list, total, page: Optional[int], limit: int, next_cursor) -> dict:
+    return {
+        key: rows,
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": (total + limit - 1) // limit if total is not None else None,
+        "next_cursor": next_cursor
+    }
+
+async def list_users(active, after, page, limit, selected, count):
+    # The total comes back in the Content-Range header of the page request
+    query = db.table("memberships").select(",".join(selected), count=listing_count(count, after))
+    if active is not None:
+        query = query.eq("active", active)
+    return await fetch_page(query, after, page, limit)
+
+async def search_users(term, active, page, limit, selected, count):
+    """Resultados ordenados por relevancia (pg_trgm o el índice local)"""
+    global search_rpc_available
+    offset = (page - 1) * limit
+    if search_rpc_available:
+        query = db.rpc(
+            "search_members",
+            {"term": term, "max_results": SEARCH_MAX_RESULTS},
+            count=None if count == "none" else count
+        ).select(",".join(selected))
+        if active is not None:
+            query = query.eq("active", active)
+        try:
+            response = await db.execute(query.range(offset, offset + limit - 1))
+            return response.data or [], response.count
+        except APIError as e:
+            # PGRST202: the function isn't installed; use the local index from now on
+            if e.code != "PGRST202" or SEARCH_BACKEND == "database":
+                raise
+            search_rpc_available = False
+    
+    if not member_index.loaded:
+        await load_search()
+    if not member_changes.live:
+        # Without membership_changes other workers' writes only arrive with a rebuild
+        refresh_if_stale(member_index, load_search)
+    ranked = member_index.search(term, active=active, limit=SEARCH_MAX_RESULTS)
+    card_ids = ranked[offset:offset + limit]
+    if not card_ids:
+        return [], len(ranked)
+    response = await db.execute(
+        db.table("memberships").select(",".join(dict.fromkeys(("card_id", *selected)))).in_("card_id", card_ids)
+    )
+    # Deleted by another worker since the index last heard of it
+    for card_id in set(card_ids) - {row.get("card_id") for row in response.data or []}:
+        member_index.remove(card_id)
+    position = {card_id: i for i, card_id in enumerate(card_ids)}
+    rows = sorted(response.data or [], key=lambda row: position.get(row.get("card_id"), len(position)))
+    return rows, len(ranked)
+
 @app.post("/users")
-def create_user(user: UserCreate, current_user: dict = Depends(get_current_user)):
+async def create_user(user: UserCreate, current_user: dict = Depends(get_current_user)):
     try:
         card_id = str(uuid.uuid4())[:8].upper()
         user_data = {
@@ -228,8 +708,9 @@ def create_user(user: UserCreate, current_user: dict = Depends(get_current_user)
             "created_at": datetime.now().isoformat()
         }
         
-        result = supabase.table("memberships").insert(user_data).execute()
+        result = await db.execute(db.table("memberships").insert(user_data))
         if result.data:
+            on_member_created(result.data[0])
             return {
                 "message": "Usuario creado exitosamente",
                 "user": result.data[0]
@@ -238,11 +719,49 @@ def create_user(user: UserCreate, current_user: dict = Depends(get_current_user)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al crear usuario: {str(e)}")
 
+def after_member_import(report: member_import.ImportReport):
+    # Upserts come back without rows, so derived state is rebuilt, not patched
+    for card_id in report.card_ids:
+        card_cache.invalidate(card_id)
+    controller_hub.revoke(report.inactive)
+    rebuilds = []
+    if dashboard.loaded:
+        rebuilds.append(aggregates.rebuild(db, dashboard))
+    if member_index.loaded:
+        rebuilds.append(search_index.rebuild(db, member_index))
+    if allow_list.loaded:
+        rebuilds.append(allowlist.rebuild(db, allow_list))
+    for rebuild in rebuilds:
+        asyncio.ensure_future(rebuild).add_done_callback(_discard_result)
+
+@app.post("/users/import")
+async def import_users(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    on_conflict: str = Query("update", pattern="^(update|skip)$"),
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=5000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Cuerpo CSV (con cabecera) o NDJSON con los campos de POST /users y, opcionalmente, card_id y expiration_date"""
+    try:
+        records = member_import.iter_records(member_import.iter_lines(request.stream()), format)
+        report = await member_import.import_members(
+            db, records, UserCreate,
+            chunk_size=chunk_size,
+            concurrency=IMPORT_CONCURRENCY,
+            update_existing=on_conflict == "update"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al importar usuarios: {str(e)}")
+    if report.imported:
+        after_member_import(report)
+    return {"message": "Importación completada", **report.as_dict()}
+
 @app.put("/users/{card_id}")
-def update_user(card_id: str, user: UserUpdate, current_user: dict = Depends(get_current_user)):
+async def update_user(card_id: str, user: UserUpdate, current_user: dict = Depends(get_current_user)):
     try:
         # Check if user exists
-        response = supabase.table("memberships").select("*").eq("card_id", card_id.strip()).execute()
+        response = await db.execute(db.table("memberships").select(projection("users.current")).eq("card_id", card_id.strip()))
         if not response.data:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
@@ -250,9 +769,10 @@ def update_user(card_id: str, user: UserUpdate, current_user: dict = Depends(get
         updates = {k: v for k, v in user.dict().items() if v is not None}
         updates["updated_at"] = datetime.now().isoformat()
         
-        result = supabase.table("memberships").update(updates).eq("card_id", card_id.strip()).execute()
+        result = await db.execute(db.table("memberships").update(updates).eq("card_id", card_id.strip()))
         
         if result.data:
+            on_member_updated(response.data[0], result.data[0])
             return {
                 "message": "Usuario actualizado exitosamente", 
                 "user": result.data[0]
@@ -262,82 +782,234 @@ def update_user(card_id: str, user: UserUpdate, current_user: dict = Depends(get
         raise HTTPException(status_code=500, detail=f"Error al actualizar usuario: {str(e)}")
 
 @app.delete("/users/{card_id}")
-def delete_user(card_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_user(card_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        result = supabase.table("memberships").delete().eq("card_id", card_id.strip()).execute()
-        if result.data:
-            return {"message": "Usuario eliminado exitosamente"}
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        result = await db.execute(db.table("memberships").delete().eq("card_id", card_id.strip()))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al eliminar usuario: {str(e)}")
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    on_member_deleted(card_id.strip(), result.data[0])
+    return {"message": "Usuario eliminado exitosamente"}
 
 # Metrics endpoints
+def load_dashboard():
+    return loaders.run("aggregates", lambda: aggregates.rebuild(db, dashboard))
+
+def load_attendance():
+    return loaders.run("attendance", lambda: attendance.rebuild(db, attendance_series))
+
+def load_revenue():
+    return loaders.run("revenue", lambda: revenue.rebuild(db, ledger))
+
+def load_search():
+    return loaders.run("search", lambda: search_index.rebuild(db, member_index))
+
+async def refresh_recent():
+    recent = await db.execute(
+        db.table("memberships")
+        .select(projection("recent.memberships"))
+        .order("created_at", desc=True)
+        .limit(dashboard.recent_capacity)
+    )
+    dashboard.set_recent(recent.data or [])
+
 @app.get("/metrics")
-def get_metrics(current_user: dict = Depends(get_current_user)):
+async def get_metrics(current_user: dict = Depends(get_current_user)):
     try:
-        # Get users data
-        users_response = supabase.table("memberships").select("*").execute()
-        users = users_response.data or []
-        
-        # Get classes data
-        classes_response = supabase.table("classes").select("*").execute()
-        classes = classes_response.data or []
-        
-        # Get payments data
-        payments_response = supabase.table("payments").select("*").execute()
-        payments = payments_response.data or []
-        
-        # Calculate metrics
-        total_users = len(users)
-        active_users = len([u for u in users if u.get("active")])
-        total_classes = len(classes)
-        monthly_revenue = sum([p.get("amount", 0) for p in payments if p.get("created_at", "").startswith(datetime.now().strftime("%Y-%m"))])
-        
-        # Recent activity
-        recent_users = sorted(users, key=lambda x: x.get("created_at", ""), reverse=True)[:5]
+        # Cold pieces load in parallel; whatever misses the deadline keeps
+        # loading in the background and the response reports it as partial
+        calls = {}
+        if not dashboard.loaded:
+            calls["aggregates"] = load_dashboard()
+        if not attendance_series.loaded:
+            calls["attendance"] = load_attendance()
+        if not ledger.loaded:
+            calls["revenue"] = load_revenue()
+        if dashboard.recent_stale:
+            calls["recent"] = loaders.run("recent", refresh_recent)
+        refresh_if_stale(dashboard, load_dashboard)
+        refresh_if_stale(attendance_series, load_attendance)
+        refresh_if_stale(ledger, load_revenue)
+        result = await fanout(calls, deadline=METRICS_DEADLINE_SECONDS, cancel=False)
+        snapshot = dashboard.snapshot() if dashboard.loaded else None
         
         return {
             "summary": {
-                "total_users": total_users,
-                "active_users": active_users,
-                "inactive_users": total_users - active_users,
-                "total_classes": total_classes,
-                "monthly_revenue": monthly_revenue,
-                "growth_rate": 12.5  # Mock data
+                "total_users": snapshot["total_users"] if snapshot else None,
+                "active_users": snapshot["active_users"] if snapshot else None,
+                "inactive_users": snapshot["inactive_users"] if snapshot else None,
+                "total_classes": snapshot["total_classes"] if snapshot else None,
+                "monthly_revenue": (
+                    revenue.from_cents(ledger.month_total(date.today().strftime("%Y-%m"), status="completed"))
+                    if ledger.loaded else None
+                ),
+                "growth_rate": ledger.growth_rate() if ledger.loaded else None,
+                "attendance_growth_rate": attendance_series.growth_rate() if attendance_series.loaded else None
             },
             "recent_activity": [
                 {
                     "type": "user_registered",
-                    "user_name": user.get("name"),
-                    "timestamp": user.get("created_at")
-                } for user in recent_users
+                    "user_name": user["name"],
+                    "timestamp": user["created_at"]
+                } for user in (snapshot["recent_users"] if snapshot else [])
             ],
             "attendance_data": {
-                "labels": ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"],
-                "data": [120, 190, 170, 210, 240, 180, 150]
-            }
+                "labels": aggregates.WEEKDAY_LABELS,
+                "data": attendance_series.weekday_totals() if attendance_series.loaded else None
+            },
+            "partial": sorted(result.failed)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener métricas: {str(e)}")
 
+@app.post("/metrics/rebuild")
+async def rebuild_metrics(current_user: dict = Depends(get_current_user)):
+    try:
+        result = (await fanout({
+            "aggregates": aggregates.rebuild(db, dashboard),
+            "attendance": attendance.rebuild(db, attendance_series),
+            "revenue": revenue.rebuild(db, ledger)
+        })).check()
+        return {"message": "Métricas recalculadas exitosamente", "summary": result.get("aggregates")}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al recalcular métricas: {str(e)}")
+
+# Membership expiry endpoints
+@app.post("/memberships/sweep")
+async def run_expiry_sweep(current_user: dict = Depends(get_current_user)):
+    try:
+        result = await sweep_memberships()
+        return {"message": "Barrido de vencimientos completado", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al barrer vencimientos: {str(e)}")
+
+@app.get("/memberships/reminders")
+async def get_renewal_reminders(
+    pending: bool = Query(True),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        query = db.table(expiry.REMINDERS_TABLE).select(projection("expiry.renewal_reminders"))
+        if pending:
+            query = query.is_("sent_at", "null")
+        response = await db.execute(query.order("expiration_date").limit(limit))
+        return {"reminders": response.data or []}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener avisos de renovación: {str(e)}")
+
+@app.post("/memberships/reminders/{reminder_id}/sent")
+async def mark_reminder_sent(reminder_id: int, current_user: dict = Depends(get_current_user)):
+    try:
+        response = await db.execute(
+            db.table(expiry.REMINDERS_TABLE)
+            .update({"sent_at": datetime.now().isoformat()})
+            .eq("id", reminder_id)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al marcar el aviso: {str(e)}")
+    if not response.data:
+        raise HTTPException(status_code=404, detail="Aviso no encontrado")
+    return {"message": "Aviso marcado como enviado"}
+
+# Attendance endpoints
+async def ensure_attendance_loaded():
+    if not attendance_series.loaded:
+        await load_attendance()
+    refresh_if_stale(attendance_series, load_attendance)
+
+@app.get("/attendance/hourly")
+async def get_attendance_hourly(
+    days: int = Query(14, ge=1, le=35),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        await ensure_attendance_loaded()
+        now = datetime.now()
+        buckets = attendance_series.hourly(now - timedelta(days=days), now)
+        return {"granularity": "hour", "days": days, "buckets": buckets}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener asistencia: {str(e)}")
+
+@app.get("/attendance/daily")
+async def get_attendance_daily(
+    days: int = Query(30, ge=1, le=400),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        await ensure_attendance_loaded()
+        today = datetime.now().date()
+        buckets = attendance_series.daily(today - timedelta(days=days - 1), today)
+        return {"granularity": "day", "days": days, "buckets": buckets}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener asistencia: {str(e)}")
+
+@app.get("/attendance/monthly")
+async def get_attendance_monthly(current_user: dict = Depends(get_current_user)):
+    try:
+        await ensure_attendance_loaded()
+        return {"granularity": "month", "buckets": attendance_series.monthly()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener asistencia: {str(e)}")
+
+@app.get("/attendance/occupancy")
+async def get_attendance_occupancy(current_user: dict = Depends(get_current_user)):
+    try:
+        await ensure_attendance_loaded()
+        return attendance_series.occupancy()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener ocupación: {str(e)}")
+
 # Classes endpoints
+CLASS_SORTS = ("created_at", "name", "capacity")
+PAYMENT_SORTS = ("created_at", "amount")
+
+def parse_listing(sort: str, allowed, cursor: Optional[str], projection_name: str, fields: Optional[str]):
+    """Orden, cursor y columnas de un listado; lanza HTTPException 400 si algo no es válido"""
+    try:
+        keyset, descending = parse_sort(sort, allowed)
+        selected = columns(projection_name, fields, required=keyset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        after = decode_cursor(cursor, keyset, descending) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return keyset, descending, selected, after
+
 @app.get("/classes")
-def get_classes(current_user: dict = Depends(get_current_user)):
+async def get_classes(
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=200),
+    instructor: Optional[str] = None,
+    sort: str = "name",
+    cursor: Optional[str] = None,
+    count: str = Query("exact", pattern="^(exact|planned|estimated|none)$"),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    keyset, descending, selected, after = parse_listing(sort, CLASS_SORTS, cursor, "classes.list", fields)
     try:
-        response = supabase.table("classes").select("*").execute()
-        return response.data or []
+        query = db.table("classes").select(",".join(selected), count=listing_count(count, after))
+        if instructor:
+            query = query.eq("instructor", instructor)
+        rows, total = await fetch_page(query, after, page, limit, keyset, descending)
+        next_cursor = encode_cursor(rows[-1], keyset, descending) if len(rows) == limit else None
+        return page_envelope("classes", rows, total, None if after else page, limit, next_cursor)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener clases: {str(e)}")
 
 @app.post("/classes")
-def create_class(class_data: ClassCreate, current_user: dict = Depends(get_current_user)):
+async def create_class(class_data: ClassCreate, current_user: dict = Depends(get_current_user)):
     try:
         class_dict = class_data.dict()
         class_dict["created_at"] = datetime.now().isoformat()
         class_dict["id"] = str(uuid.uuid4())
         
-        result = supabase.table("classes").insert(class_dict).execute()
+        result = await db.execute(db.table("classes").insert(class_dict))
         if result.data:
+            dashboard.class_created()
             return {
                 "message": "Clase creada exitosamente",
                 "class": result.data[0]
@@ -346,25 +1018,124 @@ def create_class(class_data: ClassCreate, current_user: dict = Depends(get_curre
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al crear clase: {str(e)}")
 
+# Class booking endpoints; capacity and the waitlist are enforced by the
+# book_class/cancel_booking database functions under the class row lock
+@app.get("/classes/{class_id}/occupancy")
+async def get_class_occupancy(class_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        return await bookings.get_occupancy(db, class_id)
+    except bookings.BookingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener ocupación de la clase: {str(e)}")
+
+@app.get("/classes/{class_id}/bookings")
+async def get_class_bookings(
+    class_id: str,
+    status: str = Query("booked", pattern="^(booked|waitlisted|cancelled)$"),
+    after: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        rows = await bookings.list_bookings(db, class_id, status, after, limit)
+        return {"bookings": rows, "next_after": rows[-1]["id"] if len(rows) == limit else None}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener reservas: {str(e)}")
+
+@app.get("/classes/{class_id}/bookings/{card_id}")
+async def get_class_booking(class_id: str, card_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        booking = await bookings.get_booking(db, class_id, card_id.strip())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener la reserva: {str(e)}")
+    if booking is None:
+        raise HTTPException(status_code=404, detail="Reserva no encontrada")
+    return booking
+
+@app.post("/classes/{class_id}/bookings")
+async def create_booking(class_id: str, booking: BookingCreate, current_user: dict = Depends(get_current_user)):
+    card_id = booking.card_id.strip()
+    try:
+        card = await get_card(card_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al reservar: {str(e)}")
+    if card is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    if not evaluate_access(card, datetime.now()):
+        raise HTTPException(status_code=403, detail="Membresía inactiva o vencida")
+    try:
+        result = await bookings.book(db, class_id, card_id)
+    except bookings.BookingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al reservar: {str(e)}")
+    return {
+        "message": "Reserva confirmada" if result["status"] == "booked" else "Clase llena: en lista de espera",
+        "booking": result
+    }
+
+@app.delete("/classes/{class_id}/bookings/{card_id}")
+async def cancel_booking(class_id: str, card_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        result = await bookings.cancel(db, class_id, card_id.strip())
+    except bookings.BookingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al cancelar la reserva: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Reserva no encontrada")
+    return {"message": "Reserva cancelada", **result}
+
 # Payments endpoints
 @app.get("/payments")
-def get_payments(current_user: dict = Depends(get_current_user)):
+async def get_payments(
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    sort: str = "-created_at",
+    cursor: Optional[str] = None,
+    count: str = Query("exact", pattern="^(exact|planned|estimated|none)$"),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    keyset, descending, selected, after = parse_listing(sort, PAYMENT_SORTS, cursor, "payments.list", fields)
     try:
-        response = supabase.table("payments").select("*").execute()
-        return response.data or []
+        query = db.table("payments").select(",".join(selected), count=listing_count(count, after))
+        for column, value in (("user_id", user_id), ("status", status), ("payment_method", payment_method)):
+            if value:
+                query = query.eq(column, value)
+        # date_from is inclusive and date_to exclusive, so months chain without overlap
+        if date_from:
+            query = query.gte("created_at", date_from.isoformat())
+        if date_to:
+            query = query.lt("created_at", date_to.isoformat())
+        rows, total = await fetch_page(query, after, page, limit, keyset, descending)
+        next_cursor = encode_cursor(rows[-1], keyset, descending) if len(rows) == limit else None
+        return page_envelope("payments", rows, total, None if after else page, limit, next_cursor)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener pagos: {str(e)}")
 
 @app.post("/payments")
-def create_payment(payment: PaymentCreate, current_user: dict = Depends(get_current_user)):
+async def create_payment(payment: PaymentCreate, current_user: dict = Depends(get_current_user)):
     try:
         payment_dict = payment.dict()
         payment_dict["created_at"] = datetime.now().isoformat()
         payment_dict["id"] = str(uuid.uuid4())
         payment_dict["status"] = "completed"
         
-        result = supabase.table("payments").insert(payment_dict).execute()
+        result = await db.execute(db.table("payments").insert(payment_dict))
         if result.data:
+            try:
+                await revenue.persist(db, ledger, result.data[0])
+            except Exception as e:
+                # The payment is stored; the README backfill recomputes the totals
+                logger.warning("No se pudo sumar el pago %s a revenue_daily: %r", payment_dict["id"], e)
+            ledger.record(result.data[0])
             return {
                 "message": "Pago registrado exitosamente",
                 "payment": result.data[0]
@@ -375,99 +1146,470 @@ def create_payment(payment: PaymentCreate, current_user: dict = Depends(get_curr
 
 # Configuration endpoints
 @app.get("/config")
-def get_config(current_user: dict = Depends(get_current_user)):
+async def get_config(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     try:
-        response = supabase.table("config").select("*").execute()
-        config = {}
-        for item in response.data or []:
-            config[item["key"]] = item["value"]
-        return config
+        if not site_config.loaded:
+            await loaders.run("config", lambda: config_cache.load(db, site_config))
+        elif site_config.needs_check(CONFIG_VERSION_CHECK_SECONDS):
+            # Serve what we have; a change made on another worker shows up on the next request
+            loaders.run("config.version", lambda: config_cache.refresh_if_changed(db, site_config)).add_done_callback(_discard_result)
+        headers = {"ETag": site_config.etag, "Cache-Control": "private, no-cache"}
+        if site_config.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return site_config.config
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener configuración: {str(e)}")
 
 @app.post("/config")
-def update_config(config: ConfigUpdate, current_user: dict = Depends(get_current_user)):
+async def update_config(config: ConfigUpdate, current_user: dict = Depends(get_current_user)):
     try:
-        result = supabase.table("config").upsert({
+        result = await db.execute(db.table("config").upsert({
             "key": config.key,
             "value": config.value,
             "updated_at": datetime.now().isoformat()
-        }).execute()
+        }))
+        # Not single-flight: a load already in progress may predate this write
+        await config_cache.load(db, site_config)
         
         return {"message": "Configuración actualizada exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al actualizar configuración: {str(e)}")
 
 # Access control endpoints
+def offline_access(card_id: str) -> dict:
+    card = allow_list.get(card_id.strip())
+    access_granted = card is not None and evaluate_access(card, datetime.now())
+    return {
+        "card_id": card_id,
+        "access": access_granted,
+        "active": card is not None,
+        "expiration": card.get("expiration_date") if card else None,
+        "source": "allowlist",
+        "message": "Acceso permitido" if access_granted else "Acceso denegado"
+    }
+
+async def process_access(card_id: str) -> dict:
+    try:
+        user = await get_card(card_id.strip())
+    except Exception:
+        # Database down or slow: decide from the last known allow-list
+        if not allow_list.loaded:
+            raise
+        return offline_access(card_id)
+    if user is None:
+        return {
+            "card_id": card_id,
+            "access": False,
+            "message": "Usuario no encontrado"
+        }
+    
+    is_active = user.get("active", False)
+    expiration_date = user.get("expiration_date")
+    access_granted = evaluate_access(user, datetime.now())
+    
+    # Register access attempt: one append-only event row; last_access on the
+    # membership row is written behind by last_access_buffer
+    if access_granted:
+        now = datetime.now().isoformat()
+        try:
+            await record_entry(db, card_id.strip(), now)
+            attendance_series.record(now)
+            last_access_buffer.mark(card_id.strip(), now)
+        except Exception:
+            # Keep the door working; the entry is lost unless the controller
+            # replays it through /check_access/batch
+            if not allow_list.loaded:
+                raise
+    
+    return {
+        "card_id": card_id,
+        "access": access_granted,
+        "user_name": user.get("name"),
+        "active": is_active,
+        "expiration": expiration_date,
+        "message": "Acceso permitido" if access_granted else "Acceso denegado"
+    }
+
 @app.get("/check_access/{card_id}")
-def check_access(card_id: str):
+async def check_access(card_id: str):
     try:
-        response = supabase.table("memberships").select("*").eq("card_id", card_id.strip()).execute()
-        if not response.data:
-            return {
+        return await process_access(card_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al verificar acceso: {str(e)}")
+
+@app.post("/check_access/batch")
+async def check_access_batch(batch: AccessBatch, controller: dict = Depends(get_controller)):
+    if len(batch.events) > ACCESS_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=400, detail=f"Máximo {ACCESS_BATCH_MAX_EVENTS} eventos por lote")
+    try:
+        received = datetime.now()
+        # Swipes the offline buffer can't have produced: a future one would
+        # move last_access ahead for good
+        earliest = received - timedelta(seconds=ACCESS_BATCH_MAX_AGE_SECONDS)
+        latest = received + timedelta(seconds=ACCESS_BATCH_MAX_SKEW_SECONDS)
+        decisions: Dict[str, dict] = {}
+        moments: Dict[str, datetime] = {}
+        pending = []
+        for event in batch.events:
+            if event.event_id in decisions:
+                continue
+            moment = local_time(event.timestamp) if event.timestamp else received
+            if not earliest <= moment <= latest:
+                decisions[event.event_id] = {
+                    "event_id": event.event_id,
+                    "card_id": event.card_id.strip(),
+                    "timestamp": moment.isoformat(),
+                    "access": False,
+                    "user_name": None,
+                    "message": "Marca de tiempo fuera de rango",
+                    "duplicate": False
+                }
+                continue
+            moments[event.event_id] = moment
+            previous = processed_events.get(event.event_id)
+            if previous is not None:
+                decisions[event.event_id] = {**previous, "duplicate": True}
+            else:
+                decisions[event.event_id] = None
+                pending.append(event)
+        
+        # One lookup for every card in the batch, one write for every entry
+        cards = await get_cards({event.card_id.strip() for event in pending})
+        entries, swipes = [], set()
+        for event in pending:
+            card_id = event.card_id.strip()
+            moment = moments[event.event_id]
+            card = cards.get(card_id)
+            granted = card is not None and evaluate_access(card, moment)
+            decisions[event.event_id] = {
+                "event_id": event.event_id,
                 "card_id": card_id,
-                "access": False,
-                "message": "Usuario no encontrado"
+                "timestamp": moment.isoformat(),
+                "access": granted,
+                "user_name": card.get("name") if card else None,
+                "message": "Usuario no encontrado" if card is None
+                           else "Acceso permitido" if granted else "Acceso denegado",
+                "duplicate": False
             }
+            # Two event_ids for the same swipe are one entry
+            if granted and (card_id, moment) not in swipes:
+                swipes.add((card_id, moment))
+                entries.append({
+                    "event_id": event.event_id,
+                    "card_id": card_id,
+                    "timestamp": moment.isoformat(),
+                    "type": "entry"
+                })
         
-        user = response.data[0]
-        is_active = user.get("active", False)
-        expiration_date = user.get("expiration_date")
-        
-        access_granted = is_active
-        if expiration_date:
-            try:
-                exp_date = datetime.fromisoformat(expiration_date.replace('Z', '+00:00'))
-                access_granted = access_granted and datetime.now() < exp_date
-            except:
-                pass
+        inserted = await record_entries(db, entries)
+        for entry in entries:
+            if entry["event_id"] not in inserted:
+                # Already stored by an earlier delivery of the same event
+                decisions[entry["event_id"]]["duplicate"] = True
+                continue
+            attendance_series.record(entry["timestamp"])
+            # Replayed swipes never move last_access backwards
+            last_access_buffer.mark(entry["card_id"], entry["timestamp"])
         
-        # Register access attempt
-        if access_granted:
-            entry_history = user.get("entry_history", [])
-            entry_history.append({
-                "timestamp": datetime.now().isoformat(),
-                "type": "entry"
-            })
-            
-            supabase.table("memberships").update({
-                "entry_history": entry_history,
-                "last_access": datetime.now().isoformat()
-            }).eq("card_id", card_id.strip()).execute()
+        for event in pending:
+            processed_events.set(event.event_id, decisions[event.event_id])
         
+        results, seen = [], set()
+        for event in batch.events:
+            decision = decisions[event.event_id]
+            results.append({**decision, "duplicate": True} if event.event_id in seen else decision)
+            seen.add(event.event_id)
         return {
-            "card_id": card_id,
-            "access": access_granted,
-            "user_name": user.get("name"),
-            "active": is_active,
-            "expiration": expiration_date,
-            "message": "Acceso permitido" if access_granted else "Acceso denegado"
+            "results": results,
+            "granted": sum(1 for r in results if r["access"] and not r["duplicate"]),
+            "denied": sum(1 for r in results if not r["access"] and not r["duplicate"]),
+            "duplicates": sum(1 for r in results if r["duplicate"])
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al verificar acceso: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al verificar accesos: {str(e)}")
+
+@app.get("/access/allowlist")
+async def get_allowlist(
+    since: Optional[int] = Query(None, ge=0),
+    generation: Optional[str] = None,
+    controller: dict = Depends(get_controller)
+):
+    try:
+        if not allow_list.loaded:
+            await load_allowlist()
+        elif (datetime.now() - allow_list.loaded_at).total_seconds() > ALLOWLIST_REFRESH_SECONDS:
+            # Picks up writes made by other workers; served from memory meanwhile
+            load_allowlist().add_done_callback(_discard_result)
+        now = datetime.now()
+        payload = allow_list.snapshot(now) if since is None else allow_list.changes(since, generation, now)
+        payload["iat"] = int(now.timestamp())
+        return {
+            "generation": payload["generation"],
+            "version": payload["version"],
+            "full": payload["full"],
+            "token": jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener lista de acceso: {str(e)}")
+
+# Turnstile controllers
+@app.post("/controllers/token")
+async def issue_controller_token(request: ControllerTokenRequest, current_user: dict = Depends(get_current_user)):
+    token = create_access_token(
+        {"sub": request.device_id, "role": "controller"},
+        expires_delta=timedelta(days=CONTROLLER_TOKEN_EXPIRE_DAYS)
+    )
+    return {"access_token": token, "token_type": "bearer", "device_id": request.device_id}
+
+@app.post("/controllers/{device_id}/revoke")
+async def revoke_controller(device_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        await revoke(token_cache.subject_revocation(device_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al revocar controlador: {str(e)}")
+    controller_hub.kick(device_id)
+    return {"message": "Controlador revocado exitosamente"}
+
+async def push_messages(websocket: WebSocket, connection):
+    # Single writer for the socket: decisions, revocations and heartbeats
+    while True:
+        try:
+            message = await asyncio.wait_for(connection.outbox.get(), CONTROLLER_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            message = {"type": "ping"}
+        await websocket.send_json(message)
+        if message["type"] == "close":
+            await websocket.close(code=1008)
+            return
+
+@app.websocket("/ws/turnstile")
+async def turnstile_socket(websocket: WebSocket):
+    """Canal persistente: {"type": "auth", "token"} y después {"type": "check", "card_id"}"""
+    await websocket.accept()
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), CONTROLLER_HEARTBEAT_SECONDS)
+        # Valid JSON that isn't an object ([1,2], "auth") is a bad hello too
+        if isinstance(hello, dict) and hello.get("type") == "auth":
+            claims = decode_token(str(hello.get("token") or ""))
+        else:
+            claims = None
+    except KeyError:
+        # Binary frame: receive_json only reads text frames
+        await websocket.close(code=1003)
+        return
+    except (asyncio.TimeoutError, HTTPException, ValueError, WebSocketDisconnect):
+        claims = None
+    if not claims or claims.get("role") not in ("controller", "admin"):
+        await websocket.close(code=1008)
+        return
+    
+    device_id = claims["sub"]
+    connection = controller_hub.connect(device_id)
+    await websocket.send_json({
+        "type": "auth_ok",
+        "device_id": device_id,
+        "heartbeat_seconds": CONTROLLER_HEARTBEAT_SECONDS
+    })
+    sender = asyncio.create_task(push_messages(websocket, connection))
+    try:
+        while not sender.done():
+            try:
+                # Any message counts as a heartbeat; two silent intervals drop the link
+                message = await asyncio.wait_for(websocket.receive_json(), CONTROLLER_HEARTBEAT_SECONDS * 2)
+            except asyncio.TimeoutError:
+                break
+            except ValueError:
+                await connection.outbox.put({"type": "error", "code": "invalid_json"})
+                continue
+            except KeyError:
+                await websocket.close(code=1003)
+                break
+            if not isinstance(message, dict):
+                await connection.outbox.put({"type": "error", "code": "invalid_message"})
+                continue
+            kind = message.get("type")
+            if kind == "ping":
+                await connection.outbox.put({"type": "pong"})
+            elif kind == "check":
+                retry_after = controller_hub.throttle(device_id)
+                if retry_after:
+                    await connection.outbox.put({
+                        "type": "error",
+                        "code": "rate_limited",
+                        "request_id": message.get("request_id"),
+                        "retry_after": round(retry_after, 3)
+                    })
+                    continue
+                try:
+                    decision = await process_access(str(message.get("card_id", "")))
+                    await connection.outbox.put({"type": "decision", "request_id": message.get("request_id"), **decision})
+                except Exception as e:
+                    await connection.outbox.put({
+                        "type": "error",
+                        "code": "check_failed",
+                        "request_id": message.get("request_id"),
+                        "message": f"Error al verificar acceso: {str(e)}"
+                    })
+            elif kind != "pong":
+                await connection.outbox.put({"type": "error", "code": "unknown_type"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        controller_hub.disconnect(connection)
+        sender.cancel()
+        try:
+            await sender
+        except (asyncio.CancelledError, WebSocketDisconnect):
+            pass
+        except Exception as e:
+            logger.warning("Error al enviar al controlador %s: %r", device_id, e)
 
 # Reports endpoints
+@app.get("/reports/revenue")
+async def get_revenue_report(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    payment_method: Optional[str] = None,
+    status: Optional[str] = "completed",
+    months: int = Query(12, ge=1, le=120),
+    current_user: dict = Depends(get_current_user)
+):
+    # Defaults to the current month; date_to is exclusive like /payments
+    date_from = date_from or date.today().replace(day=1)
+    date_to = date_to or (date_from.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if date_to <= date_from:
+        raise HTTPException(status_code=400, detail="date_to debe ser posterior a date_from")
+    try:
+        if not ledger.loaded:
+            await load_revenue()
+        refresh_if_stale(ledger, load_revenue)
+        last_day = date_to - timedelta(days=1)
+        status = status or None
+        total = ledger.total(date_from, last_day, payment_method, status)
+        breakdown = ledger.breakdown(date_from, last_day, status)
+        return {
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat(),
+            "payment_method": payment_method,
+            "status": status,
+            "total_cents": total,
+            "total": revenue.from_cents(total),
+            "by_method_cents": breakdown["by_method"],
+            "by_status_cents": breakdown["by_status"],
+            "monthly_cents": ledger.months(months, status),
+            "growth_rate": ledger.growth_rate(status)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener ingresos: {str(e)}")
+
 @app.get("/reports/users")
-def get_user_reports(current_user: dict = Depends(get_current_user)):
+async def get_user_reports(current_user: dict = Depends(get_current_user)):
+    def count_members(**filters):
+        query = db.table("memberships").select("id", count="exact", head=True)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        return db.execute(query)
+    
     try:
-        response = supabase.table("memberships").select("*").execute()
-        users = response.data or []
+        # The database counts; the rows themselves go through /reports/users/export
+        result = await fanout({
+            "total": count_members(),
+            "active": count_members(active=True),
+            "basic": count_members(membership="basic"),
+            "premium": count_members(membership="premium"),
+            "vip": count_members(membership="vip")
+        }, deadline=REPORTS_DEADLINE_SECONDS)
+        
+        def counted(name):
+            response = result.get(name)
+            return response.count if response is not None else None
         
         return {
-            "total_users": len(users),
-            "active_users": len([u for u in users if u.get("active")]),
+            "total_users": counted("total"),
+            "active_users": counted("active"),
             "membership_distribution": {
-                "basic": len([u for u in users if u.get("membership") == "basic"]),
-                "premium": len([u for u in users if u.get("membership") == "premium"]),
-                "vip": len([u for u in users if u.get("membership") == "vip"])
+                "basic": counted("basic"),
+                "premium": counted("premium"),
+                "vip": counted("vip")
             },
-            "users": users
+            "partial": sorted(result.failed)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar reporte: {str(e)}")
 
+@app.get("/reports/users/export")
+async def export_user_reports(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        selected = columns("reports.users", fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        content = await exports.stream_table(db, "memberships", selected, format)
+        return StreamingResponse(
+            content,
+            media_type=exports.FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="reporte_usuarios.{format}"'}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al exportar reporte: {str(e)}")
+
+@app.get("/cache/stats")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    return {
+        "cards": card_cache.stats(),
+        "member_changes": member_changes.stats(),
+        "tokens": token_cache.stats(),
+        "revocations": revocation_sync.stats(),
+        "password_hasher": password_hasher.stats(),
+        "controllers": controller_hub.stats(),
+        "allowlist": allow_list.stats(),
+        "config": site_config.stats(),
+        "revenue": ledger.stats(),
+        "last_access": last_access_buffer.stats(),
+        "expiry": expiry_sweeper.stats(),
+        "http": response_stats.stats(),
+        "search": {
+            "backend": "database" if search_rpc_available else "local",
+            **member_index.stats()
+        }
+    }
+
+# Numeric fields of the stats above, as gauges on /internal/metrics
+for component, stats in {
+    "cards": card_cache.stats,
+    "member_changes": member_changes.stats,
+    "tokens": token_cache.stats,
+    "revocations": revocation_sync.stats,
+    "password_hasher": password_hasher.stats,
+    "controllers": controller_hub.stats,
+    "allowlist": allow_list.stats,
+    "config": site_config.stats,
+    "revenue": ledger.stats,
+    "last_access": last_access_buffer.stats,
+    "expiry": expiry_sweeper.stats,
+    "http_cache": response_stats.stats,
+    "search": member_index.stats
+}.items():
+    metrics_registry.collect(component, stats)
+
+@app.get("/internal/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    # Served on the public port: without a token configured the route is off
+    if not INTERNAL_METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Métricas internas desactivadas: falta INTERNAL_METRICS_TOKEN")
+    if not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {INTERNAL_METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="No autorizado")
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 if __name__ == "__main__":
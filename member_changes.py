@@ -0,0 +1,154 @@
+"""
+Cambios de memberships hechos por otros workers.
+
+La caché de tarjetas, la lista de acceso offline y las conexiones de los
+torniquetes son de cada proceso: un hook de escritura solo avisa al worker
+que atendió la petición. Un trigger anota en ``membership_changes`` el
+``card_id`` de cada alta, cambio o baja (también los de la importación y el
+barrido de vencimientos) y cada worker lee las filas nuevas cada pocos
+segundos.
+
+Los ``id`` de un BIGSERIAL no se confirman en orden: una transacción lenta
+puede dejar un ``id`` menor detrás del último leído. Por eso cada lectura
+vuelve a pedir las últimas ``overlap`` filas y descarta las ya aplicadas.
+Sin la tabla, los cambios de otros workers llegan cuando vence el TTL de la
+caché.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+CHANGES_TABLE = "membership_changes"
+
+
+def _missing_table(error: APIError) -> bool:
+    # 42P01 from Postgres, PGRST205 from PostgREST's schema cache
+    return error.code in ("42P01", "PGRST205")
+
+
+class MemberChanges:
+    """Posición de lectura en membership_changes y sus contadores"""
+
+    def __init__(self, interval: float = 2, overlap: int = 200, page_size: int = 1000,
+                 retention: timedelta = timedelta(days=1)):
+        self.interval = interval
+        self.overlap = overlap
+        self.page_size = page_size
+        self.retention = retention
+        self._task: Optional[asyncio.Task] = None
+        self.available = True
+        # None until the first poll: older changes predate this process's caches
+        self.last_id: Optional[int] = None
+        self._seen: Set[int] = set()
+        self._pruned_at = 0.0
+        self.polls = 0
+        self.received = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def live(self) -> bool:
+        """True si los cambios de otros workers llegan por este canal"""
+        return self.available and self.interval > 0
+
+    def _disable(self, error: APIError):
+        self.available = False
+        self.last_error = error.message or str(error)
+
+    async def poll(self, db) -> List[str]:
+        """card_id cambiados desde la última lectura, sin repetir"""
+        if not self.available:
+            return []
+        try:
+            if self.last_id is None:
+                response = await db.execute(
+                    db.table(CHANGES_TABLE).select("id").order("id", desc=True).limit(self.overlap)
+                )
+                self._seen = {row["id"] for row in response.data or []}
+                self.last_id = max(self._seen, default=0)
+                self.polls += 1
+                return []
+            changed = []
+            while True:
+                response = await db.execute(
+                    db.table(CHANGES_TABLE)
+                    .select("id,card_id")
+                    .gt("id", max(self.last_id - self.overlap, 0))
+                    .order("id")
+                    .limit(self.page_size + self.overlap)
+                )
+                rows = response.data or []
+                for row in rows:
+                    if row["id"] not in self._seen:
+                        self._seen.add(row["id"])
+                        changed.append(row["card_id"])
+                    self.last_id = max(self.last_id, row["id"])
+                if len(rows) < self.page_size + self.overlap:
+                    break
+            floor = self.last_id - self.overlap
+            self._seen = {i for i in self._seen if i > floor}
+            await self._prune(db)
+        except APIError as e:
+            if not _missing_table(e):
+                self.failures += 1
+                self.last_error = e.message or str(e)
+                raise
+            self._disable(e)
+            return []
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        self.polls += 1
+        self.received += len(changed)
+        return list(dict.fromkeys(changed))
+
+    async def _prune(self, db):
+        # Hourly; by then every running worker has read rows a day old
+        if time.monotonic() - self._pruned_at < 3600:
+            return
+        self._pruned_at = time.monotonic()
+        await db.execute(
+            db.table(CHANGES_TABLE)
+            .delete(returning=ReturnMethod.minimal)
+            .lt("changed_at", (datetime.now() - self.retention).isoformat())
+        )
+
+    async def run(self, job: Callable[[], Awaitable]):
+        while True:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Counted in stats(); the next pass retries
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self, job: Callable[[], Awaitable]):
+        if self.interval > 0:
+            self._task = asyncio.ensure_future(self.run(job))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shared": self.available,
+            "interval_seconds": self.interval,
+            "last_id": self.last_id,
+            "polls": self.polls,
+            "received": self.received,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
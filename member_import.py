@@ -0,0 +1,250 @@
+"""
+Importación masiva de miembros desde CSV o NDJSON.
+
+El archivo se lee en streaming, cada fila se valida con el modelo de
+``POST /users`` y las filas válidas se escriben por bloques de
+``chunk_size`` (``concurrency`` bloques a la vez). Cada bloque consulta qué
+tarjetas ya existen: las nuevas se insertan con los valores por defecto de
+``POST /users`` y las existentes se actualizan solo con las columnas que trae
+el archivo, así importar ``card_id,name,email,phone`` no reactiva tarjetas
+ni acorta membresías. Si una escritura falla por un dato concreto se divide
+en mitades hasta aislar las filas culpables, así un error no descarta el
+resto del bloque. El resultado es un informe con el número de línea y el
+motivo de cada fila rechazada.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from pydantic import ValidationError
+
+FORMATS = ("csv", "ndjson")
+
+
+def new_card_id() -> str:
+    # Longer than POST /users ids: a 10k import must not collide with itself
+    return uuid.uuid4().hex[:12].upper()
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Líneas de texto UTF-8 de un cuerpo recibido por trozos"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_records(lines: AsyncIterable[str], export_format: str) -> AsyncIterator[Tuple[int, Any]]:
+    """(número de línea, dict o mensaje de error) por registro del archivo"""
+    if export_format == "ndjson":
+        number = 0
+        async for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"JSON inválido: {e}"
+                continue
+            yield number, record if isinstance(record, dict) else "Se esperaba un objeto JSON"
+        return
+
+    header: Optional[List[str]] = None
+    number, start, buffered = 0, 0, ""
+    async for line in lines:
+        number += 1
+        if not buffered:
+            start = number
+        buffered += line
+        # A quoted field may span lines: wait until the quotes are balanced
+        if buffered.count('"') % 2:
+            continue
+        text, buffered = buffered, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"Se esperaban {len(header)} columnas y hay {len(values)}"
+            continue
+        yield start, dict(zip(header, values))
+    if buffered.strip():
+        yield start, "Comillas sin cerrar al final del archivo"
+
+
+def member_row(record: Dict[str, Any], model, now: datetime) -> Tuple[Dict[str, Any], Tuple[str, ...]]:
+    """Validar un registro; devuelve la fila para insertar y las columnas que trae el archivo.
+
+    Lanza ValueError si el registro no es válido.
+    """
+    # Empty CSV cells mean "use the default"
+    values = {k: v for k, v in record.items() if v not in ("", None)}
+    try:
+        member = model(**values)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        ))
+    row = member.dict()
+    given = tuple(column for column in row if column in values)
+    row["card_id"] = str(values.get("card_id") or new_card_id()).strip()
+    row["expiration_date"] = values.get("expiration_date") or (now + timedelta(days=30)).isoformat()
+    if "expiration_date" in values:
+        given += ("expiration_date",)
+    # created_at is left to the column default so re-importing keeps it
+    row["updated_at"] = now.isoformat()
+    return row, given
+
+
+class ImportReport:
+    """Contadores y errores por línea de una importación"""
+
+    def __init__(self, max_errors: int = 1000):
+        self.max_errors = max_errors
+        self.received = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.failed = 0
+        self.card_ids: List[str] = []
+        self.inactive: List[str] = []
+
+    def error(self, line: int, message: str, card_id: Optional[str] = None):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "card_id": card_id, "error": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+
+def _row_error(error: Exception) -> bool:
+    # Data errors (class 22) and constraint violations (class 23) belong to
+    # specific rows; anything else (timeouts, auth) fails the whole block
+    return isinstance(error, APIError) and str(error.code or "")[:2] in ("22", "23")
+
+
+async def import_members(db, records: AsyncIterable[Tuple[int, Any]], model, chunk_size: int = 500,
+                         concurrency: int = 4, update_existing: bool = True,
+                         max_errors: int = 1000) -> ImportReport:
+    """Validar y escribir los registros por bloques; devuelve el informe"""
+    report = ImportReport(max_errors)
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: List[asyncio.Task] = []
+    seen: Dict[str, int] = {}
+    now = datetime.now()
+
+    async def insert(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # A card created meanwhile by someone else is left alone and comes
+        # back missing from the response, so it counts as skipped
+        response = await db.execute(db.table("memberships").upsert(
+            rows, on_conflict="card_id", ignore_duplicates=True, returning=ReturnMethod.representation
+        ))
+        return response.data or []
+
+    async def update(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Every row has the same columns, so the upsert sets only those
+        await db.execute(db.table("memberships").upsert(
+            rows, on_conflict="card_id", returning=ReturnMethod.minimal
+        ))
+        return rows
+
+    async def attempt(rows: List[Tuple[int, Dict[str, Any]]], send):
+        try:
+            written = await send([row for _, row in rows])
+        except Exception as e:
+            if len(rows) > 1 and _row_error(e):
+                middle = len(rows) // 2
+                await attempt(rows[:middle], send)
+                await attempt(rows[middle:], send)
+                return
+            message = getattr(e, "message", None) or str(e)
+            for line, row in rows:
+                report.error(line, message, row["card_id"])
+            return
+        report.imported += len(written)
+        report.skipped += len(rows) - len(written)
+        report.card_ids.extend(row["card_id"] for row in written)
+        report.inactive.extend(row["card_id"] for row in written if row.get("active") is False)
+
+    async def write(rows: List[Tuple[int, Dict[str, Any], Tuple[str, ...]]]):
+        try:
+            response = await db.execute(
+                db.table("memberships").select("card_id").in_("card_id", [row["card_id"] for _, row, _ in rows])
+            )
+        except Exception as e:
+            message = getattr(e, "message", None) or str(e)
+            for line, row, _ in rows:
+                report.error(line, message, row["card_id"])
+            return
+        existing = {row["card_id"] for row in response.data or []}
+        new = [(line, row) for line, row, _ in rows if row["card_id"] not in existing]
+        if new:
+            await attempt(new, insert)
+        if not update_existing:
+            report.skipped += len(rows) - len(new)
+            return
+        # Existing cards keep whatever the file leaves out: one upsert per column set
+        groups: Dict[Tuple[str, ...], List[Tuple[int, Dict[str, Any]]]] = {}
+        for line, row, given in rows:
+            if row["card_id"] in existing:
+                columns = ("card_id", *given, "updated_at")
+                groups.setdefault(columns, []).append((line, {column: row[column] for column in columns}))
+        for group in groups.values():
+            await attempt(group, update)
+
+    async def flush(rows):
+        try:
+            await write(rows)
+        finally:
+            semaphore.release()
+
+    chunk: List[Tuple[int, Dict[str, Any], Tuple[str, ...]]] = []
+    async for line, record in records:
+        report.received += 1
+        if isinstance(record, str):
+            report.error(line, record)
+            continue
+        try:
+            row, given = member_row(record, model, now)
+        except ValueError as e:
+            report.error(line, str(e), record.get("card_id") or None)
+            continue
+        # One upsert can't touch the same card twice
+        if row["card_id"] in seen:
+            report.error(line, f"card_id repetido (línea {seen[row['card_id']]})", row["card_id"])
+            continue
+        seen[row["card_id"]] = line
+        chunk.append((line, row, given))
+        if len(chunk) >= chunk_size:
+            # Bounded: parsing waits while ``concurrency`` blocks are in flight
+            await semaphore.acquire()
+            tasks.append(asyncio.ensure_future(flush(chunk)))
+            chunk = []
+    if chunk:
+        await semaphore.acquire()
+        tasks.append(asyncio.ensure_future(flush(chunk)))
+    await asyncio.gather(*tasks)
+    return report
@@ -0,0 +1,100 @@
+"""
+Paginación por cursor (keyset) sobre columnas ordenadas.
+
+El cursor es un token opaco con el orden del listado y los valores de la
+última fila de la página anterior; la siguiente página se pide con un filtro
+``(a, b) < (x, y)`` que el índice compuesto resuelve sin recorrer las filas
+ya vistas. Un cursor solo vale para el orden con el que se creó.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+DEFAULT_KEYSET = ("created_at", "id")
+
+# Sort columns whose cursor values aren't plain text
+TIMESTAMP_COLUMNS = ("created_at", "updated_at", "expiration_date")
+NUMERIC_COLUMNS = ("amount", "capacity")
+
+
+def _sort_key(columns: Sequence[str], descending: bool) -> str:
+    # Same spelling as the sort parameter: -amount,id
+    return ("-" if descending else "") + ",".join(columns)
+
+
+def encode_cursor(row: Dict[str, Any], columns: Sequence[str] = DEFAULT_KEYSET, descending: bool = True) -> str:
+    raw = json.dumps(
+        {"sort": _sort_key(columns, descending), "values": [row.get(column) for column in columns]},
+        separators=(",", ":"), default=str
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence[str] = DEFAULT_KEYSET, descending: bool = True) -> List[Any]:
+    """Decodificar un cursor; lanza ValueError si no es válido o es de otro orden"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(payload, dict) or payload.get("sort") != _sort_key(columns, descending):
+        raise ValueError("cursor belongs to another sort order")
+    values = payload.get("values")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("invalid cursor")
+    if not all(_valid_value(column, value) for column, value in zip(columns, values)):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def _valid_value(column: str, value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+    if column in NUMERIC_COLUMNS:
+        return isinstance(value, (int, float))
+    if column == "id":
+        return isinstance(value, (int, str))
+    if not isinstance(value, str):
+        return False
+    if column in TIMESTAMP_COLUMNS:
+        try:
+            datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return False
+    return True
+
+
+def _quote(value: Any) -> str:
+    # Backslashes first, or a trailing one would escape the closing quote
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def apply_keyset(query, values: Sequence[Any], columns: Sequence[str] = DEFAULT_KEYSET,
+                 descending: bool = True):
+    """Añadir el filtro de keyset y el orden correspondiente a una consulta PostgREST"""
+    op = "lt" if descending else "gt"
+    terms = []
+    for i, column in enumerate(columns):
+        equal = [f"{prev}.eq.{_quote(values[j])}" for j, prev in enumerate(columns[:i])]
+        strict = f"{column}.{op}.{_quote(values[i])}"
+        terms.append(f"and({','.join(equal + [strict])})" if equal else strict)
+    return query.or_(",".join(terms))
+
+
+def parse_sort(sort: str, allowed: Sequence[str]) -> Tuple[Tuple[str, str], bool]:
+    """``-amount`` -> ((amount, id), descendente); lanza ValueError si no se permite.
+
+    ``id`` desempata filas con el mismo valor para que el cursor sea estable.
+    """
+    column = sort.lstrip("-")
+    if column not in allowed:
+        raise ValueError(f"Orden no permitido: {sort}. Use: {', '.join(allowed)}")
+    return (column, "id"), sort.startswith("-")
+
+
+def order_keyset(query, columns: Sequence[str] = DEFAULT_KEYSET, descending: bool = True):
+    for column in columns:
+        query = query.order(column, desc=descending)
+    return query
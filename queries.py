@@ -0,0 +1,73 @@
+"""
+Proyecciones de columnas por endpoint.
+
+Cada lectura declara las columnas que realmente usa para no transferir
+columnas pesadas (como entry_history) que la respuesta nunca muestra.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+PROJECTIONS: Dict[str, Tuple[str, ...]] = {
+    "auth.admin": ("id", "email", "nombre", "rol", "password_hash"),
+    "users.list": (
+        "id", "card_id", "name", "email", "phone", "membership", "active",
+        "last_access", "created_at", "expiration_date"
+    ),
+    "access.card": ("card_id", "name", "active", "expiration_date"),
+    "users.current": ("card_id", "active"),
+    "aggregates.memberships": ("id", "name", "active", "created_at"),
+    "revenue.payments": ("id", "amount", "payment_method", "status", "created_at"),
+    "attendance.access_events": ("id", "timestamp"),
+    "recent.memberships": ("id", "name", "created_at"),
+    "search.memberships": ("id", "card_id", "name", "email", "phone", "active"),
+    "allowlist.memberships": ("id", "card_id", "active", "expiration_date"),
+    # Rows re-read after another worker changed them
+    "changes.memberships": ("id", "card_id", "name", "email", "phone", "active", "expiration_date"),
+    "expiry.lapsed": ("card_id",),
+    # What the on_member_expired hooks read from each deactivated row
+    "expiry.deactivated": ("id", "card_id", "name", "email", "phone", "active", "expiration_date", "created_at"),
+    "expiry.reminders": ("card_id", "name", "email", "expiration_date"),
+    "expiry.renewal_reminders": ("id", "card_id", "name", "email", "expiration_date", "created_at", "sent_at"),
+    "classes.list": (
+        "id", "name", "instructor", "schedule", "capacity", "booked_count", "waitlist_count",
+        "description", "created_at"
+    ),
+    "bookings.occupancy": ("id", "capacity", "booked_count", "waitlist_count"),
+    "bookings.list": ("id", "class_id", "card_id", "status", "created_at", "updated_at"),
+    "payments.list": ("id", "user_id", "amount", "payment_method", "status", "description", "created_at"),
+    "reports.users": (
+        "id", "card_id", "name", "email", "phone", "membership", "active",
+        "last_access", "created_at", "expiration_date"
+    ),
+    "config.list": ("key", "value", "updated_at"),
+    "revocations.sync": ("kind", "key", "revoked_at", "expires_at"),
+}
+
+
+def columns(name: str, fields: Optional[str] = None, required: Iterable[str] = ()) -> Tuple[str, ...]:
+    """Columnas a pedir para un endpoint.
+
+    ``fields`` es el parámetro opcional ``fields=a,b,c`` de los listados; solo
+    puede restringir la proyección declarada. Lanza ValueError si pide una
+    columna que el endpoint no expone.
+    """
+    allowed = PROJECTIONS[name]
+    if not fields:
+        return allowed
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"Campos no permitidos: {', '.join(unknown)}")
+    selected = [c for c in allowed if c in requested or c in required]
+    return tuple(selected)
+
+
+def projection(name: str, fields: Optional[str] = None, required: Iterable[str] = ()) -> str:
+    """Cadena select de PostgREST para un endpoint"""
+    return ",".join(columns(name, fields, required))
+
+
+def returning(query, name: str):
+    """Limitar a una proyección las filas que devuelve un update o un delete"""
+    # The write builders have no select(); PostgREST reads the same parameter
+    query.params = query.params.add("select", projection(name))
+    return query
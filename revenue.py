@@ -0,0 +1,315 @@
+"""
+Libro de ingresos preagregado por día y por mes.
+
+Cada pago suma sus céntimos (enteros, nunca float) en el día y el mes de su
+``created_at``, por ``payment_method`` y ``status``. Para cada combinación
+(incluidas "todos los métodos" y "todos los estados") se guardan sumas
+acumuladas por día, así el ingreso de cualquier rango de fechas es una resta
+de dos posiciones y no depende del número de pagos ni de días.
+
+Los totales también se guardan en ``revenue_daily`` y ``revenue_monthly``:
+``POST /payments`` los incrementa con la función ``add_revenue`` y
+``rebuild`` lee esas tablas, unas filas por día, en lugar de todos los
+pagos. Sin la función o sin las tablas se recorre ``payments`` entero.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+from aggregates import scan
+from queries import projection
+
+# (payment_method, status); None stands for "any"
+SeriesKey = Tuple[Optional[str], Optional[str]]
+
+
+def to_cents(amount: Any) -> int:
+    """Importe en unidades menores; str() evita arrastrar el error binario del float"""
+    if amount is None:
+        return 0
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> float:
+    return cents / 100
+
+
+def _payment_day(payment: Dict[str, Any]) -> Optional[date]:
+    try:
+        return date.fromisoformat((payment.get("created_at") or "")[:10])
+    except ValueError:
+        return None
+
+
+def _not_installed(error: APIError) -> bool:
+    # PGRST202: no add_revenue; 42P01/PGRST205: no revenue_* tables
+    return error.code in ("PGRST202", "42P01", "PGRST205")
+
+
+def _series_keys(method: Optional[str], status: Optional[str]) -> List[SeriesKey]:
+    return [(method, status), (method, None), (None, status), (None, None)]
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _previous_month(day: date) -> date:
+    return (_month_start(day) - timedelta(days=1)).replace(day=1)
+
+
+class RevenueLedger:
+    """Céntimos por día y mes, con sumas acumuladas para consultas por rango"""
+
+    # Kept across replace(): they describe the tables, not one build
+    _PERSISTENT = ("_lock", "shared", "sync_failures", "last_error", "writes", "discarded_rebuilds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.refreshed_at = 0.0
+        # False once add_revenue or the revenue_* tables turn out missing
+        self.shared = True
+        self.sync_failures = 0
+        self.last_error: Optional[str] = None
+        # Bumped by record(); rebuild compares it before swapping
+        self.writes = 0
+        self.discarded_rebuilds = 0
+        self._reset()
+
+    def _reset(self):
+        self._daily: Dict[SeriesKey, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._monthly: Dict[SeriesKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # series -> cumulative cents from day self._origin through self._origin + i
+        self._prefix: Dict[SeriesKey, List[int]] = {}
+        self._origin: Optional[int] = None
+        self._last = -1
+        self.payments = 0
+
+    def _add(self, payment: Dict[str, Any]) -> Optional[int]:
+        day = _payment_day(payment)
+        if day is None:
+            return None
+        cents = to_cents(payment.get("amount"))
+        ordinal, month = day.toordinal(), day.strftime("%Y-%m")
+        for key in _series_keys(payment.get("payment_method"), payment.get("status")):
+            self._daily[key][ordinal] += cents
+            self._monthly[key][month] += cents
+        self.payments += 1
+        return ordinal
+
+    def _build_prefix(self, through: int):
+        days = [day for series in self._daily.values() for day in series]
+        self._origin = min(days, default=through)
+        self._last = max(through, max(days, default=through))
+        self._prefix = {}
+        for key, series in self._daily.items():
+            running, prefix = 0, []
+            for ordinal in range(self._origin, self._last + 1):
+                running += series.get(ordinal, 0)
+                prefix.append(running)
+            self._prefix[key] = prefix
+
+    def _extend(self, through: int):
+        # New days repeat the last cumulative value
+        for key, prefix in self._prefix.items():
+            prefix.extend([prefix[-1] if prefix else 0] * (through - self._last))
+        self._last = through
+
+    def load(self, payments: Iterable[Dict[str, Any]]):
+        for payment in payments:
+            self._add(payment)
+
+    def load_days(self, rows: Iterable[Dict[str, Any]]):
+        """Sumar filas de revenue_daily"""
+        for row in rows:
+            ordinal = date.fromisoformat(row["day"][:10]).toordinal()
+            for key in _series_keys(row["payment_method"], row["status"]):
+                self._daily[key][ordinal] += row["cents"]
+            self.payments += row["payments"]
+
+    def load_months(self, rows: Iterable[Dict[str, Any]]):
+        """Sumar filas de revenue_monthly"""
+        for row in rows:
+            for key in _series_keys(row["payment_method"], row["status"]):
+                self._monthly[key][row["month"]] += row["cents"]
+
+    def replace(self, fresh: "RevenueLedger", version: Optional[int] = None):
+        """Adoptar un libro construido aparte (rebuild)"""
+        fresh._build_prefix(date.today().toordinal())
+        with self._lock:
+            if self.loaded and version is not None and version != self.writes:
+                # A write landed mid-build and may be missing from it: keep the
+                # current copy, which has it, and retry on the next read
+                self.discarded_rebuilds += 1
+                return
+            for name, value in vars(fresh).items():
+                if name not in self._PERSISTENT:
+                    setattr(self, name, value)
+            self.loaded = True
+            # On a first load that raced a write, load again on the next read
+            self.refreshed_at = time.monotonic() if version in (None, self.writes) else 0.0
+
+    def needs_refresh(self, interval: float) -> bool:
+        return interval > 0 and time.monotonic() - self.refreshed_at >= interval
+
+    def record(self, payment: Dict[str, Any]):
+        with self._lock:
+            self.writes += 1
+            if not self.loaded:
+                return
+            new_keys = [k for k in _series_keys(payment.get("payment_method"), payment.get("status")) if k not in self._prefix]
+            ordinal = self._add(payment)
+            if ordinal is None:
+                return
+            if ordinal < self._origin or new_keys:
+                # Backdated before the first payment or a new method/status
+                self._build_prefix(max(self._last, ordinal))
+                return
+            if ordinal > self._last:
+                self._extend(ordinal)
+            # Payments land on the last day, so this touches one position
+            cents = to_cents(payment.get("amount"))
+            for key in _series_keys(payment.get("payment_method"), payment.get("status")):
+                prefix = self._prefix[key]
+                for i in range(ordinal - self._origin, len(prefix)):
+                    prefix[i] += cents
+
+    # Reads
+    def _cumulative(self, key: SeriesKey, ordinal: int) -> int:
+        prefix = self._prefix.get(key)
+        if not prefix or ordinal < self._origin:
+            return 0
+        return prefix[min(ordinal, self._last) - self._origin]
+
+    def total(self, start: date, end: date, method: Optional[str] = None,
+              status: Optional[str] = None) -> int:
+        """Céntimos entre ``start`` y ``end``, ambos incluidos"""
+        if end < start:
+            return 0
+        with self._lock:
+            key = (method, status)
+            return self._cumulative(key, end.toordinal()) - self._cumulative(key, start.toordinal() - 1)
+
+    def month_total(self, month: str, method: Optional[str] = None, status: Optional[str] = None) -> int:
+        with self._lock:
+            return self._monthly.get((method, status), {}).get(month, 0)
+
+    def breakdown(self, start: date, end: date, status: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Céntimos del rango por método de pago y por estado"""
+        with self._lock:
+            methods = sorted({m for m, s in self._prefix if m is not None})
+            statuses = sorted({s for m, s in self._prefix if s is not None})
+        return {
+            "by_method": {m: self.total(start, end, m, status) for m in methods},
+            "by_status": {s: self.total(start, end, None, s) for s in statuses}
+        }
+
+    def months(self, count: int = 12, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        month, series = _month_start(date.today()), []
+        for _ in range(count):
+            series.append({"month": month.strftime("%Y-%m"), "cents": self.month_total(month.strftime("%Y-%m"), status=status)})
+            month = _previous_month(month)
+        return series[::-1]
+
+    def growth_rate(self, status: Optional[str] = "completed", today: Optional[date] = None) -> float:
+        """Variación porcentual del mes en curso frente al mismo tramo del mes anterior.
+
+        Se compara del día 1 a hoy con del día 1 al mismo día del mes pasado,
+        para que a principio de mes el crecimiento no salga siempre negativo.
+        """
+        today = today or date.today()
+        previous_start = _previous_month(today)
+        # The 31st is compared with the whole of a shorter previous month
+        previous_end = min(previous_start + timedelta(days=today.day - 1), _month_start(today) - timedelta(days=1))
+        current = self.total(_month_start(today), today, status=status)
+        previous = self.total(previous_start, previous_end, status=status)
+        if not previous:
+            return 0.0
+        return round((current - previous) * 100 / previous, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "payments": self.payments,
+            "series": len(self._prefix),
+            "days": self._last - self._origin + 1 if self._origin is not None else 0,
+            "shared": self.shared,
+            "sync_failures": self.sync_failures,
+            "last_error": self.last_error,
+            "discarded_rebuilds": self.discarded_rebuilds
+        }
+
+
+async def persist(db, ledger: RevenueLedger, payment: Dict[str, Any]):
+    """Sumar un pago a revenue_daily y revenue_monthly"""
+    day = _payment_day(payment)
+    if not ledger.shared or day is None:
+        return
+    try:
+        await db.execute(db.rpc("add_revenue", {
+            "p_day": day.isoformat(),
+            "p_payment_method": payment.get("payment_method"),
+            "p_status": payment.get("status"),
+            "p_cents": to_cents(payment.get("amount"))
+        }))
+    except APIError as e:
+        if _not_installed(e):
+            # Rebuilds go back to scanning payments
+            ledger.shared = False
+            return
+        ledger.sync_failures += 1
+        ledger.last_error = e.message or str(e)
+        raise
+    except Exception as e:
+        ledger.sync_failures += 1
+        ledger.last_error = str(e)
+        raise
+
+
+async def _scan_by(db, table: str, key: str, select: str, page_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+    # Keyset on a non-unique column: a page never splits the rows of one key
+    start = None
+    while True:
+        query = db.table(table).select(select).order(key).limit(page_size)
+        if start is not None:
+            query = query.gte(key, start)
+        rows = (await db.execute(query)).data or []
+        if len(rows) < page_size:
+            if rows:
+                yield rows
+            return
+        start = rows[-1][key]
+        page = [row for row in rows if row[key] != start]
+        if not page:
+            # One key fills the whole page
+            page_size *= 2
+            continue
+        yield page
+
+
+async def rebuild(db, ledger: RevenueLedger):
+    """Reconstruir el libro a partir de los totales guardados, o de todos los pagos"""
+    fresh = RevenueLedger()
+    version = ledger.writes
+    if ledger.shared:
+        try:
+            async for page in _scan_by(db, "revenue_daily", "day", "day,payment_method,status,cents,payments"):
+                fresh.load_days(page)
+            async for page in _scan_by(db, "revenue_monthly", "month", "month,payment_method,status,cents"):
+                fresh.load_months(page)
+        except APIError as e:
+            if not _not_installed(e):
+                raise
+            ledger.shared = False
+    if not ledger.shared:
+        fresh = RevenueLedger()
+        async for page in scan(db, "payments", projection("revenue.payments")):
+            fresh.load(page)
+    ledger.replace(fresh, version)
+    return ledger
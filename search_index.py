@@ -0,0 +1,233 @@
+"""
+Índice local de búsqueda de miembros (prefijos + trigramas).
+
+Es el respaldo de la función ``search_members`` de la base de datos (pg_trgm)
+cuando esta no está instalada. Cubre nombre, email, teléfono y card_id y se
+mantiene con los mismos hooks de escritura que la caché de tarjetas.
+
+La búsqueda intersecta primero los miembros cuyas palabras empiezan por cada
+palabra buscada (el caso normal del type-ahead, proporcional al número de
+coincidencias y no al de miembros). Esos resultados se ordenan por calidad:
+antes quien tiene un campo igual a lo buscado, luego las palabras completas y
+después las que solo empiezan igual. Solo si no hay ninguno recurre a los
+trigramas, puntuados como ``word_similarity`` de pg_trgm, que toleran
+errores de tipeo.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from aggregates import scan
+from queries import projection
+
+SEARCH_FIELDS = ("name", "email", "phone", "card_id")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Minúsculas, sin acentos y con cualquier separador convertido en espacio"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"[^0-9a-z]+", " ", stripped).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigramas al estilo pg_trgm: cada palabra con dos espacios delante y uno detrás"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def document_text(member: Dict[str, Any]) -> str:
+    text = " ".join(normalize(member.get(field)) for field in SEARCH_FIELDS)
+    # Phones also match when typed without separators
+    digits = re.sub(r"\D", "", member.get("phone") or "")
+    return f"{text} {digits}" if digits else text
+
+
+def match_rank(query: str, words: List[str], document: tuple) -> tuple:
+    """Clave de orden de una coincidencia por prefijo: menor es mejor"""
+    text, fields = document[0], document[3]
+    tokens = set(text.split())
+    # Words matched whole before words that only start a member's word
+    partial = sum(1 for word in words if word not in tokens)
+    return (0 if query in fields else 1, partial, text)
+
+
+class SearchIndex:
+    """Índices invertidos palabra -> card_id y trigrama -> card_id"""
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.refreshed_at = 0.0
+        # Bumped by upsert() and remove(); rebuild compares it before swapping
+        self.writes = 0
+        self.discarded_rebuilds = 0
+        self._documents: Dict[str, tuple] = {}
+        self._words: Dict[str, Set[str]] = defaultdict(set)
+        self._sorted_words: List[str] = []
+        self._grams: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _add(self, member: Dict[str, Any]):
+        card_id = member.get("card_id")
+        if not card_id:
+            return
+        self._remove(card_id)
+        text = document_text(member)
+        grams = trigrams(text)
+        fields = frozenset(normalize(member.get(field)) for field in SEARCH_FIELDS)
+        self._documents[card_id] = (text, grams, bool(member.get("active")), fields)
+        for word in set(text.split()):
+            # A fresh index sorts its words once in replace()
+            if word not in self._words and self.loaded:
+                bisect.insort(self._sorted_words, word)
+            self._words[word].add(card_id)
+        for gram in grams:
+            self._grams[gram].add(card_id)
+
+    def _remove(self, card_id: str):
+        document = self._documents.pop(card_id, None)
+        if document is None:
+            return
+        text, grams = document[0], document[1]
+        for word in set(text.split()):
+            self._words[word].discard(card_id)
+            if not self._words[word]:
+                del self._words[word]
+                position = bisect.bisect_left(self._sorted_words, word)
+                if position < len(self._sorted_words) and self._sorted_words[position] == word:
+                    del self._sorted_words[position]
+        for gram in grams:
+            self._grams[gram].discard(card_id)
+            if not self._grams[gram]:
+                del self._grams[gram]
+
+    def replace(self, fresh: "SearchIndex", version: Optional[int] = None):
+        """Adoptar un índice construido aparte (rebuild)"""
+        fresh._sorted_words = sorted(fresh._words)
+        with self._lock:
+            if self.loaded and version is not None and version != self.writes:
+                # A write landed mid-build and may be missing from it: keep the
+                # current copy, which has it, and retry on the next read
+                self.discarded_rebuilds += 1
+                return
+            self._documents = fresh._documents
+            self._words = fresh._words
+            self._sorted_words = fresh._sorted_words
+            self._grams = fresh._grams
+            self.loaded = True
+            # On a first load that raced a write, load again on the next read
+            self.refreshed_at = time.monotonic() if version in (None, self.writes) else 0.0
+
+    def needs_refresh(self, interval: float) -> bool:
+        return interval > 0 and time.monotonic() - self.refreshed_at >= interval
+
+    # Write-path hooks
+    def upsert(self, member: Dict[str, Any]):
+        with self._lock:
+            self.writes += 1
+            if self.loaded:
+                self._add(member)
+
+    def remove(self, card_id: str):
+        with self._lock:
+            self.writes += 1
+            if self.loaded:
+                self._remove(card_id)
+
+    # Reads
+    def _expand(self, prefix: str) -> Set[str]:
+        found = set()
+        position = bisect.bisect_left(self._sorted_words, prefix)
+        while position < len(self._sorted_words) and self._sorted_words[position].startswith(prefix):
+            found |= self._words[self._sorted_words[position]]
+            position += 1
+        return found
+
+    def _prefix_matches(self, words: List[str]) -> Set[str]:
+        words = sorted(words, key=len, reverse=True)
+        matches = self._expand(words[0])
+        for word in words[1:]:
+            if not matches:
+                break
+            if len(word) > 1:
+                matches &= self._expand(word)
+            else:
+                # A single letter expands to a large part of the vocabulary;
+                # checking the remaining candidates is cheaper
+                matches = {
+                    card_id for card_id in matches
+                    if f" {word}" in f" {self._documents[card_id][0]}"
+                }
+        return matches
+
+    def _trigram_matches(self, query: str) -> List[tuple]:
+        # Trigrams shared by most members (a common email domain) don't tell
+        # members apart and would turn the lookup into a full scan
+        common = len(self._documents) // 2
+        grams = {gram for gram in trigrams(query) if len(self._grams.get(gram, ())) <= common} or trigrams(query)
+        # A match needs at least ``required`` of the query trigrams, so it must
+        # contain one of the rarest len(grams) - required + 1 of them: only
+        # those posting lists are read, common trigrams are just verified.
+        required = max(1, math.ceil(self.threshold * len(grams)))
+        postings = sorted((self._grams.get(gram, ()) for gram in grams), key=len)
+        candidates = set().union(*postings[:len(grams) - required + 1])
+        scored = []
+        for card_id in candidates:
+            shared = len(grams & self._documents[card_id][1])
+            if shared >= required:
+                scored.append((-shared / len(grams), card_id))
+        return scored
+
+    def search(self, term: str, active: Optional[bool] = None, limit: int = 200) -> List[str]:
+        """card_id de los miembros que coinciden, del más al menos parecido"""
+        query = normalize(term)
+        if not query:
+            return []
+        with self._lock:
+            documents = self._documents
+
+            def allowed(card_id):
+                return active is None or documents[card_id][2] == active
+
+            words = query.split()
+            prefixed = [card_id for card_id in self._prefix_matches(words) if allowed(card_id)]
+            if prefixed:
+                return sorted(prefixed, key=lambda card_id: match_rank(query, words, documents[card_id]))[:limit]
+            similar = sorted(
+                (score, card_id) for score, card_id in self._trigram_matches(query) if allowed(card_id)
+            )
+        return [card_id for _, card_id in similar[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "members": len(self._documents),
+            "words": len(self._words),
+            "trigrams": len(self._grams),
+            "discarded_rebuilds": self.discarded_rebuilds
+        }
+
+
+async def rebuild(db, index: SearchIndex):
+    """Reconstruir el índice a partir de memberships"""
+    fresh = SearchIndex(index.threshold)
+    version = index.writes
+    async for page in scan(db, "memberships", projection("search.memberships")):
+        for member in page:
+            fresh._add(member)
+    index.replace(fresh, version)
+    return index
@@ -2,12 +2,14 @@
 Script para configurar la base de datos de Supabase con las tablas necesarias
 """
 from supabase import create_client, Client
-from passlib.context import CryptContext
+from hashing import make_context
 import os
 from dotenv import load_dotenv
 import json
 from datetime import datetime, timedelta
 
+from access_log import migrate_entry_history
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -19,7 +21,7 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Configuración de hash de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = make_context()
 
 def create_admin_user():
     """Crear usuario administrador por defecto"""
@@ -199,9 +201,20 @@ def create_sample_data():
     except Exception as e:
         print(f"❌ Error al crear datos de ejemplo: {e}")
 
+def migrate_access_history():
+    """Migrar los arreglos entry_history a la tabla access_events"""
+    try:
+        result = migrate_entry_history(supabase)
+        if result["members"]:
+            print(f"✅ {result['events']} accesos migrados de {result['members']} miembros")
+        else:
+            print("ℹ️ No hay historial de accesos pendiente de migrar")
+    except Exception as e:
+        print(f"❌ Error al migrar historial de accesos: {e}")
+
 def verify_tables():
     """Verificar que todas las tablas necesarias existen"""
-    tables_to_check = ["administradores", "memberships", "classes", "payments", "config"]
+    tables_to_check = ["administradores", "memberships", "classes", "payments", "config", "access_events"]
     
     print("🔍 Verificando tablas en Supabase...")
     
@@ -237,6 +250,10 @@ def main():
     print("\n📊 Creando datos de ejemplo...")
     create_sample_data()
     
+    # Migrar historial de accesos
+    print("\n🚪 Migrando historial de accesos...")
+    migrate_access_history()
+    
     print("\n" + "=" * 50)
     print("🎉 ¡Configuración completada!")
     print("\n📋 Información de acceso:")
@@ -0,0 +1,281 @@
+"""
+Métricas de peticiones y de llamadas a Supabase en formato de texto de
+Prometheus.
+
+``RequestMetricsMiddleware`` mide cada petición HTTP por ruta (la plantilla,
+como ``/users/{card_id}``, para no crear una serie por valor), con su código
+de estado y las peticiones en curso. ``DatabaseMetrics`` se engancha al
+cliente httpx de ``Database`` y mide cada viaje a PostgREST por tabla o
+función: duración, código y bytes de la respuesta. Las llamadas de la
+petición en curso se acumulan para que el registro de peticiones lentas
+muestre en qué se fue el tiempo.
+
+No depende de ``prometheus_client``: las series se guardan en diccionarios y
+se serializan en ``Registry.render``.
+"""
+import bisect
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+logger = logging.getLogger("gym.telemetry")
+
+# Supabase calls made while serving the current request
+_request_calls: contextvars.ContextVar[Optional[List[Tuple[str, str, int, float, int]]]] = \
+    contextvars.ContextVar("request_calls", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Métricas propias más los contadores que ya exponen otros módulos"""
+
+    def __init__(self, prefix: str = "gym"):
+        self.prefix = prefix
+        self._metrics: List[Metric] = []
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.add(Counter(f"{self.prefix}_{name}", help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.add(Gauge(f"{self.prefix}_{name}", help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.add(Histogram(f"{self.prefix}_{name}", help, labels, buckets))
+
+    def collect(self, component: str, stats: Callable[[], Dict[str, Any]]):
+        """Publicar como gauges los valores numéricos de un ``stats()`` existente"""
+        self._collectors[component] = stats
+
+    def _collected(self) -> List[str]:
+        lines = []
+        for component, stats in sorted(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception:
+                logger.exception("No se pudieron leer las estadísticas de %s", component)
+                continue
+            for key, value in sorted(values.items()):
+                # bool is an int; strings, lists and nested dicts are skipped
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}_{component}_{key}"
+                lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        lines += self._collected()
+        return "\n".join(lines) + "\n"
+
+
+class DatabaseMetrics:
+    """Ganchos httpx para las llamadas a PostgREST"""
+
+    def __init__(self, registry: Registry):
+        self.duration = registry.histogram(
+            "db_request_duration_seconds", "Duración de las llamadas a Supabase", ("table", "method")
+        )
+        self.response_bytes = registry.histogram(
+            "db_response_bytes", "Tamaño de las respuestas de Supabase", ("table", "method"), SIZE_BUCKETS
+        )
+        self.requests = registry.counter(
+            "db_requests_total", "Llamadas a Supabase por código de estado", ("table", "method", "status")
+        )
+        self.errors = registry.counter(
+            "db_errors_total", "Llamadas a Supabase sin respuesta (timeout o red)", ("table", "kind")
+        )
+
+    @staticmethod
+    def table(path: str) -> str:
+        # /rest/v1/memberships -> memberships, /rest/v1/rpc/book_class -> rpc/book_class
+        marker = "/rest/v1/"
+        return path.split(marker, 1)[1] if marker in path else path.strip("/")
+
+    async def on_request(self, request):
+        request.extensions["telemetry_started"] = time.perf_counter()
+
+    async def on_response(self, response):
+        # Reading here is free: PostgREST parses the same buffered body
+        await response.aread()
+        request = response.request
+        started = request.extensions.get("telemetry_started", time.perf_counter())
+        elapsed = time.perf_counter() - started
+        table, size = self.table(request.url.path), len(response.content)
+        self.duration.observe(elapsed, table, request.method)
+        self.response_bytes.observe(size, table, request.method)
+        self.requests.inc(table, request.method, str(response.status_code))
+        calls = _request_calls.get()
+        if calls is not None:
+            calls.append((table, request.method, response.status_code, elapsed, size))
+
+    def on_error(self, path: str, error: BaseException):
+        self.errors.inc(self.table(path), type(error).__name__)
+
+    def event_hooks(self) -> Dict[str, List[Callable]]:
+        return {"request": [self.on_request], "response": [self.on_response]}
+
+
+class HTTPMetrics:
+    """Series de las peticiones HTTP que alimenta ``RequestMetricsMiddleware``"""
+
+    def __init__(self, registry: Registry):
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "Duración de las peticiones HTTP", ("method", "route")
+        )
+        self.requests = registry.counter(
+            "http_requests_total", "Peticiones HTTP por código de estado", ("method", "route", "status")
+        )
+        self.in_flight = registry.gauge("http_requests_in_flight", "Peticiones HTTP en curso")
+
+
+class RequestMetricsMiddleware:
+    """Middleware ASGI: latencia por ruta, códigos de estado y peticiones en curso"""
+
+    def __init__(self, app, metrics: HTTPMetrics, slow_seconds: float = 0.0, slow_sample_rate: float = 1.0):
+        self.app = app
+        self.metrics = metrics
+        self.slow_seconds = slow_seconds
+        self.slow_sample_rate = slow_sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        calls: List[Tuple[str, str, int, float, int]] = []
+        token = _request_calls.set(calls)
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.metrics.in_flight.inc()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.in_flight.dec()
+            _request_calls.reset(token)
+            # Route templates keep one series per endpoint; unmatched paths share one
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.metrics.duration.observe(elapsed, scope["method"], route)
+            self.metrics.requests.inc(scope["method"], route, str(status))
+            if self.slow_seconds and elapsed >= self.slow_seconds and random.random() < self.slow_sample_rate:
+                self.log_slow(scope, route, status, elapsed, calls)
+
+    @staticmethod
+    def log_slow(scope, route: str, status: int, elapsed: float, calls):
+        db_seconds = sum(call[3] for call in calls)
+        breakdown = ", ".join(
+            f"{method} {table} {code} {seconds * 1000:.0f}ms {size}B" for table, method, code, seconds, size in calls
+        )
+        logger.warning(
+            "Petición lenta %s %s (%s) -> %s en %.0f ms: %d llamadas a Supabase que suman %.0f ms "
+            "(las paralelas se solapan), %.0f ms fuera de ellas [%s]",
+            scope["method"], scope["path"], route, status, elapsed * 1000, len(calls), db_seconds * 1000,
+            max(elapsed - db_seconds, 0) * 1000, breakdown
+        )
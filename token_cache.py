@@ -0,0 +1,217 @@
+"""
+Caché de claims JWT ya verificados y lista de revocación.
+
+Las entradas se indexan por el SHA-256 del token (nunca el token en claro)
+y expiran en el ``exp`` del propio token. La revocación por token (logout)
+y por usuario (cambio de rol) se comprueba en cada petición, esté o no el
+token en caché.
+
+Las revocaciones se guardan en la tabla ``token_revocations`` para que las
+vean los demás workers y sobrevivan a un reinicio: cada worker relee las
+filas vigentes al arrancar y cada pocos segundos después (son pocas: un
+logout vive lo que el token, una revocación por usuario lo que el token más
+largo).
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from cache import LRUCache
+from queries import projection
+
+REVOCATIONS_TABLE = "token_revocations"
+
+
+class TokenCache:
+    """Claims verificados por digest de token; ``maxsize=0`` desactiva la caché"""
+
+    def __init__(self, maxsize: int = 10000, token_lifetime: float = 3600):
+        self.enabled = maxsize > 0
+        self.token_lifetime = token_lifetime
+        self._claims = LRUCache(maxsize=max(maxsize, 1), ttl=0)
+        self._lock = threading.Lock()
+        # token digest -> exp, pruned once the token would have expired anyway
+        self._revoked_tokens: Dict[str, float] = {}
+        # subject -> epoch second; tokens issued at or before it are rejected
+        self._revoked_subjects: Dict[str, int] = {}
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        return self._claims.get(digest)
+
+    def put(self, digest: str, claims: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        ttl = float(claims.get("exp", 0)) - time.time()
+        if ttl > 0:
+            self._claims.set(digest, claims, ttl=ttl)
+
+    def is_revoked(self, digest: str, claims: Dict[str, Any]) -> bool:
+        with self._lock:
+            if digest in self._revoked_tokens:
+                return True
+            revoked_at = self._revoked_subjects.get(claims.get("sub"))
+        return revoked_at is not None and int(claims.get("iat", 0)) <= revoked_at
+
+    def token_revocation(self, digest: str, exp: float) -> Dict[str, Any]:
+        """Fila de token_revocations para un logout"""
+        return {"kind": "token", "key": digest, "revoked_at": int(time.time()), "expires_at": int(exp)}
+
+    def subject_revocation(self, subject: str) -> Dict[str, Any]:
+        """Fila de token_revocations que invalida lo emitido hasta ahora para un usuario"""
+        now = int(time.time())
+        # Older revocations can't match any token that is still valid
+        return {"kind": "subject", "key": subject, "revoked_at": now, "expires_at": now + int(self.token_lifetime)}
+
+    def apply(self, rows: Iterable[Dict[str, Any]]) -> List[str]:
+        """Aplicar revocaciones; devuelve los usuarios con una revocación nueva"""
+        now = time.time()
+        subjects, digests = [], []
+        with self._lock:
+            for key in [k for k, e in self._revoked_tokens.items() if e <= now]:
+                del self._revoked_tokens[key]
+            cutoff = now - self.token_lifetime
+            for key in [k for k, at in self._revoked_subjects.items() if at < cutoff]:
+                del self._revoked_subjects[key]
+            for row in rows:
+                if row["kind"] == "token":
+                    if row["key"] not in self._revoked_tokens and row["expires_at"] > now:
+                        self._revoked_tokens[row["key"]] = row["expires_at"]
+                        digests.append(row["key"])
+                elif row["revoked_at"] > self._revoked_subjects.get(row["key"], -1):
+                    self._revoked_subjects[row["key"]] = row["revoked_at"]
+                    subjects.append(row["key"])
+        for digest in digests:
+            self._claims.invalidate(digest)
+        return subjects
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._claims.stats()
+        stats.update({
+            "enabled": self.enabled,
+            "revoked_tokens": len(self._revoked_tokens),
+            "revoked_subjects": len(self._revoked_subjects)
+        })
+        return stats
+
+
+def _missing_table(error: APIError) -> bool:
+    # 42P01 from Postgres, PGRST205 from PostgREST's schema cache
+    return error.code in ("42P01", "PGRST205")
+
+
+class RevocationSync:
+    """Lectura periódica de token_revocations y sus contadores"""
+
+    def __init__(self, interval: float = 2):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        # False once the table turned out not to exist: revocations stay per process
+        self.available = True
+        self.loaded = False
+        self.published = 0
+        self.syncs = 0
+        self.received = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_sync_seconds = 0.0
+
+    def _disable(self, error: APIError):
+        self.available = False
+        self.last_error = error.message or str(error)
+
+    async def publish(self, db, row: Dict[str, Any]) -> None:
+        """Guardar una revocación; falla si no se pudo escribir"""
+        if not self.available:
+            return
+        try:
+            await db.execute(db.table(REVOCATIONS_TABLE).insert(row, returning=ReturnMethod.minimal))
+        except APIError as e:
+            if not _missing_table(e):
+                raise
+            self._disable(e)
+            return
+        self.published += 1
+        # Writes are rare, so they also clear out what no token can match anymore
+        await db.execute(
+            db.table(REVOCATIONS_TABLE)
+            .delete(returning=ReturnMethod.minimal)
+            .lt("expires_at", int(time.time()))
+        )
+
+    async def sync(self, db, cache: TokenCache) -> List[str]:
+        """Aplicar las revocaciones vigentes; devuelve los usuarios revocados desde la última lectura"""
+        if not self.available:
+            return []
+        started = time.monotonic()
+        try:
+            response = await db.execute(
+                db.table(REVOCATIONS_TABLE)
+                .select(projection("revocations.sync"))
+                .gt("expires_at", int(time.time()))
+            )
+        except APIError as e:
+            if not _missing_table(e):
+                self.failures += 1
+                self.last_error = e.message or str(e)
+                raise
+            self._disable(e)
+            return []
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        rows = response.data or []
+        subjects = cache.apply(rows)
+        self.loaded = True
+        self.syncs += 1
+        self.received += len(rows)
+        self.last_sync_seconds = time.monotonic() - started
+        return subjects
+
+    async def run(self, job: Callable[[], Awaitable]):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Counted in stats(); the next pass retries
+                pass
+
+    def start(self, job: Callable[[], Awaitable]):
+        if self.interval > 0:
+            self._task = asyncio.ensure_future(self.run(job))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shared": self.available,
+            "loaded": self.loaded,
+            "interval_seconds": self.interval,
+            "published": self.published,
+            "syncs": self.syncs,
+            "received": self.received,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_sync_seconds": round(self.last_sync_seconds, 3)
+        }